@@ -20,6 +20,7 @@ setup(
     entry_points={
         'console_scripts': [
             'employ_ease=src.scripts.Main:main',
+            'employ_ease_server=src.scripts.server:main',
         ],
     },
     
@@ -19,17 +19,30 @@ Author: Courtney Palmer
 
 #region Imports
 import os
+import sys
+import threading
 from time import time
 import shutil
 from rich import print
 from rich.panel import Panel
 from rich.table import Table
 from src.scripts.single_source_of_truth import single_source_of_truth
-from src.scripts.conversation import send_prompt, prime_chatgpt, prime_information, themed_print
+from src.scripts.conversation import send_prompt, prime_chatgpt, prime_information, prime_documents, themed_print, wait_for_priming, info_types_for_prompts, save_session
+from src.scripts.memory import find_last_session, get_session_summary, timestamp_to_datetime
 from src.scripts.file_handler import load_ini
+from src.scripts.prefetch import start_prefetch, take_prefetched_answer, cancel_prefetch
+from src.scripts.keyword_analysis import analyze_keywords
+from src.scripts.job_corpus import index_job_postings, rank_job_postings
+from src.scripts.resilience import ServiceUnavailable
+from src.scripts.profiler import profiling_requested, start_profiling, stop_profiling, read_user_input
+from src.scripts.prompt_catalog import load_prompt_catalog
 #endregion
 
 ssot = single_source_of_truth()
+# The number of job postings shown when ranking a folder of postings
+JOB_POSTING_RESULTS = 20
+# The number of prompts shown when searching the prompt catalog
+PROMPT_SEARCH_RESULTS = 10
 
 #region Definitions
 def display_intro():
@@ -55,6 +68,14 @@ To start, select an option below.
     '''
     )
 
+def format_menu_options(options):
+    ''' Formats a dictionary of options as one ' key - option' line per option
+    
+    options: The dictionary of {key: option} to format
+    returns: The formatted options
+    '''
+    return '\n'.join(f" {key} - {option}" for key, option in options.items())
+
 def print_menu_options(title, prompt_dict, terminal_size):
     ''' Prints the set of options for the user to choose from
     
@@ -69,19 +90,17 @@ def print_menu_options(title, prompt_dict, terminal_size):
             index = str(index + 1)
             menu_options[index] = catagory
         menu_options["G"] = "General Questions"
+        menu_options["K"] = "Keyword Analysis"
+        menu_options["P"] = "Rank Job Postings"
+        menu_options["S"] = "Search Prompts"
         menu_options["U"] = "Update Application Info"
         menu_options["Q"] = "Exit"
-        menu_as_string = str(menu_options).replace("'", "").replace(':', ' -').replace(',', '\n').replace('{', ' ').replace('}', '')
-        panel = Panel(menu_as_string, title=title, expand=False)
+        panel = Panel(format_menu_options(menu_options), title=title, expand=False)
         themed_print(panel)
     else:
-        catagory_options = {}
-        for key in prompt_dict:
-            question = prompt_dict[key].replace('"', '')
-            catagory_options[key] = f'{question},'
+        catagory_options = {key: prompt_dict[key].replace('"', '') for key in prompt_dict}
         catagory_options["Q"] = "Return to Main Menu"
-        catagory_as_string = str(catagory_options).replace("'", "").replace(':', ' -').replace('{', ' ').replace('}', '').replace(',,', '\n')
-        panel = Panel(catagory_as_string, title=title, expand=False)
+        panel = Panel(format_menu_options(catagory_options), title=title, expand=False)
         themed_print(panel)
 
 def update_application_info(terminal_size, session_timestamp):
@@ -103,23 +122,27 @@ def update_application_info(terminal_size, session_timestamp):
     while user_setting_choice != 'q':
         print_menu_options("Update Application Info", update_options, terminal_size)
 
-        user_setting_choice = input('\nUSER: ')
+        user_setting_choice = read_user_input('\nUSER: ')
         match user_setting_choice:
             case '1':
+                wait_for_priming(["job"])
                 prime_information(session_timestamp, "job")
                 ssot.update_truth()
             case '2':
+                wait_for_priming(["company"])
                 prime_information(session_timestamp, "company")
                 ssot.update_truth()
             case '3':
+                wait_for_priming(["resume"])
                 prime_information(session_timestamp, "resume")
                 ssot.update_truth()
             case '4':
-                prime_information(session_timestamp, "job")
-                prime_information(session_timestamp, "company")
-                prime_information(session_timestamp, "resume")
+                wait_for_priming()
+                prime_documents(session_timestamp, ["job", "company", "resume"])
                 ssot.update_truth()
             case '5':
+                wait_for_priming()
+                ssot.update_truth()
                 display_contents_in_memory(ssot)
             case 'q':
                 break
@@ -134,12 +157,132 @@ def general_questions(session_timestamp):
     user_input = ""
     themed_print("Ask me anything! Type 'q' to quit.\n")
     while True:
-        user_input = input('USER: ')
+        user_input = read_user_input('USER: ')
         if user_input.lower() == 'q':
             break
         send_prompt(user_input, session_timestamp)
         themed_print("Done chatting? Type 'q' to quit.\n")
         
+def resume_last_session():
+    ''' Returns the timestamp of the last session, so that its conversation can be continued, and tells the user what it was about.
+    
+    returns: the timestamp of the last session, or None if there is no session to resume
+    '''
+    session_timestamp = find_last_session()
+    if session_timestamp is None:
+        themed_print("There is no previous session to resume. Starting a new session.", "Info")
+        return None
+    themed_print(f"Resuming the session from {timestamp_to_datetime(session_timestamp)}.", "Success")
+    summary = get_session_summary(f"Session_{session_timestamp}")
+    if summary is not None and summary['rolling_summary'] != "":
+        themed_print(f"Last time, we talked about:\n{summary['rolling_summary']}", "Info")
+    return session_timestamp
+
+def display_keyword_analysis(ssot):
+    ''' Displays the keywords of the job description that the resume matches and misses. The analysis is done locally, without ChatGPT.
+    
+    ssot: The single_source_of_truth class object
+    '''
+    if ssot.job_description == "" or ssot.resume == "":
+        themed_print("Please provide a job description and a resume first (U - Update Application Info).", "Warning")
+        return
+    analysis = analyze_keywords(ssot.job_description, ssot.resume)
+    table = Table(show_header=True, header_style="bold white")
+
+    table.add_column("Keyword", style="bold", width=30)
+    table.add_column("In Resume", style="bold")
+    table.add_column("Weight", style="bold")
+
+    keywords = [(keyword, weight, "Yes") for keyword, weight in analysis['matched']] + [(keyword, weight, "No") for keyword, weight in analysis['missing']]
+    for keyword, weight, in_resume in sorted(keywords, key=lambda k: -k[1]):
+        table.add_row(keyword, in_resume, f"{weight:.2f}")
+
+    panel = Panel(table, title=f"Keyword Analysis - {analysis['coverage']:.0%} matched", expand=False)
+    print(panel)
+
+def rank_saved_job_postings(session_timestamp):
+    ''' Ranks a folder of saved job postings against the user's resume, and lets the user pick one as their job description
+    
+    session_timestamp: The time stamp of the session
+    '''
+    wait_for_priming(["resume"])
+    ssot.update_truth()
+    if ssot.resume == "":
+        themed_print("Please provide a resume first (U - Update Application Info).", "Warning")
+        return
+    default_directory = load_ini(os.getcwd(), "config.ini").get("Settings", "job_postings_path", fallback="").strip()
+    directory = read_user_input(f"\nFolder of job postings{f' ({default_directory})' if default_directory != '' else ''}: ").strip() or default_directory
+    if not os.path.isdir(directory):
+        themed_print(f"'{directory}' is not a folder.", "Error")
+        return
+
+    try:
+        counts = index_job_postings(directory, lambda message: themed_print(message, "Info"))
+        themed_print(f"Indexed job postings: {counts['added']} new, {counts['updated']} changed, {counts['unchanged']} unchanged, {counts['removed']} removed, {counts['failed']} could not be read.", "Success")
+        ranked = rank_job_postings(ssot.resume, directory, JOB_POSTING_RESULTS)
+    except ServiceUnavailable as e:
+        themed_print(f"Could not rank the job postings: {e}", "Error")
+        return
+    if ranked == []:
+        themed_print("No job postings were found in that folder.", "Warning")
+        return
+
+    table = Table(show_header=True, header_style="bold white")
+    table.add_column("#", style="bold")
+    table.add_column("Job", style="bold", width=30)
+    table.add_column("File", style="bold")
+    table.add_column("Match", style="bold")
+    for index, posting in enumerate(ranked):
+        table.add_row(str(index + 1), posting['job_name'], os.path.relpath(posting['filepath'], directory), f"{posting['score']:.3f}")
+    panel = Panel(table, title="Job Postings Ranked Against Your Resume", expand=False)
+    print(panel)
+
+    user_choice = read_user_input("\nEnter a number to use that posting as your job description, or 'q' to return to the menu: ")
+    if user_choice.isdigit() and 0 < int(user_choice) <= len(ranked):
+        wait_for_priming(["job"])
+        prime_information(session_timestamp, "job", ranked[int(user_choice) - 1]['filepath'])
+        ssot.update_truth()
+
+def search_prompts(catalog, session_timestamp):
+    ''' Lets the user search every prompt of the prompt catalog by a few words, and ask one of the prompts that were found
+    
+    catalog: The prompt_catalog to search
+    session_timestamp: The time stamp of the session
+    '''
+    while True:
+        query = read_user_input("\nSearch prompts (or 'q' to return to the menu): ").strip()
+        if query.lower() == 'q':
+            break
+        results = catalog.search(query, PROMPT_SEARCH_RESULTS)
+        if results == []:
+            themed_print(f"No prompts match '{query}'.", "Warning")
+            continue
+        result_options = {str(index + 1): f"[{catagory}] {prompt}".replace('"', '') for index, (catagory, _, prompt) in enumerate(results)}
+        themed_print(Panel(format_menu_options(result_options), title=" SEARCH RESULTS ", expand=False))
+        user_choice = read_user_input("\nEnter a number to ask that prompt, or press Enter to search again: ").strip()
+        if not user_choice.isdigit() or not 1 <= int(user_choice) <= len(results):
+            continue
+        template = results[int(user_choice) - 1][2]
+        # Wait for any background priming that the placeholders of the prompt depend on
+        pending_info_types = info_types_for_prompts([template])
+        if pending_info_types:
+            wait_for_priming(pending_info_types)
+        ssot.update_truth()
+        ask_prompt_template(template, session_timestamp)
+
+def ask_prompt_template(template, session_timestamp):
+    ''' Fills in the placeholders of a prompt from the prompt catalog, and sends it. A prompt that uses the keyword analysis is not sent
+    until a job description and a resume have been provided.
+    
+    template: The prompt, with its placeholders
+    session_timestamp: The time stamp of the session
+    '''
+    if ssot.missing_keyword_analysis(template):
+        themed_print("This prompt uses the keyword analysis. Please provide a job description and a resume first (U - Update Application Info).", "Warning")
+        return
+    question = ssot.fill_placeholders(template)
+    send_prompt(question, session_timestamp, prefetched=take_prefetched_answer(question, session_timestamp))
+
 def display_contents_in_memory(ssot):
     ''' Displays the contents of the single_source_of_truth class object
     
@@ -172,28 +315,65 @@ def main():
     '''
     session_timestamp = time()
     display_intro()
-    # Provide ChatGPT with the job description, company description, and resume so that this information is available in memory for all conversations
+    # Continue the last session if asked to with 'employ_ease --resume' or the 'resume_last_session' setting
     config_object = load_ini(os.getcwd(), "config.ini")
+    if "--resume" in sys.argv[1:] or config_object.getint("Settings", "resume_last_session", fallback=0) == 1:
+        session_timestamp = resume_last_session() or session_timestamp
+    # Profile every turn with 'employ_ease --profile', e.g. to attach the reports to a bug report
+    if profiling_requested():
+        themed_print(f"Profiling is on. The reports are saved to {start_profiling(session_timestamp)}", "Info")
+    try:
+        run_menu(session_timestamp, config_object)
+    finally:
+        # The report of the last turn is saved even if Employ Ease is closed with Ctrl+C or stops on an error
+        stop_profiling()
+
+def run_menu(session_timestamp, config_object):
+    ''' Loads the user's documents and prompts, and runs the Menu until the user quits
+    
+    session_timestamp: The time stamp of the session
+    config_object: The settings of config.ini
+    '''
+    # Provide ChatGPT with the job description, company description, and resume so that this information is available in memory for all conversations
+    # Files listed in config.ini are primed in the background; the menu is usable while they load
     load_on_launch = config_object.get("Settings", "load_on_launch")
     if int(load_on_launch) == 1:
         prime_chatgpt(session_timestamp, config_object)
 
-    # Catagories and prompte are dynamically generated from the prompts.ini file. Read prompts.ini and store the contents in a dictionary
-    config_object = load_ini(f"{os.getcwd()}\\src\\internal", "prompts.ini")
-    prompt_dict={s:dict(config_object.items(s)) for s in config_object.sections()}
+    # Catagories and prompts are dynamically generated from prompts.ini and the prompt library. Only prompt files that changed since the last launch are parsed.
+    catalog = load_prompt_catalog()
+    prompt_dict = catalog.categories
+    for warning in catalog.warnings:
+        themed_print(warning, "Warning")
+    # The search index is built in the background, so the menu is shown right away
+    threading.Thread(target=catalog.build_search_index, name="prompt_index", daemon=True).start()
 
     terminal_size = shutil.get_terminal_size().columns
     # Provide the user with a list of Menu catagories to choose from
     while True:
         print_menu_options("MENU", prompt_dict, terminal_size)
-        user_catagory_choice = input('\nUSER: ')
+        user_catagory_choice = read_user_input('\nUSER: ')
         match user_catagory_choice:
             # Check if the user selected 'q' to quit
             case 'q':
+                wait_for_priming()
+                # Save a snapshot of the session's memories, so that it can be resumed quickly
+                save_session(session_timestamp)
                 break
             case 'g':
                 general_questions(session_timestamp)
                 continue
+            case 'p':
+                rank_saved_job_postings(session_timestamp)
+                continue
+            case 's':
+                search_prompts(catalog, session_timestamp)
+                continue
+            case 'k':
+                wait_for_priming(["job", "resume"])
+                ssot.update_truth()
+                display_keyword_analysis(ssot)
+                continue
             # Check if the user selected 'u' to go to update app info
             case 'u':
                 update_application_info(terminal_size, session_timestamp)
@@ -211,29 +391,31 @@ def main():
 
         # Provide the user with a list of questions from their chosen catagory to choose from
         while True:
+            # The templates in prompt_dict keep their placeholders. Only the question the user picks, and any prefetched ones, are filled in.
             questions_in_catagory = prompt_dict[catagory_name]
-            for key in questions_in_catagory:
-                question = questions_in_catagory[key]
-                # Look for '<' '>' in the prompt. If they exist, replace them with their corresponding values.
-                if '<' in question and '>' in question:
-                    questions_in_catagory[key] = questions_in_catagory[key].replace('<job_name>', ssot.job_name)
-                    questions_in_catagory[key] = questions_in_catagory[key].replace('<job_description>', ssot.job_description)
-                    questions_in_catagory[key] = questions_in_catagory[key].replace('<company_name>', ssot.company_name)
-                    questions_in_catagory[key] = questions_in_catagory[key].replace('<company_description>', ssot.company_description)
-                    questions_in_catagory[key] = questions_in_catagory[key].replace('<resume>', ssot.resume)
-                    questions_in_catagory[key] = questions_in_catagory[key].replace('<company_website>', ssot.company_website)
-            print_menu_options(catagory_name, questions_in_catagory, terminal_size)
-            user_question_choice = input('\nUSER: ')
+            # Wait for any background priming that the placeholders in this catagory depend on
+            pending_info_types = info_types_for_prompts(questions_in_catagory.values())
+            if pending_info_types:
+                wait_for_priming(pending_info_types)
+                ssot.update_truth()
+            # The menu names the documents and the keyword analysis of a prompt instead of showing them in full
+            labels = {key: ssot.describe_placeholders(template) for key, template in questions_in_catagory.items()}
+            print_menu_options(catagory_name, labels, terminal_size)
+            # If speculative prefetching is turned on, start answering the likeliest questions while the user decides
+            start_prefetch({key: template for key, template in questions_in_catagory.items() if not ssot.missing_keyword_analysis(template)},
+                           ssot.fill_placeholders, session_timestamp)
+            user_question_choice = read_user_input('\nUSER: ')
             # Check if the user selected 'q' to return to the main menu
             if user_question_choice.lower() == 'q':
+                cancel_prefetch()
                 break
             # Check if user entered a number and if that number is a valid question
             if user_question_choice.isdigit() is True and (int(user_question_choice)-1) in questions_in_catagory.keys():
                 user_question_choice = int(user_question_choice) - 1 # Adjust input for 0 indexing
-                send_prompt(questions_in_catagory[user_question_choice], session_timestamp)
+                ask_prompt_template(questions_in_catagory[user_question_choice], session_timestamp)
             # Check if the user entered something other than a number and if that input is a valid question
             elif user_question_choice in questions_in_catagory.keys():
-                send_prompt(questions_in_catagory[user_question_choice], session_timestamp)
+                ask_prompt_template(questions_in_catagory[user_question_choice], session_timestamp)
             # Otherwise, the user entered an invalid command
             else:
                 themed_print(f"Command '{user_question_choice}' not recognized.", "Error")
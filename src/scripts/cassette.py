@@ -0,0 +1,149 @@
+'''
+Cassette Module for Employ Ease
+
+This module records the requests Employ Ease sends to the OpenAI API, together with their responses, into a cassette file,
+and can later replay those responses instead of calling the API. Replaying a recorded session removes the network from the measurement,
+so the local cost of a turn (file I/O, retrieval, prompt assembly, and rendering) can be compared precisely between changes.
+
+Key Functionalities:
+- Record Mode: Every chat, completion, and embedding request is sent to the API as usual, and the request, response, and latency are appended to the cassette.
+- Replay Mode: Responses are served from the cassette, with no latency, a fixed latency, or the latency that was recorded.
+  A request is matched to a recording with the same request first. If there is none (e.g. because a prompt contains text that changed),
+  the next unused recording of the same type is served, so a session can be replayed in the order it was recorded.
+- Off: Requests go to the API. This is the default.
+
+The mode is set in the [Cassette] section of config.ini, or with use_cassette.
+
+Author: Courtney Palmer
+'''
+
+#region Imports
+import os
+import json
+import hashlib
+import threading
+from time import time, sleep
+from src.scripts.file_handler import load_ini
+#endregion
+
+CASSETTE_MODES = ("off", "record", "replay")
+
+#region Class Definitions
+class CassetteMiss(Exception):
+    ''' Raised in replay mode when the cassette has no response left for a request. '''
+
+class cassette:
+    ''' Records API responses to a cassette file, or replays them from it. '''
+    def __init__(self, mode, filepath, replay_latency=0.0):
+        '''
+        mode: "off", "record", or "replay"
+        filepath: the path to the cassette file (JSON lines, one recorded request per line)
+        replay_latency: the number of seconds to wait before serving a response in replay mode, or "recorded" to wait as long as the recorded request took
+        '''
+        if mode not in CASSETTE_MODES:
+            raise ValueError(f"Unknown cassette mode '{mode}'. Please use one of: {', '.join(CASSETTE_MODES)}.")
+        self.mode = mode
+        self.filepath = filepath
+        self.replay_latency = replay_latency
+        self.lock = threading.Lock()
+        self.by_key = {}
+        self.by_kind = {}
+        self.used = set()
+        if mode == "replay":
+            self.load()
+        elif mode == "record":
+            os.makedirs(os.path.dirname(os.path.abspath(filepath)), exist_ok=True)
+
+    def load(self):
+        ''' Reads the recordings of the cassette file, in the order they were recorded. '''
+        if not os.path.exists(self.filepath):
+            raise FileNotFoundError(f"The cassette {self.filepath} does not exist. Record it first with mode = record.")
+        with open(self.filepath, 'r', encoding='utf-8') as f:
+            for position, line in enumerate(f):
+                if line.strip() == "":
+                    continue
+                recording = json.loads(line)
+                recording['position'] = position
+                self.by_key.setdefault(recording['key'], []).append(recording)
+                self.by_kind.setdefault(recording['kind'], []).append(recording)
+
+    def call(self, kind, request, live_call):
+        ''' Sends a request through the cassette.
+
+        kind: the type of request ("chat", "json_chat", "completion", "embedding", or "embedding_batch").
+              Requests of the same type have the same shape of response, so a recording of one can stand in for another.
+        request: the JSON-serializable parameters of the request, used to match recordings
+        live_call: a function without arguments that sends the request to the API and returns a JSON-serializable response
+        return: the response
+        '''
+        if self.mode == "off":
+            return live_call()
+        key = request_key(kind, request)
+        if self.mode == "record":
+            started = time()
+            response = live_call()
+            recording = {'kind': kind, 'key': key, 'request': request, 'response': response, 'latency': time() - started}
+            with self.lock:
+                with open(self.filepath, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(recording) + "\n")
+            return response
+
+        recording = self.take_recording(kind, key)
+        latency = recording['latency'] if self.replay_latency == "recorded" else self.replay_latency
+        if latency > 0:
+            sleep(latency)
+        return recording['response']
+
+    def take_recording(self, kind, key):
+        ''' Returns the recording to replay for a request: the first unused recording of the same request,
+        otherwise the last recording of the same request, otherwise the first unused recording of the same type.
+        '''
+        with self.lock:
+            for recording in self.by_key.get(key, []):
+                if recording['position'] not in self.used:
+                    self.used.add(recording['position'])
+                    return recording
+            # Requests that are repeated more often than they were recorded reuse their last response
+            if key in self.by_key:
+                return self.by_key[key][-1]
+            for recording in self.by_kind.get(kind, []):
+                if recording['position'] not in self.used:
+                    self.used.add(recording['position'])
+                    return recording
+        raise CassetteMiss(f"The cassette {self.filepath} has no {kind} response left to replay.")
+#endregion
+
+#region Definitions
+def request_key(kind, request):
+    ''' Returns the hash that identifies a request in the cassette. '''
+    return hashlib.sha256(json.dumps({'kind': kind, 'request': request}, sort_keys=True).encode('utf-8')).hexdigest()
+
+def through_cassette(kind, request, live_call):
+    ''' Sends a request through the active cassette. See cassette.call. '''
+    return active_cassette.call(kind, request, live_call)
+
+def use_cassette(mode, filepath=None, replay_latency=0.0):
+    ''' Replaces the active cassette, e.g. to replay a recorded session from a script.
+
+    mode: "off", "record", or "replay"
+    filepath: the path to the cassette file
+    replay_latency: the number of seconds to wait before serving a response in replay mode, or "recorded"
+    '''
+    global active_cassette
+    active_cassette = cassette(mode, filepath, replay_latency)
+
+def parse_replay_latency(value):
+    ''' Parses the replay_latency setting, which is a number of seconds or "recorded". '''
+    value = value.strip().lower()
+    if value == "recorded":
+        return value
+    return float(value)
+#endregion
+
+#region Global Variables
+config_object = load_ini(os.getcwd(), "config.ini")
+active_cassette = cassette(
+    config_object.get('Cassette', 'mode', fallback='off').strip().lower(),
+    os.path.join(os.getcwd(), config_object.get('Cassette', 'file', fallback=os.path.join('cassettes', 'session.jsonl')).strip()),
+    parse_replay_latency(config_object.get('Cassette', 'replay_latency', fallback='0')))
+#endregion
@@ -0,0 +1,127 @@
+'''
+Compression Module for Employ Ease
+
+This module shortens the long documents of the SSOT (the resume, the job description, and the company description) before they are
+substituted into a prompt, so that a question about a two-page resume does not send the whole resume to ChatGPT every time.
+The compression is extractive and runs locally: the sentences that are kept are copied word for word, and nothing is sent to the API.
+
+Key Functionalities:
+- Sentence Scoring: Every sentence is weighted with TF-IDF, and scored by its centrality (how similar it is to the rest of the document)
+  plus how well it matches the keywords of the current question. Both are computed for all sentences at once with NumPy.
+- Token Budget: The best sentences are kept until the token budget is reached, and are put back in their original order.
+- Caching: Compressed documents are cached by their text and the question's keywords, so a document is only compressed again when it changes.
+
+Author: Courtney Palmer
+'''
+
+#region Imports
+import re
+from functools import lru_cache
+import numpy as np
+from src.scripts.keyword_analysis import extract_terms
+from src.scripts.memory import token_counter
+#endregion
+
+DOCUMENT_TOKEN_BUDGET = 500
+# How much a sentence's match with the question counts compared to its centrality
+QUERY_WEIGHT = 2.0
+
+#region Definitions
+def split_sentences(text):
+    ''' Splits a document into sentences. Every line is split on its own, since the lines of resumes and job postings are often bullet points without punctuation.
+
+    text: the text of the document
+    return: a list of (line number, sentence), in order
+    '''
+    sentences = []
+    for line_number, line in enumerate(text.split('\n')):
+        for sentence in re.split(r'(?<=[.!?])\s+', line.strip()):
+            if sentence != "":
+                sentences.append((line_number, sentence))
+    return sentences
+
+def query_terms(query):
+    ''' Returns the terms of a question that are used to score sentences, as a frozenset so that it can be used as a cache key. '''
+    return frozenset(extract_terms(query)[0].keys())
+
+def score_sentences(sentences, terms):
+    ''' Scores sentences by their TF-IDF centrality within the document and their similarity to the question's terms.
+
+    sentences: the list of sentences of the document
+    terms: the terms of the question
+    return: a NumPy array with the score of every sentence
+    '''
+    term_counts = [extract_terms(sentence)[0] for sentence in sentences]
+    vocabulary = sorted(set(term for counts in term_counts for term in counts))
+    if vocabulary == []:
+        return np.zeros(len(sentences))
+    column = {term: i for i, term in enumerate(vocabulary)}
+
+    # A sentence-term matrix of TF-IDF weights, with every row normalized so that a matrix product gives cosine similarities
+    frequencies = np.zeros((len(sentences), len(vocabulary)), dtype=np.float64)
+    for row, counts in enumerate(term_counts):
+        frequencies[row, [column[term] for term in counts]] = list(counts.values())
+    document_frequency = (frequencies > 0).sum(axis=0)
+    idf = np.log((1 + len(sentences)) / (1 + document_frequency)) + 1
+    weights = np.where(frequencies > 0, 1 + np.log(np.maximum(frequencies, 1)), 0) * idf
+    weights /= np.maximum(np.linalg.norm(weights, axis=1, keepdims=True), 1e-12)
+
+    # Centrality is a sentence's average similarity to every other sentence
+    similarity = weights @ weights.T
+    centrality = (similarity.sum(axis=1) - np.diag(similarity)) / max(len(sentences) - 1, 1)
+
+    query_vector = np.zeros(len(vocabulary))
+    for term in terms:
+        if term in column:
+            query_vector[column[term]] = idf[column[term]]
+    query_norm = np.linalg.norm(query_vector)
+    relevance = weights @ (query_vector / query_norm) if query_norm > 0 else np.zeros(len(sentences))
+    return centrality + QUERY_WEIGHT * relevance
+
+@lru_cache(maxsize=64)
+def compress_document(text, terms=frozenset(), token_budget=DOCUMENT_TOKEN_BUDGET):
+    ''' Shortens a document to the sentences that are most central to it and most relevant to the question, within a token budget.
+
+    text: the text of the document
+    terms: the terms of the question, from query_terms
+    token_budget: the maximum number of tokens of the compressed document
+    return: the compressed document, or the document itself if it is already within the budget
+    '''
+    if token_counter(text, "gpt-3.5-turbo") <= token_budget:
+        return text
+    sentences = split_sentences(text)
+    if sentences == []:
+        return text
+    scores = score_sentences([sentence for _, sentence in sentences], terms)
+    tokens = [token_counter(sentence, "gpt-3.5-turbo") for _, sentence in sentences]
+
+    # The first sentence usually names the candidate or the job, so it is kept whenever it fits
+    selected = set()
+    used_tokens = 0
+    for i in [0] + list(np.argsort(-scores, kind='stable')):
+        if i not in selected and used_tokens + tokens[i] <= token_budget:
+            selected.add(i)
+            used_tokens += tokens[i]
+
+    # Sentences from the same line are joined with a space, sentences from different lines with a new line
+    lines = []
+    previous_line = None
+    for i in sorted(selected):
+        line_number, sentence = sentences[i]
+        if line_number == previous_line:
+            lines[-1] = f"{lines[-1]} {sentence}"
+        else:
+            lines.append(sentence)
+        previous_line = line_number
+    return '\n'.join(lines)
+
+def compress_for_query(text, query, token_budget=DOCUMENT_TOKEN_BUDGET):
+    ''' Compresses a document for a question. See compress_document.
+
+    text: the text of the document
+    query: the question the document will be used to answer
+    token_budget: the maximum number of tokens of the compressed document
+    return: the compressed document
+    '''
+    return compress_document(text, query_terms(query), token_budget)
+#endregion
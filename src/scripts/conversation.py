@@ -14,15 +14,26 @@ Author: Courtney Palmer
 #region imports
 import sys
 import os
+import threading
+from contextlib import nullcontext
+from contextvars import copy_context
 from time import time
 from uuid import uuid4
 import requests
 from rich.console import Console
 import re
-from src.scripts.logger import create_new_memory_file, create_new_transcript, append_transcript
-from src.scripts.single_source_of_truth import single_source_of_truth
-from src.scripts.memory import fetch_memories, summarize_memories, gpt3_embedding, timestamp_to_datetime, get_last_messages, load_convo
+from src.scripts.logger import create_new_memory_file, create_new_transcript, append_transcript, get_transcript_filepath
+from src.scripts.workspace import get_workspace_root
+from src.scripts.single_source_of_truth import single_source_of_truth, get_current_truth
+from src.scripts.memory import fetch_memories, summarize_memories, gpt3_embedding, timestamp_to_datetime, get_last_messages, load_convo, token_counter, compact_memories, memory_limit_exceeded, save_session_snapshot, get_session_summary, MaxTokenResponseLimit
+from src.scripts.scheduler import background_priority, parse_retry_after, RateLimitExceeded, PRIORITY_INTERACTIVE
+from src.scripts.resilience import call_api, turn_budget, ServiceUnavailable, UpstreamError, TurnBudget
+from src.scripts.cassette import through_cassette
 from src.scripts.file_handler import load_ini, read_file_content
+from src.scripts.document_index import index_document, get_document_version, fetch_document_chunks, format_document_chunks
+from src.scripts.extraction import extract_application_fields
+from src.scripts.deduplication import get_session_index, discard_session_index, deduplication_enabled
+from src.scripts.profiler import profiled_executor
 #endregion
 
 #region Definitions
@@ -42,37 +53,139 @@ def themed_print(message, theme = "bold green"):
     console = Console()
     console.print(message, style = theme, highlight=False)
 
-def send_prompt(prompt, session_timestamp):
+def send_prompt(prompt, session_timestamp, verbose=True, prefetched=None, budget=None):
     '''
     Sends a prompt to ChatGPT and returns the response.
     
     prompt: The prompt to send to ChatGPT.
     session_timestamp: The timestamp of the current session.
+    verbose: If False, the prompt is sent without a spinner and the response is not printed (used for background work).
+    prefetched: An answer computed ahead of time by prepare_answer. If provided, it is saved and shown instead of asking ChatGPT again.
+    budget: The number of seconds the turn may take before optional stages are skipped, or 0 to always use the full context. Defaults to 'turn_budget' in config.ini.
+    returns: ChatGPT's response, or None if the API was unavailable and the error was printed instead.
     '''
-    # Create a transcript file if one does not exist
-    if not os.path.exists(os.getcwd() + f"\\logs\\Session_{session_timestamp}\\Transcript.txt"):
-        create_new_transcript(session_timestamp)
-       
-    console = Console()
-    with console.status(
-          themed_print(f"User: {prompt}...", "user_color"),
-          spinner="aesthetic",
-          speed=1,
-          spinner_style="green",
-    ):
-
-        user_prompt_vector = save_message(prompt, session_timestamp, "User")[0]
-        user_prompt_with_context = get_conversation(session_timestamp, user_prompt_vector)
-        bot_response_message = save_message(user_prompt_with_context, session_timestamp, "EmployEase")[1]
-        return bot_response_message
-
-def save_message(user_prompt, session_timestamp, speaker):
+    # Create a transcript file if one does not exist. Background priming may get here from several threads at once.
+    with transcript_lock:
+        if not os.path.exists(get_transcript_filepath(session_timestamp)):
+            create_new_transcript(session_timestamp)
+
+    # Background work runs without a spinner so it does not draw over the menu
+    status = nullcontext()
+    if verbose:
+        console = Console()
+        status = console.status(
+              themed_print(f"User: {prompt}...", "user_color"),
+              spinner="aesthetic",
+              speed=1,
+              spinner_style="green",
+        )
+    try:
+        with status:
+            return save_turn(prompt, session_timestamp, verbose, prefetched, turn_budget(TurnBudget if budget is None else budget))
+    except ServiceUnavailable as e:
+        # Background work and the server report the error to their caller instead
+        if not verbose:
+            raise
+        themed_print(f"Could not get a response from ChatGPT: {e}", "Error")
+        return None
+
+def save_turn(prompt, session_timestamp, verbose, prefetched, budget):
+    '''
+    Saves the prompt, and saves and returns ChatGPT's response to it. See send_prompt.
+    '''
+    # The previous answer must be in memory before this turn reads the conversation
+    wait_for_deferred_save(session_timestamp)
+    if prefetched is not None:
+        save_message(prompt, session_timestamp, "User", verbose, vector=prefetched['prompt_vector'])
+        return save_message("", session_timestamp, "EmployEase", verbose, response=prefetched['response'], vector=prefetched['response_vector'])[1]
+    # The prompt is only saved once it was answered, so that a failed turn does not leave an unanswered prompt in memory
+    user_prompt_vector = get_message_vector(prompt, session_timestamp, "User")
+    user_prompt_with_context = get_conversation(session_timestamp, user_prompt_vector, pending_message=prompt, budget=budget)
+    # The budget only drops optional stages. The answer itself is always given the full chat deadline.
+    bot_response_message = send_message(user_prompt_with_context)
+    save_message(prompt, session_timestamp, "User", verbose, vector=user_prompt_vector)
+    if budget.allows("embedding"):
+        save_message("", session_timestamp, "EmployEase", verbose, response=bot_response_message, degradations=budget.degradations)
+    else:
+        # The answer is shown right away, and embedded and saved to memory in the background
+        budget.degrade("deferred_reply_embedding")
+        if verbose:
+            themed_print(f"\nEmployEase: {bot_response_message}", "bot_color")
+        deferred_saves[(get_workspace_root(), session_timestamp)] = deferred_save_executor.submit(
+            copy_context().run, save_message, "", session_timestamp, "EmployEase", False, bot_response_message, None, budget.degradations)
+    last_degradations[(get_workspace_root(), session_timestamp)] = budget.degradations
+    if budget.degradations != [] and verbose:
+        themed_print(f"To answer within {budget.seconds:g} seconds, {', and '.join(DEGRADATION_DESCRIPTIONS[degradation] for degradation in budget.degradations)}.", "Info")
+    return bot_response_message
+
+def wait_for_deferred_save(session_timestamp):
+    '''Blocks until the last answer of the session that was saved in the background is in memory.
+    
+    session_timestamp: The timestamp of the current session.
+    '''
+    future = deferred_saves.pop((get_workspace_root(), session_timestamp), None)
+    if future is not None:
+        try:
+            future.result()
+        except Exception as e:
+            themed_print(f"Could not save the last answer to memory: {e}", "Warning")
+
+def get_last_degradations(session_timestamp):
+    '''Returns the optional stages that were skipped in the last turn of the session to stay within its latency budget.
+    
+    session_timestamp: The timestamp of the current session.
+    returns: A list of degradations, such as "skipped_summarization", "recent_messages_only", or "deferred_reply_embedding".
+    '''
+    return last_degradations.get((get_workspace_root(), session_timestamp), [])
+
+def prepare_answer(prompt, session_timestamp):
+    '''Computes ChatGPT's answer to a prompt without saving anything, so that it can be shown later with send_prompt(prefetched=...).
+    
+    prompt: The prompt to answer.
+    session_timestamp: The timestamp of the current session.
+    returns: A dictionary with the prompt's vector, the response, the response's vector, and the conversation generation the answer was based on.
+    '''
+    generation = get_conversation_generation(session_timestamp)
+    prompt_vector = gpt3_embedding(prompt)
+    user_prompt_with_context = get_conversation(session_timestamp, prompt_vector, pending_message=prompt)
+    response = send_message(user_prompt_with_context)
+    response_vector = gpt3_embedding(response)
+    return {'prompt_vector': prompt_vector, 'response': response, 'response_vector': response_vector, 'generation': generation}
+
+def get_conversation_generation(session_timestamp):
+    '''Returns the number of messages saved in the given session by this process. An answer prepared ahead of time is only valid while this number is unchanged.
+    
+    session_timestamp: The timestamp of the current session.
+    '''
+    return conversation_generations.get((get_workspace_root(), session_timestamp), 0)
+
+def get_message_vector(content, session_timestamp, speaker):
+    '''Returns the vector representation of a message. A message that was already saved in the session reuses the vector of the earlier message.
+    
+    content: The message.
+    session_timestamp: The timestamp of the current session.
+    speaker: The speaker of the message (either "User" or "EmployEase").
+    '''
+    if deduplication_enabled:
+        session_folder = f"Session_{session_timestamp}"
+        duplicate_index = get_session_index(session_folder, lambda: load_convo(session_folder))
+        duplicate_of = duplicate_index.find(speaker, content)
+        if duplicate_of is not None and duplicate_index.get_vector(duplicate_of) is not None:
+            return duplicate_index.get_vector(duplicate_of)
+    return gpt3_embedding(content)
+
+def save_message(user_prompt, session_timestamp, speaker, verbose=True, response=None, vector=None, degradations=None):
     '''Takes a user prompt, sends it to ChatGPT, and saves the response to a json file.
     
     user_prompt: The user's message to send to ChatGPT.
     session_timestamp: The timestamp of the current session.
     speaker: The speaker of the message (either "User" or "EmployEase").
+    verbose: If False, the response is not printed to the console.
+    response: The bot's response, if it was already retrieved from ChatGPT.
+    vector: The vector representation of the message, if it was already computed.
+    degradations: The optional stages that were skipped to answer within the turn's latency budget, saved with the response.
     returns: A list containing the vector representation of the message and the message text itself.
+    If the message is a duplicate of an earlier message, only a reference to the earlier message is saved, and the earlier message's vector is reused.
     '''
     # First, distinguish between the user (who sends a prompt), and the bot (who responds to the prompt).
     # Check if the speaker is the user. If so, record the user prompt info to a JSON file.
@@ -80,30 +193,67 @@ def save_message(user_prompt, session_timestamp, speaker):
     content = ""
     if speaker == "User":
         content = user_prompt
+    elif response is not None:
+        content = response
     else:
         bot_response = send_message(user_prompt)
         content = bot_response
 
+    # Check whether the same message (or nearly the same message) was already saved in this session
+    session_folder = f"Session_{session_timestamp}"
+    duplicate_of = None
+    if deduplication_enabled:
+        duplicate_index = get_session_index(session_folder, lambda: load_convo(session_folder))
+        duplicate_of = duplicate_index.find(speaker, content)
+
     # set vector, msg_timestamp, msg_timestring, and message for the 'info' dictionary
-    vector = gpt3_embedding(content)
     msg_timestamp = time()
     msg_timestring = timestamp_to_datetime(msg_timestamp)
     message = content
-    info = {'speaker': f'{speaker}', 'time': msg_timestamp, 'vector': vector, 'message': message, 'uuid': str(uuid4()), 'timestring': msg_timestring}
-
+    if duplicate_of is not None:
+        # A duplicate is saved as a reference with a new timestamp, without embedding the message again
+        if vector is None:
+            vector = duplicate_index.get_vector(duplicate_of)
+        info = {'speaker': f'{speaker}', 'time': msg_timestamp, 'uuid': str(uuid4()), 'timestring': msg_timestring, 'duplicate_of': duplicate_of}
+    if duplicate_of is None or vector is None:
+        if vector is None:
+            vector = gpt3_embedding(content)
+        info = {'speaker': f'{speaker}', 'time': msg_timestamp, 'vector': vector, 'message': message, 'uuid': str(uuid4()), 'timestring': msg_timestring}
+        if deduplication_enabled:
+            duplicate_index.add(info['uuid'], speaker, content, vector)
+
+    if degradations:
+        info['degradations'] = list(degradations)
     create_new_memory_file(session_timestamp, speaker, msg_timestamp, info)
     append_transcript(f"{speaker}: {content}", session_timestamp)
+    conversation_generations[(get_workspace_root(), session_timestamp)] = get_conversation_generation(session_timestamp) + 1
+    # The memory limit is enforced in the background, once the running count of memories exceeds it.
+    # The context is copied so that compaction runs in the current workspace.
+    if memory_limit_exceeded():
+        compaction_executor.submit(copy_context().run, compact_memories_in_background)
     
-    if speaker != "User":
+    if speaker != "User" and verbose:
         themed_print(f"\n{speaker}: {content}", "bot_color")
 
     prompt_vector_and_text = [vector, content]
 
     return prompt_vector_and_text
 
-def send_message(message):
+def compact_memories_in_background():
+    '''Evicts the least useful memories into summaries if the memory limit was exceeded, with all of its API requests scheduled as background work.'''
+    try:
+        with background_priority():
+            changed_sessions = compact_memories()
+    except Exception as e:
+        themed_print(f"Could not compact memories: {e}", "Warning")
+        return
+    for session_folder in changed_sessions:
+        discard_session_index(session_folder)
+
+def send_message(message, deadline=None):
     '''
     Sends a message to ChatGPT and returns the response.
+    deadline: the number of seconds the request may take, including retries and waiting for the rate limits. Defaults to the chat deadline in config.ini.
     '''
     headers = {
         'Content-Type': 'application/json',
@@ -116,27 +266,96 @@ def send_message(message):
                      {'role': 'user', 'content': message}]
     }
 
-    api_url = 'https://api.openai.com/v1/chat/completions'
-    response = requests.post(api_url, headers=headers, json=data, timeout=60)
-    response_json = response.json()
-    return response_json['choices'][0]['message']['content']
+    api_url = f"{APIBase}/chat/completions"
 
-def get_conversation(session_timestamp, vector):
+    def send_request():
+        # Slow or failed requests are retried, hedged, and cut off at the chat deadline by call_api
+        response = call_api("chat", lambda timeout: post_chat_request(api_url, headers, data, timeout),
+                            token_counter(message, "gpt-3.5-turbo") + MaxTokenResponseLimit, PRIORITY_INTERACTIVE, deadline)
+        response_json = response.json()
+        return response_json['choices'][0]['message']['content']
+    # The request goes through the cassette, which records or replays it when a cassette mode is set in config.ini
+    return through_cassette("chat", data, send_request)
+
+def post_chat_request(api_url, headers, data, timeout):
+    '''
+    Posts a chat request and raises RateLimitExceeded if the API reports that a rate limit was exceeded, so that the scheduler can retry it.
+    Server errors raise UpstreamError, so that call_api can retry them.
+    '''
+    response = http_session.post(api_url, headers=headers, json=data, timeout=timeout)
+    if response.status_code == 429:
+        raise RateLimitExceeded(f"Rate limit exceeded: {response.text}", parse_retry_after(response.headers.get('Retry-After')))
+    if response.status_code >= 500:
+        raise UpstreamError(f"The API responded with HTTP {response.status_code}: {response.text}", response.status_code)
+    return response
+
+def get_conversation(session_timestamp, vector, pending_message=None, budget=None):
     ''' Gets the conversation from the current session, and returns a prompt for the bot to respond to.
     
     session_timestamp: The timestamp of the current session.
     vector: The vector representation of the user's message.
+    pending_message: The user's message, if it has not been saved to the conversation yet (it is saved once it was answered).
+    budget: The turn_budget of the turn. When the time left is short, the notes are not rewritten, or only the recent messages are used.
     '''
+    if budget is None:
+        budget = turn_budget(0)
 
     conversation = load_convo(f"Session_{session_timestamp}")
-    memories = fetch_memories(vector, conversation, 5)
     notes = ""
-    if memories != []:
-        notes = summarize_memories(memories)
-    recent = get_last_messages(conversation, 4)
-    prompt = f"I am a chatbot named EmployEase. My goals are to increase user success rate in securing job offers. I will read the conversation notes and recent messages, and then I will provide an answer. The following are notes from earlier conversations with USER: {notes} The following are the most recent messages in the conversation: {recent} I will now provide a response. EmployEase: "
+    chunks = []
+    # Without time for the chat request, the prompt is kept to the recent messages so that it is answered as fast as possible
+    if not budget.allows("chat"):
+        budget.degrade("recent_messages_only")
+    else:
+        memories = fetch_memories(vector, conversation, 5)
+        summarized = False
+        if memories != [] and budget.allows("completion", "chat"):
+            try:
+                notes = summarize_memories(memories, budget.deadline_for("completion", "chat"))
+                rolling_summaries[(get_workspace_root(), session_timestamp)] = notes
+                summarized = True
+            except ServiceUnavailable:
+                # The notes are optional, so the turn goes on without rewriting them
+                pass
+        if memories != [] and not summarized:
+            # The notes written in an earlier turn are used instead of summarizing the memories again
+            budget.degrade("skipped_summarization")
+            notes = rolling_summaries.get((get_workspace_root(), session_timestamp), "")
+        chunks = fetch_document_chunks(vector, 3)
+    if pending_message is None:
+        recent = get_last_messages(conversation, 4)
+    else:
+        recent = f"{get_last_messages(conversation, 3)}\n\n{pending_message}".strip()
+    # A local keyword analysis summarizes how the resume fits the job description in a few tokens.
+    # It is only used when excerpts of the resume or job description were retrieved, and takes the place of one of them.
+    keywords = ""
+    if keyword_context and any(chunk['doc_type'] in ('job', 'resume') for chunk in chunks):
+        keyword_analysis = get_current_truth().keyword_analysis()
+        question = pending_message if pending_message is not None else (conversation[-1]['message'] if len(conversation) > 0 else "")
+        if keyword_analysis != "" and keyword_analysis in question:
+            # Prompts such as "Group the main keywords" carry the analysis themselves, so the excerpts of the resume and job description are left out
+            chunks = [chunk for chunk in chunks if chunk['doc_type'] not in ('job', 'resume')]
+        elif keyword_analysis != "":
+            last = max(i for i, chunk in enumerate(chunks) if chunk['doc_type'] in ('job', 'resume'))
+            chunks = chunks[:last] + chunks[last + 1:]
+            keywords = f"The following is a keyword analysis of the user's resume against the job description: {keyword_analysis} "
+    documents = format_document_chunks(chunks)
+    prompt = f"I am a chatbot named EmployEase. My goals are to increase user success rate in securing job offers. I will read the relevant excerpts from the user's documents, the conversation notes, and recent messages, and then I will provide an answer. The following are excerpts from the user's resume, job description, and company description: {documents} {keywords}The following are notes from earlier conversations with USER: {notes} The following are the most recent messages in the conversation: {recent} I will now provide a response. EmployEase: "
     return prompt
 
+def save_session(session_timestamp):
+    ''' Saves a snapshot of the session's memories and its latest notes, so that the session can be resumed quickly on the next launch.
+    
+    session_timestamp: The timestamp of the current session.
+    '''
+    wait_for_deferred_save(session_timestamp)
+    rolling_summary = rolling_summaries.get((get_workspace_root(), session_timestamp))
+    if rolling_summary is None:
+        # Keep the notes of the previous snapshot if no new notes were written since the session was resumed
+        previous = get_session_summary(f"Session_{session_timestamp}")
+        rolling_summary = previous['rolling_summary'] if previous is not None else ""
+    save_session_snapshot(f"Session_{session_timestamp}", rolling_summary)
+
 def is_file_path(input_string):
     '''Heuristic function to check if the input string is likely a file path.
 
@@ -169,58 +388,226 @@ def request_filepath_or_text(content_name):
     # Treating the input as direct text
     return user_input.encode(encoding='ASCII', errors='ignore').decode()
 
-def prime_information(session_timestamp, info_type, filepath=""):
+def prime_information(session_timestamp, info_type, filepath="", verbose=True, text=None):
     '''Primes ChatGPT with information about the user's resume, company description, or job description.
     
     session_timestamp: The timestamp of the current session.
     info_type: Type of information to prime ('resume', 'company', 'job').
     filepath: The file path to the information file.
+    verbose: If False, ChatGPT's replies are not printed (used when priming in the background).
+    text: The information itself. If provided, neither a file nor the user is asked for it.
     '''
-    new_info = ""
-    if filepath != "":
-        new_info = read_file_content(filepath)
-    else:
-        new_info = request_filepath_or_text(info_type)
-
-    if new_info is None:
-        return
-
-    send_prompt(f"Your goal is to remember the contents of this {info_type} for future questioning:\n{new_info}", session_timestamp)
+    prime_documents(session_timestamp, [info_type], {info_type: filepath}, verbose, {} if text is None else {info_type: text})
 
+def prime_documents(session_timestamp, info_types, filepaths=None, verbose=True, texts=None):
+    '''Primes ChatGPT with several documents. The fields of the job description and the company description are extracted together,
+    so that updating both takes one JSON request at most.
+    
+    session_timestamp: The timestamp of the current session.
+    info_types: The types of information to prime ('resume', 'company', 'job'), in the order they are requested from the user.
+    filepaths: A dictionary of {info_type: file path}. Documents without a file path or text are requested from the user.
+    verbose: If False, ChatGPT's replies are not printed (used when priming in the background).
+    texts: A dictionary of {info_type: text} of documents that are provided directly.
+    If the API is unavailable, the error is printed and the document is skipped. Background work and the server get the error raised instead.
+    '''
+    filepaths = filepaths or {}
+    texts = texts or {}
+    documents = {}
+    for info_type in info_types:
+        if info_type in texts:
+            new_info = texts[info_type]
+        elif filepaths.get(info_type, "") != "":
+            new_info = read_file_content(filepaths[info_type])
+        else:
+            new_info = request_filepath_or_text(info_type)
+        if new_info is None:
+            continue
+
+        try:
+            changed = index_information(info_type, new_info, verbose)
+        except ServiceUnavailable as e:
+            if not verbose:
+                raise
+            themed_print(f"Could not save your {info_type} to memory: {e}", "Error")
+            continue
+        # An unchanged document keeps the fields that were extracted from it before
+        if info_type in ('company', 'job') and not changed and has_extracted_fields(info_type):
+            if verbose:
+                themed_print(f"Your {info_type} has not changed since it was last loaded.", "Info")
+            continue
+        documents[info_type] = new_info
+
+    save_documents(documents, verbose)
+
+def index_information(info_type, new_info, verbose=True):
+    '''Splits a document into chunks that are retrieved per question, instead of being remembered as one message.
+    Only the chunks that changed since the document was last primed are embedded again.
+    
+    info_type: Type of information ('resume', 'company', 'job').
+    new_info: The text of the document.
+    verbose: If False, nothing is printed.
+    returns: True if the document changed since it was last primed.
+    '''
+    chunks, changed = index_document(info_type, new_info)
+    version = get_document_version(info_type)
+    changed_chunks = [chunk for chunk in chunks if chunk.get('version') == version] if changed else []
+    if verbose:
+        themed_print(f"Your {info_type} has been saved to memory in {len(chunks)} sections ({len(changed_chunks)} new or changed).", "Success")
+    return changed
+
+def save_documents(documents, verbose=True):
+    '''Saves documents to the SSOT, together with the fields that are extracted from them.
+    The company name, company website, and job name are extracted locally where possible, otherwise with one JSON request for all documents.
+    
+    documents: A dictionary of {info_type: text}.
+    verbose: If False, nothing is printed, and an API error is raised after the documents were saved.
+    '''
+    extracted_documents = {info_type: text for info_type, text in documents.items() if info_type in ('company', 'job')}
+    error = None
+    try:
+        fields = extract_application_fields(extracted_documents)
+    except ServiceUnavailable as e:
+        # The documents are still saved, with the fields that were found locally. A name that is left empty is requested again when its document is next loaded.
+        error = e
+        fields = extract_application_fields(extracted_documents, local_only=True)
+    if 'company' in documents:
+        single_source_of_truth.update_ssot_ini_info(application_company_description=documents['company'], 
+                         application_company_name=fields["company_name"], 
+                         application_company_website=fields["company_website"])
+        if verbose:
+            themed_print(f"Company: {fields['company_name']} ({fields['company_website']})", "Success")
+
+    if 'job' in documents:
+        single_source_of_truth.update_ssot_ini_info(application_job_description=documents['job'], 
+                         application_job_name=fields["job_name"])
+        if verbose:
+            themed_print(f"Job: {fields['job_name']}", "Success")
+
+    if 'resume' in documents:
+        single_source_of_truth.update_ssot_ini_info(candidate_resume=documents['resume'])
+
+    if error is not None:
+        if not verbose:
+            raise error
+        themed_print(f"Could not look up the missing company and job details: {error}", "Warning")
+
+def has_extracted_fields(info_type):
+    '''Returns True if the SSOT already holds the fields that are extracted from the given type of document.
+    
+    info_type: Type of information ('company', 'job').
+    '''
+    ssot = get_current_truth()
     if info_type == 'company':
-        new_company_name = send_prompt(f"Given the company description, tell me the company name. Do not provide any other text:\n{new_info}", session_timestamp)
-        if new_company_name is not None:
-            company_website = send_prompt(f"Provide me the website for the company {new_company_name}. Do not provide any other text", session_timestamp)
-        single_source_of_truth.update_ssot_ini_info(application_company_description=new_info, 
-                         application_company_name=new_company_name, 
-                         application_company_website=company_website)
-
-    elif info_type == 'job':
-        new_job_name = send_prompt(f"Given the job description, provide the job title. Do not provide any other text:\n{new_info}", session_timestamp)
-        single_source_of_truth.update_ssot_ini_info(application_job_description=new_info, 
-                         application_job_name=new_job_name)
-
-    elif info_type == 'resume':
-        single_source_of_truth.update_ssot_ini_info(candidate_resume=new_info)
+        return ssot.company_name.strip('"') != "" and ssot.company_description.strip('"') != ""
+    return ssot.job_name.strip('"') != "" and ssot.job_description.strip('"') != ""
 
 def prime_chatgpt(session_timestamp, new_config):
     '''Primes ChatGPT with information about the user's resume, the job description, and the company description.
     Use the filepaths provided in config.ini to retrieve the information.
+    Documents with a filepath are primed concurrently in the background so that the menu is usable right away.
+    Documents without a filepath are requested from the user before returning.
     
     session_timestamp: The timestamp of the current session.
     new_config: The config object to retrieve the file paths from.
     '''
-    resume_path = new_config.get('filepaths_to_load_on_launch', 'resume_path')
-    job_path = new_config.get('filepaths_to_load_on_launch', 'job_path')
-    company_path = new_config.get('filepaths_to_load_on_launch', 'company_path')
-    prime_information(session_timestamp,"resume", resume_path)
-    prime_information(session_timestamp, "company", company_path)
-    prime_information(session_timestamp, "job", job_path)
+    filepaths = {
+        "resume": new_config.get('filepaths_to_load_on_launch', 'resume_path').strip(),
+        "company": new_config.get('filepaths_to_load_on_launch', 'company_path').strip(),
+        "job": new_config.get('filepaths_to_load_on_launch', 'job_path').strip()
+    }
+    # Reading from stdin cannot happen in the background while the menu is waiting for input
+    prime_documents(session_timestamp, [info_type for info_type, filepath in filepaths.items() if filepath == ""])
+    # The job description and company description are primed together, so that their fields are extracted with a single request
+    for info_types in (["resume"], ["company", "job"]):
+        background_filepaths = {info_type: filepaths[info_type] for info_type in info_types if filepaths[info_type] != ""}
+        if background_filepaths != {}:
+            future = priming_executor.submit(prime_documents_in_background, session_timestamp, background_filepaths)
+            for info_type in background_filepaths:
+                priming_futures[info_type] = future
+
+def prime_documents_in_background(session_timestamp, filepaths):
+    '''Primes ChatGPT with documents without printing, with all of their API requests scheduled as background work.
+    
+    session_timestamp: The timestamp of the current session.
+    filepaths: A dictionary of {info_type: file path}.
+    '''
+    with background_priority():
+        prime_documents(session_timestamp, list(filepaths.keys()), filepaths, verbose=False)
+
+def info_types_for_prompts(prompts):
+    '''Returns the information types ('resume', 'company', 'job') that the placeholders in the given prompts depend on.
+    
+    prompts: An iterable of prompts that may contain placeholders such as <job_name>.
+    returns: A set of information types.
+    '''
+    info_types = set()
+    for prompt in prompts:
+        for placeholder, placeholder_info_types in PLACEHOLDER_INFO_TYPES.items():
+            if placeholder in prompt:
+                info_types.update(placeholder_info_types)
+    return info_types
+
+def wait_for_priming(info_types=None):
+    '''Blocks until background priming of the given information types has finished.
+    
+    info_types: The information types to wait for ('resume', 'company', 'job'). Waits for all of them if None.
+    '''
+    if info_types is None:
+        info_types = list(priming_futures.keys())
+    for info_type in info_types:
+        future = priming_futures.get(info_type)
+        if future is None:
+            continue
+        if not future.done():
+            themed_print(f"Waiting for the {info_type} to finish loading...", "Info")
+        try:
+            future.result()
+        except Exception as e:
+            themed_print(f"Could not load the {info_type} on launch: {e}", "Error")
+        priming_futures.pop(info_type, None)
 #endregion
 
 #region Global Variables
+# Maps each prompt placeholder to the information types that provide its value
+PLACEHOLDER_INFO_TYPES = {
+    "<job_name>": ("job",),
+    "<job_description>": ("job",),
+    "<company_name>": ("company",),
+    "<company_description>": ("company",),
+    "<company_website>": ("company",),
+    "<resume>": ("resume",),
+    "<keyword_analysis>": ("job", "resume")
+}
+# Background priming of the resume, company description, and job description. Keyed by information type.
+priming_executor = profiled_executor(max_workers=3, thread_name_prefix="priming")
+priming_futures = {}
+# Memories are compacted one session at a time, without delaying the conversation
+compaction_executor = profiled_executor(max_workers=1, thread_name_prefix="compaction")
+transcript_lock = threading.Lock()
+# Number of messages saved per session by this process. Keyed by (workspace root, session timestamp).
+conversation_generations = {}
+# The latest notes written about each session's conversation. Keyed by (workspace root, session timestamp).
+rolling_summaries = {}
+# Answers that are embedded and saved in the background to stay within a turn's latency budget, and the stages each session's last turn skipped.
+# Keyed by (workspace root, session timestamp).
+deferred_save_executor = profiled_executor(max_workers=1, thread_name_prefix="deferred_save")
+deferred_saves = {}
+last_degradations = {}
+DEGRADATION_DESCRIPTIONS = {
+    "skipped_summarization": "the conversation notes were not updated",
+    "recent_messages_only": "only the most recent messages were used",
+    "deferred_reply_embedding": "the answer is saved to memory in the background"
+}
+
 config_object = load_ini(os.getcwd(), "config.ini")
 APIKey = config_object.get('Communication', 'APIKey')
+APIBase = config_object.get('Communication', 'api_base', fallback='https://api.openai.com/v1').rstrip('/')
+keyword_context = config_object.getint('Settings', 'keyword_context', fallback=1) == 1
+# One HTTP session is shared by every thread, so connections to the API are kept alive and reused
+http_session = requests.Session()
+http_connections = config_object.getint('Server', 'max_api_connections', fallback=32)
+http_session.mount('https://', requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=http_connections))
+http_session.mount('http://', requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=http_connections))
 
 # Create a dictionary of themes in the format {themeName: theme}
 # load themes from config.ini, append them to the themes dictionary
@@ -0,0 +1,173 @@
+'''
+Deduplication Module for Employ Ease
+
+This module is responsible for detecting messages that have already been saved to memory, so that repeated menu prompts
+and boilerplate replies do not fill up the memory folder or crowd out useful memories when they are fetched.
+
+Key Functionalities:
+- Exact Duplicates: Every message is identified by a hash of its normalized text (lowercase, with whitespace collapsed).
+- Near Duplicates: Messages are compared with MinHash signatures over word shingles. Locality-sensitive hashing (LSH) splits every
+  signature into bands, so that only messages that share a band are compared, instead of every message in the session.
+- Session Index: The index of a session is built from its memory files the first time it is needed, and is kept up to date as messages are saved.
+  It keeps the embedding of every message, so that a duplicate takes the embedding of its original without reading the memory files again.
+
+A duplicate is saved as a reference to the original memory with a new timestamp, and is not embedded again.
+
+Author: Courtney Palmer
+'''
+
+#region Imports
+import os
+import re
+import zlib
+import hashlib
+import threading
+import numpy as np
+from src.scripts.file_handler import load_ini
+from src.scripts.workspace import get_workspace_root
+#endregion
+
+SHINGLE_SIZE = 3
+MINHASH_PERMUTATIONS = 64
+LSH_BANDS = 16
+LSH_ROWS = MINHASH_PERMUTATIONS // LSH_BANDS
+# A prime below 2^31, so that (a * x + b) % prime is a universal hash whose product a * x (both below the prime) fits in 64 bits
+MINHASH_PRIME = 2147483647
+
+#region Class Definitions
+class duplicate_index:
+    ''' Finds the exact and near duplicates of a message among the messages of one session.
+    Messages are saved from several threads (priming, prefetching, and the server), so the index is guarded by a lock.
+    '''
+    def __init__(self):
+        self.hashes = {}
+        self.signatures = {}
+        self.bands = {}
+        self.vectors = {}
+        self.lock = threading.Lock()
+
+    def add(self, uuid, speaker, text, vector):
+        ''' Adds a message to the index.
+
+        uuid: the uuid of the memory the message was saved in
+        speaker: the speaker of the message ("User" or "EmployEase")
+        text: the message
+        vector: the embedding of the message, which duplicates of the message reuse
+        '''
+        content_key = (speaker, content_hash(text))
+        signature = minhash_signature(text)
+        with self.lock:
+            self.hashes.setdefault(content_key, uuid)
+            self.vectors[uuid] = np.array(vector, dtype=np.float32)
+            if signature is None:
+                return
+            self.signatures[uuid] = signature
+            for band in band_keys(speaker, signature):
+                self.bands.setdefault(band, []).append(uuid)
+
+    def get_vector(self, uuid):
+        ''' Returns the embedding of a message in the index, or None if the message is not in the index. '''
+        with self.lock:
+            return self.vectors.get(uuid)
+
+    def find(self, speaker, text):
+        ''' Returns the uuid of a message by the same speaker that is an exact or near duplicate of the given message.
+
+        speaker: the speaker of the message
+        text: the message
+        return: the uuid of the original memory, or None if the message is new
+        '''
+        content_key = (speaker, content_hash(text))
+        signature = minhash_signature(text)
+        with self.lock:
+            uuid = self.hashes.get(content_key)
+            if uuid is not None:
+                return uuid
+            if signature is None:
+                return None
+            best_uuid = None
+            best_similarity = duplicate_similarity
+            for band in band_keys(speaker, signature):
+                for candidate in self.bands.get(band, []):
+                    # The fraction of equal MinHash values estimates the Jaccard similarity of the shingles
+                    estimate = float(np.mean(self.signatures[candidate] == signature))
+                    if estimate >= best_similarity:
+                        best_uuid = candidate
+                        best_similarity = estimate
+            return best_uuid
+#endregion
+
+#region Definitions
+def normalize_text(text):
+    ''' Returns the text in lowercase with all whitespace collapsed into single spaces. '''
+    return re.sub(r'\s+', ' ', text.lower()).strip()
+
+def content_hash(text):
+    ''' Returns the SHA-256 hash of the normalized text. '''
+    return hashlib.sha256(normalize_text(text).encode('utf-8')).hexdigest()
+
+def get_shingles(text):
+    ''' Returns the set of word shingles (runs of SHINGLE_SIZE consecutive words) in the text. '''
+    words = re.findall(r'\w+', text.lower())
+    if len(words) < SHINGLE_SIZE:
+        return set([' '.join(words)]) if words != [] else set()
+    return set(' '.join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1))
+
+def minhash_signature(text):
+    ''' Returns the MinHash signature of the text's shingles.
+
+    text: the text to sign
+    return: an array of MINHASH_PERMUTATIONS values, or None if the text has no words
+    '''
+    shingles = get_shingles(text)
+    if len(shingles) == 0:
+        return None
+    hashes = np.array([zlib.crc32(shingle.encode('utf-8')) for shingle in shingles], dtype=np.uint64) % MINHASH_PRIME
+    # Every row applies one permutation to every shingle hash, and keeps the smallest value
+    permuted = (MINHASH_COEFFICIENTS[:, None] * hashes[None, :] + MINHASH_OFFSETS[:, None]) % MINHASH_PRIME
+    return permuted.min(axis=1)
+
+def band_keys(speaker, signature):
+    ''' Returns the LSH bucket keys of a signature. Messages that share a bucket are compared. '''
+    return [(speaker, band, signature[band * LSH_ROWS:(band + 1) * LSH_ROWS].tobytes()) for band in range(LSH_BANDS)]
+
+def get_session_index(session_folder, load_records):
+    ''' Returns the duplicate index of a session in the current workspace, building it from the session's memories the first time.
+
+    session_folder: the name of the session's memory folder, e.g. "Session_1700000000.0"
+    load_records: a function that returns the session's memory records, used only when the index is built
+    return: the duplicate_index of the session
+    '''
+    key = (get_workspace_root(), session_folder)
+    with index_lock:
+        if key not in session_indexes:
+            index = duplicate_index()
+            for record in load_records():
+                # References point at a memory that is already in the index
+                if 'duplicate_of' not in record:
+                    index.add(record['uuid'], record['speaker'], record['message'], record['vector'])
+            session_indexes[key] = index
+        return session_indexes[key]
+
+def discard_session_index(session_folder):
+    ''' Discards the duplicate index of a session in the current workspace, so that it is rebuilt the next time it is needed.
+    Used after memories of the session were deleted.
+
+    session_folder: the name of the session's memory folder
+    '''
+    with index_lock:
+        session_indexes.pop((get_workspace_root(), session_folder), None)
+#endregion
+
+#region Global Variables
+config_object = load_ini(os.getcwd(), "config.ini")
+deduplication_enabled = config_object.getint('Memory', 'deduplicate_messages', fallback=1) == 1
+duplicate_similarity = config_object.getfloat('Memory', 'duplicate_similarity', fallback=0.9)
+# The permutations are fixed, so that signatures stay comparable between runs
+permutation_generator = np.random.default_rng(20240101)
+MINHASH_COEFFICIENTS = permutation_generator.integers(1, MINHASH_PRIME, size=MINHASH_PERMUTATIONS, dtype=np.uint64)
+MINHASH_OFFSETS = permutation_generator.integers(0, MINHASH_PRIME, size=MINHASH_PERMUTATIONS, dtype=np.uint64)
+index_lock = threading.Lock()
+# The duplicate index of every session, keyed by (workspace root, session folder)
+session_indexes = {}
+#endregion
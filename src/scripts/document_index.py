@@ -0,0 +1,241 @@
+'''
+Document Index Module for Employ Ease
+
+This module keeps the documents that ChatGPT is primed with (the resume, the job description, and the company description) in an index that is separate from the conversation memories.
+Instead of remembering a whole document as a single message, each document is split into sections and paragraphs, and every chunk receives its own embedding.
+When the user asks a question, only the chunks that are relevant to that question are added to the prompt.
+
+Key Functionalities:
+- Chunking: Splits a document into semantic chunks (sections or paragraphs) that fit within a token limit.
+- Indexing: Embeds every chunk of a document in one request and saves the chunks to src/internal/documents/{doc_type}_index.json,
+  together with the document's version and content hash.
+- Versioning: When a document is primed again, its chunks are compared with the previous version by content hash. Only new or changed chunks
+  are embedded, unchanged chunks keep their embedding, and chunks that are no longer in the document are retired from the index.
+  The version of a document increases every time the document changes, including when text is only removed.
+- Retrieval: Returns the chunks across all indexed documents that are most similar to a given vector.
+
+Author: Courtney Palmer
+'''
+
+#region Imports
+import os
+import re
+import hashlib
+import threading
+from time import time
+from uuid import uuid4
+import numpy as np
+from src.scripts.file_handler import create_json_file, read_file_content
+from src.scripts.memory import gpt3_embeddings, token_counter
+from src.scripts.workspace import workspace_path, get_workspace_root
+#endregion
+
+DOCUMENT_INDEX_DIRECTORY = os.path.join("src", "internal", "documents")
+CHUNK_TOKEN_LIMIT = 300
+DOCUMENT_LABELS = {
+    "resume": "Resume",
+    "job": "Job Description",
+    "company": "Company Description"
+}
+
+#region Definitions
+def is_section_heading(block):
+    ''' Heuristic function to check if a block of text is a section heading, such as "EXPERIENCE" or "Requirements:".
+
+    block: the block of text to check
+    return: True if the block looks like a section heading, False otherwise
+    '''
+    block = block.strip()
+    if '\n' in block or len(block.split()) > 6:
+        return False
+    return block.isupper() or block.endswith(':')
+
+def split_long_block(block, max_tokens):
+    ''' Splits a block of text that is over the token limit into lines, and then into sentences if a line is still too long.
+
+    block: the block of text to split
+    max_tokens: the maximum number of tokens per piece
+    return: a list of pieces that are each within the token limit where possible
+    '''
+    if token_counter(block, "gpt-3.5-turbo") <= max_tokens:
+        return [block]
+    pieces = []
+    for line in block.split('\n'):
+        line = line.strip()
+        if line == "":
+            continue
+        if token_counter(line, "gpt-3.5-turbo") <= max_tokens:
+            pieces.append(line)
+        else:
+            pieces.extend(sentence for sentence in re.split(r'(?<=[.!?])\s+', line) if sentence != "")
+    return pieces
+
+def split_into_chunks(text, max_tokens=CHUNK_TOKEN_LIMIT):
+    ''' Splits a document into semantic chunks. A new chunk is started at every section heading, or when the current chunk would go over the token limit.
+
+    text: the text of the document
+    max_tokens: the maximum number of tokens per chunk
+    return: a list of chunks
+    '''
+    blocks = [block.strip() for block in re.split(r'\n\s*\n', text) if block.strip() != ""]
+    # Documents read from PDF files often have no blank lines, so fall back to splitting on lines
+    if len(blocks) == 1:
+        blocks = [line.strip() for line in text.split('\n') if line.strip() != ""]
+
+    chunks = []
+    current = ""
+    current_tokens = 0
+    for block in blocks:
+        for piece in split_long_block(block, max_tokens):
+            piece_tokens = token_counter(piece, "gpt-3.5-turbo")
+            if current != "" and (is_section_heading(piece) or current_tokens + piece_tokens > max_tokens):
+                chunks.append(current)
+                current = ""
+                current_tokens = 0
+            current = f"{current}\n{piece}" if current != "" else piece
+            current_tokens += piece_tokens
+    if current != "":
+        chunks.append(current)
+    return chunks
+
+def get_index_filepath(doc_type):
+    ''' Returns the path to the index file of the given document type.
+
+    doc_type: the type of document ('resume', 'company', 'job')
+    return: the path to the index file
+    '''
+    return workspace_path(DOCUMENT_INDEX_DIRECTORY, f"{doc_type}_index.json")
+
+def chunk_hash(chunk):
+    ''' Returns the content hash of a chunk. Whitespace is normalized, so a chunk that was only re-wrapped keeps its hash. '''
+    return hashlib.sha256(' '.join(chunk.split()).encode('utf-8')).hexdigest()
+
+def document_hash(chunk_hashes):
+    ''' Returns the content hash of a whole document from the hashes of its chunks, in order. '''
+    return hashlib.sha256('\n'.join(chunk_hashes).encode('utf-8')).hexdigest()
+
+def get_document_version(doc_type):
+    ''' Returns the version of the indexed document of the given type. The version increases every time the document changes.
+
+    doc_type: the type of document ('resume', 'company', 'job')
+    return: the version, or 0 if the document has not been indexed
+    '''
+    return load_index_file(doc_type)['version']
+
+def index_document(doc_type, text):
+    ''' Splits a document into chunks and replaces the previous index of that document type with them.
+    Chunks that are unchanged since the previous version keep their embedding, so only new or changed chunks are embedded,
+    and chunks of the previous version that are no longer in the document are retired.
+
+    doc_type: the type of document ('resume', 'company', 'job')
+    text: the text of the document
+    return: a tuple of (the list of chunk records that were indexed, True if the document changed since it was last indexed).
+            Chunks that were embedded for this version have the document's new 'version'.
+    '''
+    chunks = split_into_chunks(text)
+    hashes = [chunk_hash(chunk) for chunk in chunks]
+    new_hash = document_hash(hashes)
+    previous_index = load_index_file(doc_type)
+    previous = previous_index['chunks']
+    previous_hashes = [record.get('hash') or chunk_hash(record['text']) for record in previous]
+    # Nothing is embedded or written if the document did not change
+    if previous != [] and (previous_index['hash'] or document_hash(previous_hashes)) == new_hash:
+        return previous, False
+
+    previous_by_hash = dict(zip(previous_hashes, previous))
+    version = previous_index['version'] + 1
+    new_chunks = {}
+    for chunk, content_hash in zip(chunks, hashes):
+        if content_hash not in previous_by_hash:
+            new_chunks[content_hash] = chunk
+    vectors = dict(zip(new_chunks.keys(), gpt3_embeddings(list(new_chunks.values()))))
+    indexed_at = time()
+    records = []
+    for chunk_index, (chunk, content_hash) in enumerate(zip(chunks, hashes)):
+        if content_hash in previous_by_hash:
+            records.append(dict(previous_by_hash[content_hash], chunk_index=chunk_index, text=chunk, hash=content_hash))
+        else:
+            records.append({'uuid': str(uuid4()), 'doc_type': doc_type, 'chunk_index': chunk_index, 'time': indexed_at, 'text': chunk,
+                            'vector': vectors[content_hash], 'hash': content_hash, 'version': version})
+
+    index = {'version': version, 'hash': new_hash, 'chunks': records}
+    create_json_file(get_index_filepath(doc_type), index)
+    root = get_workspace_root()
+    with index_lock:
+        index_cache[(root, doc_type)] = index
+        matrix_cache.pop(root, None)
+    return records, True
+
+def load_index_file(doc_type):
+    ''' Returns the index of the given document type, reading the index file only the first time.
+
+    doc_type: the type of document ('resume', 'company', 'job')
+    return: a dictionary with the document's 'version', its content 'hash', and its 'chunks'
+    '''
+    key = (get_workspace_root(), doc_type)
+    with index_lock:
+        if key not in index_cache:
+            filepath = get_index_filepath(doc_type)
+            index = read_file_content(filepath) if os.path.exists(filepath) else []
+            # Index files written before documents had a version are a plain list of chunks
+            if isinstance(index, list):
+                index = {'version': max((record.get('version', 0) for record in index), default=0), 'hash': None, 'chunks': index}
+            index_cache[key] = index
+        return index_cache[key]
+
+def load_document_index(doc_type):
+    ''' Returns the chunk records of the given document type, reading the index file only the first time.
+
+    doc_type: the type of document ('resume', 'company', 'job')
+    return: the list of chunk records, or an empty list if the document has not been indexed
+    '''
+    return load_index_file(doc_type)['chunks']
+
+def get_index_matrix():
+    ''' Returns every indexed chunk together with a matrix of their normalized vectors, so that all chunks can be scored with one matrix product.
+
+    return: a tuple of (list of chunk records, numpy matrix with one row per chunk)
+    '''
+    root = get_workspace_root()
+    with index_lock:
+        if root not in matrix_cache:
+            records = []
+            for doc_type in DOCUMENT_LABELS:
+                records.extend(load_document_index(doc_type))
+            matrix = np.array([record['vector'] for record in records], dtype=np.float32)
+            if len(records) > 0:
+                matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+            matrix_cache[root] = (records, matrix)
+        return matrix_cache[root]
+
+def fetch_document_chunks(vector, count):
+    ''' Returns the indexed chunks that are most similar to the given vector.
+
+    vector: the vector to compare to
+    count: the number of chunks to return
+    return: the top n chunk records, most similar first
+    '''
+    records, matrix = get_index_matrix()
+    if len(records) == 0:
+        return []
+    query = np.asarray(vector, dtype=np.float32)
+    scores = matrix @ (query / np.linalg.norm(query))
+    top = np.argsort(-scores)[:count]
+    return [records[i] for i in top]
+
+def format_document_chunks(chunks):
+    ''' Formats the given chunks for use within a prompt, labelling each chunk with the document it came from.
+
+    chunks: the chunk records to format
+    return: the formatted chunks
+    '''
+    return '\n\n'.join(f"[{DOCUMENT_LABELS.get(chunk['doc_type'], chunk['doc_type'])}] {chunk['text']}" for chunk in chunks)
+#endregion
+
+#region Global Variables
+# Index files are read once and kept in memory. Priming may re-index documents from background threads.
+# index_cache is keyed by (workspace root, document type) and matrix_cache by workspace root.
+index_lock = threading.RLock()
+index_cache = {}
+matrix_cache = {}
+#endregion
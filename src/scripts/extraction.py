@@ -0,0 +1,164 @@
+'''
+Extraction Module for Employ Ease
+
+This module is responsible for extracting the Single Source of Truth (SSOT) fields that are derived from the documents the user provides:
+    - Job Name (from the job description)
+    - Company Name (from the company description)
+    - Company Website (from the company description)
+
+Key Functionalities:
+- Local Extraction: Finds the fields with heuristics such as "Job Title:" lines, URLs, and "About <Company>" patterns, without calling the API.
+- Structured Extraction: Any field that could not be found locally is requested from ChatGPT with a single JSON mode completion.
+  The request is not part of the conversation, so nothing is embedded, saved, or summarized.
+
+Author: Courtney Palmer
+'''
+
+#region Imports
+import re
+from urllib.parse import urlsplit
+from src.scripts.memory import gpt3_json_completion
+#endregion
+
+# The fields that can be extracted from each type of document
+EXTRACTED_FIELDS = {
+    "job": ["job_name"],
+    "company": ["company_name", "company_website"]
+}
+FIELD_DESCRIPTIONS = {
+    "job_name": "the job title from the job description",
+    "company_name": "the name of the company from the company description",
+    "company_website": "the URL of the company's official website. Use your own knowledge if the website is not in the text"
+}
+# Documents are truncated before being sent, since the fields are almost always found near the start
+EXTRACTION_CHARACTER_LIMIT = 8000
+JOB_TITLE_WORDS = ["engineer", "developer", "manager", "analyst", "designer", "scientist", "specialist", "coordinator",
+                   "director", "intern", "consultant", "administrator", "architect", "lead", "officer", "associate",
+                   "assistant", "representative", "technician", "programmer", "accountant", "nurse", "teacher", "writer"]
+NOT_COMPANY_NAMES = ["us", "the", "our", "this", "you", "your", "company", "role", "position", "job", "team", "we"]
+# Job boards, applicant tracking systems, and social networks, whose URLs often contain the company name but are not its website
+NOT_COMPANY_HOSTS = ["linkedin.com", "indeed.com", "glassdoor.com", "ziprecruiter.com", "monster.com", "simplyhired.com", "dice.com",
+                     "wellfound.com", "angel.co", "greenhouse.io", "lever.co", "myworkdayjobs.com", "workday.com", "smartrecruiters.com",
+                     "icims.com", "jobvite.com", "ashbyhq.com", "bamboohr.com", "facebook.com", "twitter.com", "x.com", "instagram.com",
+                     "youtube.com", "tiktok.com", "github.com", "crunchbase.com", "wikipedia.org", "bloomberg.com"]
+
+#region Definitions
+def find_labelled_value(text, labels):
+    ''' Finds the value of a line such as "Job Title: Software Engineer" or "Job Title - Software Engineer".
+    A hyphen only separates the label from the value when it has spaces on both sides, so that lines such as "Company-wide benefits" are not matched.
+
+    text: the text to search
+    labels: the regular expression alternatives for the label
+    return: the value, or an empty string if there is no such line
+    '''
+    match = re.search(rf'^[ \t]*(?:{labels})(?:[ \t]*:|[ \t]+[-\u2013\u2014][ \t]+)[ \t]*(.+?)[ \t]*$', text, re.IGNORECASE | re.MULTILINE)
+    return match.group(1) if match else ""
+
+def extract_job_name_locally(text):
+    ''' Finds the job title with heuristics.
+
+    text: the job description
+    return: the job title, or an empty string if it could not be found confidently
+    '''
+    # Lines such as "Position: Full-time" describe the job rather than name it, so they are only used when there is no job title line
+    for labels in [r'job[ \t]*title|title', r'position|role']:
+        job_name = find_labelled_value(text, labels)
+        if job_name != "":
+            return job_name
+    # Many job descriptions start with the job title on a line of its own
+    for line in text.split('\n'):
+        line = line.strip()
+        if line == "":
+            continue
+        words = line.split()
+        if len(words) <= 8 and not line.endswith(('.', ':', '!', '?')) and any(word.lower().strip(',()') in JOB_TITLE_WORDS for word in words):
+            return line
+        return ""
+    return ""
+
+def extract_company_name_locally(text):
+    ''' Finds the company name with heuristics.
+
+    text: the company description
+    return: the company name, or an empty string if it could not be found confidently
+    '''
+    company_name = find_labelled_value(text, r'company(?:\s*name)?|employer|organization')
+    if company_name != "":
+        return company_name
+    capitalized_name = r"([A-Z][\w&'.\-]*(?:[ \t]+(?:[A-Z][\w&'.\-]*|&|of)){0,4})"
+    for pattern in [rf'\bAbout[ \t]+{capitalized_name}', rf'\bAt[ \t]+{capitalized_name},\s+we\b']:
+        for match in re.finditer(pattern, text):
+            company_name = match.group(1).strip(" .")
+            # Skip headings such as "About Us" or "About The Role"
+            if company_name.split()[0].lower() not in NOT_COMPANY_NAMES:
+                return company_name
+    return ""
+
+def get_url_host(url):
+    ''' Returns the host of a URL in lowercase, without a leading "www.", e.g. "initech.com" for "https://www.Initech.com/about". '''
+    host = urlsplit(url if '://' in url else f"http://{url}").hostname or ""
+    return host[len("www."):] if host.startswith("www.") else host
+
+def extract_company_website_locally(text, company_name):
+    ''' Finds the company website with heuristics. Only URLs whose host resembles the company name are used,
+    and URLs of job boards and social networks are skipped, even if they contain the company name (e.g. linkedin.com/company/initech).
+
+    text: the company description
+    company_name: the company name, if known
+    return: the website, or an empty string if no URL in the text resembles the company name
+    '''
+    urls = [url.rstrip('.,;') for url in re.findall(r'(?:https?://|\bwww\.)[^\s)<>\]"\']+', text)]
+    name_slug = re.sub(r'[^a-z0-9]', '', company_name.lower())
+    if name_slug == "":
+        return ""
+    for url in urls:
+        host = get_url_host(url)
+        if any(host == other or host.endswith(f".{other}") for other in NOT_COMPANY_HOSTS):
+            continue
+        if name_slug[:8] in re.sub(r'[^a-z0-9]', '', host):
+            return url
+    # Other URLs, such as job boards, social media, or EEO statements, are not a confident match, so the website is requested instead
+    return ""
+
+def extract_fields_locally(info_type, text):
+    ''' Extracts the fields of the given document type with heuristics only.
+
+    info_type: the type of document ('company', 'job')
+    text: the text of the document
+    return: a dictionary of the fields that were found
+    '''
+    fields = {}
+    if info_type == "job":
+        fields["job_name"] = extract_job_name_locally(text)
+    elif info_type == "company":
+        fields["company_name"] = extract_company_name_locally(text)
+        fields["company_website"] = extract_company_website_locally(text, fields["company_name"])
+    return {field: value for field, value in fields.items() if value != ""}
+
+def extract_application_fields(documents, local_only=False):
+    ''' Extracts the SSOT fields of the given documents. Fields are found locally where possible,
+    and any remaining fields are requested from ChatGPT in a single JSON mode completion.
+
+    documents: a dictionary of {info_type: text}, e.g. {"company": company_description}
+    local_only: if True, fields that could not be found locally are left empty instead of being requested
+    return: a dictionary of {field: value} with every field of the given documents. Fields that could not be found are empty strings.
+    raises: ServiceUnavailable if the remaining fields could not be requested
+    '''
+    fields = {}
+    missing_fields = []
+    for info_type, text in documents.items():
+        local_fields = extract_fields_locally(info_type, text)
+        fields.update(local_fields)
+        missing_fields.extend(field for field in EXTRACTED_FIELDS.get(info_type, []) if field not in local_fields)
+
+    if local_only:
+        fields.update({field: "" for field in missing_fields})
+    elif missing_fields != []:
+        field_list = '\n'.join(f'- "{field}": {FIELD_DESCRIPTIONS[field]}' for field in missing_fields)
+        document_list = '\n\n'.join(f"{info_type.upper()} DESCRIPTION:\n{text[:EXTRACTION_CHARACTER_LIMIT]}" for info_type, text in documents.items())
+        response = gpt3_json_completion(f"Reply with a JSON object that has exactly the following keys. Use an empty string for any value you cannot determine.\n{field_list}\n\n{document_list}")
+        for field in missing_fields:
+            value = response.get(field, "")
+            fields[field] = value.strip() if isinstance(value, str) else ""
+    return fields
+#endregion
@@ -22,25 +22,29 @@ import textract
 
 #region Definitions
 def create_empty_ini_file(filepath, filename):
-    if not os.path.exists(filepath):
-        # Create a new config parser object
-        config = configparser.ConfigParser()
+    ''' Creates the given INI file with its default contents, if it does not exist yet.
+    
+    filepath: the folder to create the file in
+    filename: the name of the ini file to create
+    '''
+    if not os.path.exists(os.path.join(filepath, filename)):
+        # Create a new config parser object. Comments are written as options without a value, so keep their case as is.
+        config = configparser.ConfigParser(allow_no_value=True)
+        config.optionxform = str
         match filename:
             case "config.ini":
                 # Add sections and settings
                 config['Communication'] = {'APIKey': 'Your API Key Here'}
+                config['Settings'] = {}
                 config.set('Settings', '; 0 = False, 1 = True')
                 config.set('Settings', '; If you want ChatGPT to load your Resume, Job Description, and Company Description on launch, set this to 1')
-                config['Settings'] = {
-                    'load_on_launch': '0',
-                }
+                config.set('Settings', 'load_on_launch', '0')
+                config['filepaths_to_load_on_launch'] = {}
                 config.set('filepaths_to_load_on_launch', '; If you want ChatGPT to load your Resume, Job Description, and Company Description on launch, ensure that load_on_launch is set to 1')
                 config.set('filepaths_to_load_on_launch', '; Supported filetypes are: TXT, PDF, JSON, DOC, and DOCX')
-                config['filepaths_to_load_on_launch'] = {
-                    'resume_path': 'C:/your/path/to/resume.txt',
-                    'job_path': 'C:/your/path/to/job_description.txt',
-                    'company_path': 'C:/your/path/to/company_description.txt',
-                }
+                config.set('filepaths_to_load_on_launch', 'resume_path', 'C:/your/path/to/resume.txt')
+                config.set('filepaths_to_load_on_launch', 'job_path', 'C:/your/path/to/job_description.txt')
+                config.set('filepaths_to_load_on_launch', 'company_path', 'C:/your/path/to/company_description.txt')
                 config['Theme'] = {
                     'os_color': 'green',
                     'user_color': 'violet',
@@ -62,15 +66,15 @@ def create_empty_ini_file(filepath, filename):
             case "prompts.ini":
                 config['Job Description'] = {
                     '1': "Provide a brief summary of <company_name> job description for <job_name>.",
-                    '2': "Identify the main keywords in <company_name> job description for <job_name>.",
+                    '2': "Group the main keywords of <company_name> job description for <job_name> by theme, using this keyword analysis: <keyword_analysis>",
                     '3': "Provide me with a detailed outline of the core responsibilities, qualifications, and skills required in in <company_name> job description for <job_name>.",
-                    '4': "Using the provided job description, give me a list of 10 skills I should highlight on my resume."
+                    '4': "Using this keyword analysis of my resume against the job description, give me a list of 10 skills I should highlight on my resume: <keyword_analysis>"
                     }
                 config['Resume'] = {
                     '1': "Tailor my resume to the job description for <job_name>.",
                     '2': "What can I do to make my resume stand out from other candidates for <job_name>?",
-                    '3': "What are the most important skills I should highlight on my resume for <job_name>?",
-                    '4': "What are the most important keywords for applicant tracking systems to include in my resume based on <company_name>s job description for <job_name>?"
+                    '3': "Based on this keyword analysis, what are the most important skills I should highlight on my resume for <job_name>? <keyword_analysis>",
+                    '4': "Which missing keywords of <company_name>s job description for <job_name> should I add to my resume for applicant tracking systems? <keyword_analysis>"
                     }
                 config['Cover Letter'] = {
                     '1': "Provide a brief summary of <company_name> job description for <job_name>.",
@@ -91,7 +95,8 @@ def create_empty_ini_file(filepath, filename):
                     '4': "How can I negotiate a higher salary without coming off as demanding?"
                     }
                 
-        with open(filepath + f"\\{filename}", 'w') as configfile:
+        os.makedirs(filepath, exist_ok=True)
+        with open(os.path.join(filepath, filename), 'w', encoding='utf-8') as configfile:
             config.write(configfile)   
 
 def read_file_content(filepath):
@@ -106,6 +111,7 @@ def read_file_content(filepath):
 
     # Extract file extension
     _, file_extension = os.path.splitext(filepath)
+    file_extension = file_extension.lower()
 
     try:
         if file_extension == '.txt':
@@ -179,21 +185,21 @@ def create_json_file(filepath, payload):
     filepath: the path to the file to save
     payload: the JSON payload to save to the file
     '''
-    if not os.path.exists(os.path.dirname(filepath)):
-        os.makedirs(os.path.dirname(filepath))
+    os.makedirs(os.path.dirname(filepath), exist_ok=True)
     with open(filepath, 'w', encoding='utf-8') as outfile:
         json.dump(payload, outfile, ensure_ascii=False, sort_keys=True, indent=2)
 
 def load_ini(file_path, file_name):
     ''' Loads the given INI file.
     
+    file_path: the folder that contains the ini file
     file_name: the name of the ini file to load
     return: the configparser object
     '''
     # Check if file exists
-    if not os.path.exists(f"{file_path}\\{file_name}"):
-        create_empty_ini_file(os.getcwd(), file_name)
+    if not os.path.exists(os.path.join(file_path, file_name)):
+        create_empty_ini_file(file_path, file_name)
     parser = configparser.ConfigParser()
-    parser.read(f"{file_path}\\{file_name}")
+    parser.read(os.path.join(file_path, file_name), encoding='utf-8')
     return parser
 #endregion
@@ -0,0 +1,74 @@
+'''
+HTTP Protocol Module for Employ Ease
+
+This module implements the small subset of HTTP/1.1 that server mode needs: JSON requests and responses over keep-alive connections.
+It only depends on the standard library, so that it can be used before any Employ Ease configuration is loaded (e.g. by the load test's fake backend).
+
+Author: Courtney Palmer
+'''
+
+#region Imports
+import json
+import asyncio
+#endregion
+
+MAX_REQUEST_BODY_BYTES = 5 * 1024 * 1024
+HTTP_STATUS_TEXT = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    409: "Conflict",
+    413: "Payload Too Large",
+    500: "Internal Server Error",
+    503: "Service Unavailable"
+}
+
+#region Definitions
+async def handle_http_connection(reader, writer, handle_request):
+    ''' Reads HTTP/1.1 requests from a connection and writes back JSON responses. Connections are kept alive unless the client asks otherwise.
+
+    reader: the asyncio stream reader of the connection
+    writer: the asyncio stream writer of the connection
+    handle_request: a coroutine function of (method, path, body) that returns (status, payload)
+    '''
+    try:
+        while True:
+            request_line = await reader.readline()
+            if not request_line:
+                break
+            try:
+                method, path, version = request_line.decode('latin-1').split()
+            except ValueError:
+                break
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                headers[name.strip().lower()] = value.strip()
+
+            content_length = int(headers.get('content-length', 0))
+            if content_length > MAX_REQUEST_BODY_BYTES:
+                status, payload = 413, {"error": "The request body is too large."}
+                headers['connection'] = 'close'
+            else:
+                body = await reader.readexactly(content_length) if content_length > 0 else b''
+                status, payload = await handle_request(method, path, body)
+
+            keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+            response_body = json.dumps(payload).encode('utf-8')
+            writer.write(
+                f"HTTP/1.1 {status} {HTTP_STATUS_TEXT.get(status, '')}\r\n"
+                f"Content-Type: application/json\r\n"
+                f"Content-Length: {len(response_body)}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode('latin-1') + response_body)
+            await writer.drain()
+            if not keep_alive:
+                break
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+#endregion
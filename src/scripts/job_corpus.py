@@ -0,0 +1,196 @@
+'''
+Job Corpus Module for Employ Ease
+
+This module ranks a whole folder of saved job postings against the user's resume, so that the most promising postings can be found
+in seconds instead of loading and discussing each posting one at a time.
+
+Key Functionalities:
+- Parallel Reading: The postings are read concurrently with file_handler.read_file_content, so any supported file type can be used.
+- Batched Embedding: Postings are embedded in batches, with one API request per batch instead of one per posting.
+- Persistent Index: Embeddings are saved to src/internal/job_corpus, together with each file's size, modification time, and content hash.
+  Only new or changed postings are read and embedded again, and postings whose file was deleted are removed from the index.
+- Ranking: Every posting is compared with the resume in a single matrix product.
+
+Author: Courtney Palmer
+'''
+
+#region Imports
+import os
+import json
+import hashlib
+import threading
+import numpy as np
+from numpy.linalg import norm
+from src.scripts.file_handler import read_file_content, create_json_file
+from src.scripts.memory import gpt3_embedding, gpt3_embeddings
+from src.scripts.workspace import workspace_path
+from src.scripts.extraction import extract_job_name_locally
+from src.scripts.profiler import profiled_executor
+#endregion
+
+JOB_CORPUS_DIRECTORY = os.path.join("src", "internal", "job_corpus")
+SUPPORTED_EXTENSIONS = ('.txt', '.json', '.pdf', '.doc', '.docx')
+EMBEDDING_BATCH_SIZE = 32
+# Postings are truncated before they are embedded, so that every posting fits within the embedding model's input limit
+EMBEDDING_CHARACTER_LIMIT = 20000
+READ_WORKERS = 8
+
+#region Definitions
+def get_job_corpus_filepaths():
+    ''' Returns the paths to the index and vector files of the job corpus in the current workspace. '''
+    folder = workspace_path(JOB_CORPUS_DIRECTORY)
+    return os.path.join(folder, "index.json"), os.path.join(folder, "vectors.npy")
+
+def load_job_corpus():
+    ''' Loads the job corpus index of the current workspace.
+
+    return: a tuple of (the index dictionary, the matrix of posting vectors). The index holds 'postings', a dictionary of
+            {filepath: {'size', 'modified', 'hash', 'row', 'job_name'}}, and 'resume', the hash and vector of the last ranked resume.
+    '''
+    index_filepath, vectors_filepath = get_job_corpus_filepaths()
+    if not os.path.exists(index_filepath) or not os.path.exists(vectors_filepath):
+        return {'postings': {}, 'resume': {}}, np.zeros((0, 0), dtype=np.float32)
+    with open(index_filepath, 'r', encoding='utf-8') as f:
+        index = json.load(f)
+    return index, np.load(vectors_filepath)
+
+def save_job_corpus(index, vectors):
+    ''' Saves the job corpus index of the current workspace. The vectors are written first, so the index never refers to missing rows. '''
+    index_filepath, vectors_filepath = get_job_corpus_filepaths()
+    os.makedirs(os.path.dirname(vectors_filepath), exist_ok=True)
+    np.save(vectors_filepath + ".tmp.npy", vectors)
+    os.replace(vectors_filepath + ".tmp.npy", vectors_filepath)
+    create_json_file(index_filepath, index)
+
+def list_job_postings(directory):
+    ''' Returns the paths of every supported file in a directory and its subdirectories. '''
+    postings = []
+    for folder, _, files in os.walk(directory):
+        for file in files:
+            if os.path.splitext(file)[1].lower() in SUPPORTED_EXTENSIONS:
+                postings.append(os.path.abspath(os.path.join(folder, file)))
+    return sorted(postings)
+
+def read_job_posting(filepath):
+    ''' Reads a job posting as text, or returns None if it could not be read. '''
+    try:
+        content = read_file_content(filepath)
+    except Exception:
+        return None
+    if not isinstance(content, str):
+        content = json.dumps(content)
+    return content
+
+def content_hash(text):
+    ''' Returns the SHA-256 hash of a posting's text, used to tell whether a posting changed. '''
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+def index_job_postings(directory, progress=None):
+    ''' Brings the job corpus index up to date with a directory of job postings. Only new and changed postings are read and embedded.
+
+    directory: the directory that holds the job postings
+    progress: an optional function that is called with a message as indexing progresses
+    return: a dictionary with the number of postings that were 'added', 'updated', 'unchanged', 'removed', and 'failed' to read
+    '''
+    with corpus_lock:
+        index, vectors = load_job_corpus()
+        postings = index['postings']
+        filepaths = list_job_postings(directory)
+        directory = os.path.abspath(directory)
+        counts = {'added': 0, 'updated': 0, 'unchanged': 0, 'removed': 0, 'failed': 0}
+
+        # A posting only has to be read again if its size or modification time changed
+        changed = []
+        for filepath in filepaths:
+            stat = os.stat(filepath)
+            entry = postings.get(filepath)
+            if entry is not None and entry['size'] == stat.st_size and entry['modified'] == stat.st_mtime:
+                counts['unchanged'] += 1
+            else:
+                changed.append((filepath, stat))
+
+        if progress is not None and changed != []:
+            progress(f"Reading {len(changed)} new or changed postings...")
+        with profiled_executor(max_workers=READ_WORKERS, thread_name_prefix="corpus") as executor:
+            contents = list(executor.map(read_job_posting, [filepath for filepath, _ in changed]))
+
+        to_embed = []
+        for (filepath, stat), content in zip(changed, contents):
+            if content is None or content.strip() == "":
+                counts['failed'] += 1
+                continue
+            entry = postings.get(filepath)
+            new_entry = {'size': stat.st_size, 'modified': stat.st_mtime, 'hash': content_hash(content),
+                         'row': -1, 'job_name': extract_job_name_locally(content)}
+            # A file that was saved again without changes keeps its embedding
+            if entry is not None and entry['hash'] == new_entry['hash']:
+                new_entry['row'] = entry['row']
+                postings[filepath] = new_entry
+                counts['unchanged'] += 1
+                continue
+            counts['updated' if entry is not None else 'added'] += 1
+            postings[filepath] = new_entry
+            to_embed.append((filepath, content))
+
+        # Postings in this directory whose file was deleted are removed
+        present = set(filepaths)
+        for filepath in list(postings.keys()):
+            if filepath.startswith(directory + os.sep) and filepath not in present:
+                del postings[filepath]
+                counts['removed'] += 1
+
+        new_vectors = []
+        for start in range(0, len(to_embed), EMBEDDING_BATCH_SIZE):
+            batch = to_embed[start:start + EMBEDDING_BATCH_SIZE]
+            if progress is not None:
+                progress(f"Embedding postings {start + 1}-{start + len(batch)} of {len(to_embed)}...")
+            new_vectors.extend(gpt3_embeddings([content[:EMBEDDING_CHARACTER_LIMIT] for _, content in batch]))
+
+        # Rebuild the matrix so that it only holds the rows of postings that are still in the index
+        rows = []
+        for filepath, entry in postings.items():
+            if entry['row'] >= 0:
+                rows.append(vectors[entry['row']])
+                entry['row'] = len(rows) - 1
+        for (filepath, _), vector in zip(to_embed, new_vectors):
+            rows.append(np.asarray(vector, dtype=np.float32))
+            postings[filepath]['row'] = len(rows) - 1
+        dimensions = len(rows[0]) if rows else 0
+        save_job_corpus(index, np.array(rows, dtype=np.float32).reshape(len(rows), dimensions))
+        return counts
+
+def rank_job_postings(resume, directory=None, count=None):
+    ''' Ranks the indexed job postings by how similar they are to the resume. All postings are scored in a single matrix product.
+
+    resume: the text of the resume
+    directory: if given, only postings within this directory are ranked
+    count: the number of postings to return, or None to return all of them
+    return: a list of {'filepath', 'job_name', 'score'}, best match first
+    '''
+    with corpus_lock:
+        index, vectors = load_job_corpus()
+        postings = [(filepath, entry) for filepath, entry in index['postings'].items() if entry['row'] >= 0]
+        if directory is not None:
+            directory = os.path.abspath(directory)
+            postings = [(filepath, entry) for filepath, entry in postings if filepath.startswith(directory + os.sep)]
+        if postings == []:
+            return []
+
+        # The resume's embedding is kept in the index, so it is only requested again when the resume changes
+        resume_hash = content_hash(resume)
+        if index['resume'].get('hash') != resume_hash:
+            index['resume'] = {'hash': resume_hash, 'vector': gpt3_embedding(resume[:EMBEDDING_CHARACTER_LIMIT])}
+            save_job_corpus(index, vectors)
+        resume_vector = np.asarray(index['resume']['vector'], dtype=np.float32)
+
+    matrix = vectors[[entry['row'] for _, entry in postings]]
+    scores = (matrix @ resume_vector) / np.maximum(norm(matrix, axis=1) * norm(resume_vector), 1e-12)
+    ranked = [{'filepath': postings[i][0], 'job_name': postings[i][1]['job_name'], 'score': float(scores[i])} for i in np.argsort(-scores, kind='stable')]
+    if count is not None:
+        ranked = ranked[:count]
+    return ranked
+#endregion
+
+#region Global Variables
+corpus_lock = threading.Lock()
+#endregion
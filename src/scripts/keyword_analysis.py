@@ -0,0 +1,184 @@
+'''
+Keyword Analysis Module for Employ Ease
+
+This module compares the keywords of the job description with the resume locally, without calling ChatGPT.
+Finding the keywords of a job posting is mostly lexical analysis, so it can be done in milliseconds instead of a full round trip to the API.
+
+Key Functionalities:
+- Keyword Weights: The terms (words and two-word phrases) of the job description are weighted with BM25 against a bundled background corpus
+  of generic job postings (src/internal/keyword_corpus.txt), so that words every posting uses get a low weight and words specific to this job get a high weight.
+- Gap Analysis: The top keywords are split into the ones that are matched by the resume and the ones that are missing from it.
+- Compact Context: The result can be formatted as a short paragraph, which is given to ChatGPT instead of the raw documents,
+  and can be used in prompts.ini with the <keyword_analysis> placeholder.
+
+Author: Courtney Palmer
+'''
+
+#region Imports
+import os
+import re
+import threading
+from collections import Counter
+from functools import lru_cache
+import numpy as np
+#endregion
+
+# The background corpus is bundled with the code, so it is found relative to this file rather than the working directory
+KEYWORD_CORPUS_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "internal", "keyword_corpus.txt")
+KEYWORD_COUNT = 20
+# BM25 parameters: BM25_K1 limits how much repeating a term increases its weight, BM25_B normalizes for the length of the document
+BM25_K1 = 1.2
+BM25_B = 0.75
+STOP_WORDS = set('''
+a about above after again against all also am an and any are as at be because been before being below between both but by can could
+did do does doing down during each etc few for from further had has have having he her here hers herself him himself his how i if in
+into is it its itself just may me might more most must my myself no nor not now of off on once only or other our ours ourselves out
+over own per plus same shall she should so some such than that the their theirs them themselves then there these they this those
+through to too under until up upon us very via was we well were what when where which while who whom why will with within without
+would you your yours yourself yourselves able ability including include includes new one two three years year e.g i.e
+need needs needed require requires required requirement requirements prefer preferred looking seeking ideal candidate candidates
+role position job responsibilities responsibility qualifications qualification please apply applicant applicants opportunity
+'''.split())
+# Keywords weighing less than this fraction of the top keyword are too generic to report
+MIN_RELATIVE_WEIGHT = 0.1
+
+#region Definitions
+def normalize_term(word):
+    ''' Returns the word with a plural 's' removed, so that "skills" matches "skill". '''
+    if len(word) > 4 and word.endswith('s') and not word.endswith(('ss', 'us', 'is')):
+        return word[:-1]
+    return word
+
+def tokenize(text):
+    ''' Splits text into lowercase words. Words such as "c++", "c#", and "node.js" are kept whole.
+
+    text: the text to split
+    return: the list of words, in order
+    '''
+    return re.findall(r'[a-z0-9][a-z0-9+#.\-]*[a-z0-9+#]|[a-z]', text.lower())
+
+def extract_terms(text):
+    ''' Returns the terms of the text: every word that is not a stop word or a number, and every pair of such words that appear next to each other.
+
+    text: the text to extract the terms from
+    return: a tuple of (a Counter of {term: count}, a dictionary of {term: the way the term was first written in the text})
+    '''
+    counts = Counter()
+    surface_forms = {}
+    previous = None
+    for word in tokenize(text):
+        if word in STOP_WORDS or not re.search(r'[a-z]', word):
+            previous = None
+            continue
+        term = normalize_term(word)
+        counts[term] += 1
+        surface_forms.setdefault(term, word)
+        if previous is not None:
+            phrase = f"{previous[0]} {term}"
+            counts[phrase] += 1
+            surface_forms.setdefault(phrase, f"{previous[1]} {word}")
+        previous = (term, word)
+    return counts, surface_forms
+
+def load_keyword_corpus():
+    ''' Reads the background corpus and counts the number of documents each term appears in. The corpus is only read once.
+
+    return: a tuple of (a dictionary of {term: document frequency}, the number of documents, the average document length in words)
+    '''
+    global keyword_corpus
+    with corpus_lock:
+        if keyword_corpus is not None:
+            return keyword_corpus
+        documents = []
+        if os.path.exists(KEYWORD_CORPUS_PATH):
+            with open(KEYWORD_CORPUS_PATH, 'r', encoding='utf-8') as f:
+                lines = [line for line in f.read().splitlines() if not line.startswith('#')]
+            documents = [paragraph for paragraph in re.split(r'\n\s*\n', '\n'.join(lines)) if paragraph.strip() != ""]
+        term_counts = [extract_terms(document)[0] for document in documents]
+        vocabulary = sorted(set(term for counts in term_counts for term in counts))
+        column = {term: i for i, term in enumerate(vocabulary)}
+        # A document-term matrix of which terms appear in which documents, summed per column to get each term's document frequency
+        occurrences = np.zeros((len(documents), len(vocabulary)), dtype=np.int32)
+        for row, counts in enumerate(term_counts):
+            occurrences[row, [column[term] for term in counts]] = 1
+        frequencies = occurrences.sum(axis=0)
+        document_frequency = {term: int(frequencies[i]) for term, i in column.items()}
+        lengths = [len(tokenize(document)) for document in documents]
+        keyword_corpus = (document_frequency, len(documents), float(np.mean(lengths)) if lengths else 1.0)
+        return keyword_corpus
+
+def weigh_terms(counts):
+    ''' Weighs the terms of a document with BM25 against the background corpus. The document itself counts as one more document of the corpus.
+
+    counts: a Counter of {term: count} for the document
+    return: a tuple of (the list of terms, a NumPy array of their weights)
+    '''
+    document_frequency, corpus_size, average_length = load_keyword_corpus()
+    terms = list(counts.keys())
+    if terms == []:
+        return terms, np.zeros(0)
+    term_frequency = np.array([counts[term] for term in terms], dtype=np.float64)
+    frequency = np.array([document_frequency.get(term, 0) for term in terms], dtype=np.float64) + 1
+    documents = corpus_size + 1
+    document_length = sum(count for term, count in counts.items() if ' ' not in term)
+    average_length = (average_length * corpus_size + document_length) / documents
+    idf = np.log(1 + (documents - frequency + 0.5) / (frequency + 0.5))
+    saturation = term_frequency * (BM25_K1 + 1) / (term_frequency + BM25_K1 * (1 - BM25_B + BM25_B * document_length / average_length))
+    weights = idf * saturation
+    # A phrase is only a keyword if it is repeated, otherwise most pairs of neighbouring words would be counted
+    weights[[i for i, term in enumerate(terms) if ' ' in term and counts[term] < 2]] = 0
+    return terms, weights
+
+@lru_cache(maxsize=32)
+def analyze_keywords(job_description, resume, count=KEYWORD_COUNT):
+    ''' Finds the most important keywords of the job description, and which of them the resume contains.
+
+    job_description: the text of the job description
+    resume: the text of the resume
+    count: the number of keywords to report
+    return: a dictionary with 'matched' and 'missing' lists of (keyword, weight), best first,
+            and 'coverage', the fraction of the keywords' total weight that the resume matches
+    '''
+    counts, surface_forms = extract_terms(job_description)
+    terms, weights = weigh_terms(counts)
+    resume_terms = set(extract_terms(resume)[0].keys())
+
+    keywords = []
+    selected = set()
+    minimum_weight = MIN_RELATIVE_WEIGHT * weights.max() if len(weights) > 0 else 0
+    for i in np.argsort(-weights, kind='stable'):
+        if len(keywords) >= count or weights[i] <= 0 or weights[i] < minimum_weight:
+            break
+        term = terms[i]
+        words = term.split(' ')
+        # Skip words that are part of a phrase that was already chosen, and phrases whose words were both already chosen
+        if any(term in other.split(' ') for other in selected if ' ' in other) or (len(words) == 2 and all(word in selected for word in words)):
+            continue
+        selected.add(term)
+        keywords.append((surface_forms[term], float(weights[i]), term in resume_terms))
+
+    total_weight = sum(weight for _, weight, _ in keywords)
+    matched_weight = sum(weight for _, weight, matched in keywords if matched)
+    return {
+        'matched': [(keyword, weight) for keyword, weight, matched in keywords if matched],
+        'missing': [(keyword, weight) for keyword, weight, matched in keywords if not matched],
+        'coverage': matched_weight / total_weight if total_weight > 0 else 0.0
+    }
+
+def format_keyword_analysis(analysis):
+    ''' Formats the result of analyze_keywords as a short paragraph, to be read by the user or given to ChatGPT.
+
+    analysis: the result of analyze_keywords
+    return: the paragraph
+    '''
+    matched = ', '.join(keyword for keyword, _ in analysis['matched']) or "none"
+    missing = ', '.join(keyword for keyword, _ in analysis['missing']) or "none"
+    return (f"Keywords from the job description that are in the resume: {matched}. "
+            f"Keywords from the job description that are missing from the resume: {missing}. "
+            f"The resume matches {analysis['coverage']:.0%} of the job description's keyword weight.")
+#endregion
+
+#region Global Variables
+corpus_lock = threading.Lock()
+keyword_corpus = None
+#endregion
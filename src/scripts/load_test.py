@@ -0,0 +1,211 @@
+'''
+Load Test for the Employ Ease server
+
+This script measures the throughput of server mode without calling OpenAI. It starts a local fake OpenAI backend and an Employ Ease server
+in a temporary folder, then runs many concurrent user sessions against the server and reports throughput and latency.
+
+Each session uploads a resume, then sends a number of prompts. Every prompt goes through the full conversation engine
+(embedding, memory retrieval, summarization, document retrieval, chat, and saving to the user's workspace), only the backend is fake.
+
+Usage:
+python -m src.scripts.load_test --sessions 100 --turns 3 --backend-latency 0.05 --max-error-rate 0.01
+
+The load test exits with status 1 if more than 'max-error-rate' of the requests failed (by default, if any request failed).
+
+Author: Courtney Palmer
+'''
+
+#region Imports
+import os
+import sys
+import json
+import random
+import shutil
+import asyncio
+import tempfile
+import argparse
+from time import time, perf_counter
+from src.scripts.http_protocol import handle_http_connection
+#endregion
+
+FAKE_EMBEDDING_DIMENSIONS = 1536
+SAMPLE_RESUME = '''JANE DOE
+jane.doe@example.com
+
+EXPERIENCE
+Software Engineer, Example Corp. Built data pipelines in Python and SQL. Led the migration of batch jobs to a streaming platform.
+
+EDUCATION
+B.S. Computer Science, State University
+
+SKILLS
+Python, SQL, Docker, Kubernetes, AWS
+'''
+
+#region Definitions
+def fake_embedding(text):
+    ''' Returns a deterministic unit-free vector for the given text. '''
+    generator = random.Random(text)
+    return [generator.uniform(-1, 1) for _ in range(FAKE_EMBEDDING_DIMENSIONS)]
+
+def fake_backend_response(path, body):
+    ''' Returns a response in the shape of the OpenAI API for chat completions, completions, and embeddings. '''
+    if path.endswith("/chat/completions"):
+        if body.get('response_format', {}).get('type') == 'json_object':
+            content = json.dumps({"job_name": "Software Engineer", "company_name": "Example Corp", "company_website": "https://example.com"})
+        else:
+            content = "Here is some advice for your job search."
+        return {"id": "chatcmpl-load-test", "object": "chat.completion", "created": int(time()), "model": body.get('model', ''),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}}
+    if path.endswith("/completions"):
+        return {"id": "cmpl-load-test", "object": "text_completion", "created": int(time()), "model": body.get('model', ''),
+                "choices": [{"index": 0, "text": "- The user is looking for a job.", "logprobs": None, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}}
+    if path.endswith("/embeddings"):
+        inputs = body.get('input', [])
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        return {"object": "list", "model": body.get('model', ''),
+                "data": [{"object": "embedding", "index": i, "embedding": fake_embedding(text)} for i, text in enumerate(inputs)],
+                "usage": {"prompt_tokens": 0, "total_tokens": 0}}
+    return None
+
+async def start_fake_backend(latency):
+    ''' Starts a fake OpenAI backend on a free local port.
+
+    latency: the number of seconds the backend waits before every response
+    return: the asyncio server
+    '''
+    async def handle_request(method, path, body):
+        await asyncio.sleep(latency)
+        payload = fake_backend_response(path, json.loads(body) if body else {})
+        if payload is None:
+            return 404, {"error": {"message": f"No such endpoint: {path}"}}
+        return 200, payload
+
+    return await asyncio.start_server(lambda reader, writer: handle_http_connection(reader, writer, handle_request), "127.0.0.1", 0)
+
+def write_load_test_config(folder, backend_port, sessions):
+    ''' Writes a config.ini that points Employ Ease at the fake backend, without rate limits. '''
+    with open(os.path.join(folder, "config.ini"), 'w', encoding='utf-8') as f:
+        f.write(f'''[Communication]
+APIKey = load-test
+api_base = http://127.0.0.1:{backend_port}/v1
+
+[Settings]
+load_on_launch = 0
+
+[RateLimits]
+requests_per_minute = 100000000
+tokens_per_minute = 100000000000
+max_retries = 0
+
+[Server]
+max_concurrent_turns = {sessions}
+max_api_connections = {sessions * 2}
+
+[Theme]
+os_color = green
+user_color = violet
+bot_color = bright_cyan
+''')
+
+async def http_request(reader, writer, method, path, payload):
+    ''' Sends one request over a keep-alive connection and returns (status, JSON payload). '''
+    body = json.dumps(payload).encode('utf-8')
+    writer.write(f"{method} {path} HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n".encode('latin-1') + body)
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    content_length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        if name.strip().lower() == 'content-length':
+            content_length = int(value.strip())
+    return status, json.loads(await reader.readexactly(content_length))
+
+async def run_session(port, user_id, turns, latencies, errors):
+    ''' Runs one user session: uploads a resume, then sends 'turns' prompts, recording the latency of every prompt that succeeded
+    and the response of every request that failed.
+    '''
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    try:
+        status, payload = await http_request(reader, writer, "POST", f"/users/{user_id}/application", {"info_type": "resume", "text": SAMPLE_RESUME})
+        if status != 200:
+            errors.append(payload)
+        for turn in range(turns):
+            started = perf_counter()
+            status, payload = await http_request(reader, writer, "POST", f"/users/{user_id}/prompt", {"prompt": f"How should I prepare for interview number {turn}?"})
+            if status != 200:
+                errors.append(payload)
+            else:
+                latencies.append(perf_counter() - started)
+    finally:
+        writer.close()
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+async def run_load_test(sessions, turns, backend_latency, max_error_rate=0.0):
+    ''' Runs the load test in a temporary folder and prints the results.
+
+    max_error_rate: the fraction of requests that may fail for the load test to pass
+    return: True if the fraction of failed requests was at most max_error_rate
+    '''
+    folder = tempfile.mkdtemp(prefix="employ_ease_load_test_")
+    original_cwd = os.getcwd()
+    try:
+        backend = await start_fake_backend(backend_latency)
+        write_load_test_config(folder, backend.sockets[0].getsockname()[1], sessions)
+        # Employ Ease reads config.ini from the working directory when its modules are imported
+        os.chdir(folder)
+        from src.scripts.server import start_server, load_prompt_dict
+
+        server = await start_server("127.0.0.1", 0, os.path.join(folder, "server_data"), sessions, load_prompt_dict())
+        port = server.sockets[0].getsockname()[1]
+        latencies = []
+        errors = []
+        started = perf_counter()
+        await asyncio.gather(*(run_session(port, f"user{i}", turns, latencies, errors) for i in range(sessions)))
+        elapsed = perf_counter() - started
+
+        # Close the shared connections to the fake backend before shutting it down
+        from src.scripts.conversation import http_session
+        from src.scripts.memory import client
+        http_session.close()
+        client.close()
+        await asyncio.sleep(0.1)
+        server.close()
+        backend.close()
+        print(f"Sessions: {sessions}, prompts per session: {turns}, fake backend latency: {backend_latency * 1000:.0f} ms")
+        # Every session sends one upload and 'turns' prompts. Throughput and latency only count the prompts that were answered.
+        requests = sessions * (turns + 1)
+        error_rate = len(errors) / requests if requests > 0 else 0.0
+        print(f"Answered {len(latencies)} of {sessions * turns} prompts in {elapsed:.2f} s ({len(latencies) / elapsed:.1f} answered prompts/s)")
+        print(f"Failed {len(errors)} of {requests} requests ({error_rate:.1%}, the limit is {max_error_rate:.1%})")
+        if latencies:
+            print(f"Prompt latency p50: {percentile(latencies, 0.50) * 1000:.0f} ms, p95: {percentile(latencies, 0.95) * 1000:.0f} ms, p99: {percentile(latencies, 0.99) * 1000:.0f} ms")
+        for error in errors[:5]:
+            print(f"Error: {error}")
+        return error_rate <= max_error_rate
+    finally:
+        os.chdir(original_cwd)
+        shutil.rmtree(folder, ignore_errors=True)
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the Employ Ease server against a local fake OpenAI backend.")
+    parser.add_argument("--sessions", type=int, default=100, help="number of concurrent user sessions")
+    parser.add_argument("--turns", type=int, default=3, help="number of prompts per session")
+    parser.add_argument("--backend-latency", type=float, default=0.05, help="seconds the fake backend waits before each response")
+    parser.add_argument("--max-error-rate", type=float, default=0.0, help="fraction of requests that may fail before the load test exits with an error")
+    args = parser.parse_args()
+    succeeded = asyncio.run(run_load_test(args.sessions, args.turns, args.backend_latency, args.max_error_rate))
+    sys.exit(0 if succeeded else 1)
+
+if __name__ == "__main__":
+    main()
+#endregion
@@ -12,7 +12,12 @@ Author: Courtney Palmer
 '''
 
 import os
+import threading
 from src.scripts.file_handler import create_json_file
+from src.scripts.workspace import workspace_path
+
+# Messages may be appended from background threads, so writes to the transcript are serialized
+transcript_write_lock = threading.Lock()
 
 #region Definitions
 def create_new_memory_file(session_timestamp, speaker, msg_timestamp, info):
@@ -23,22 +28,25 @@ def create_new_memory_file(session_timestamp, speaker, msg_timestamp, info):
     msg_timestamp: the time stamp of the message
     info: the information to save to the memory file
     '''  
-    filepath_to_session_memory = os.getcwd() + f"\\src\\internal\\memory\\Session_{session_timestamp}"
-    create_json_file(f"{filepath_to_session_memory}\\{speaker}Log_{msg_timestamp}.json", info)
+    filepath_to_session_memory = workspace_path("src", "internal", "memory", f"Session_{session_timestamp}")
+    create_json_file(os.path.join(filepath_to_session_memory, f"{speaker}Log_{msg_timestamp}.json"), info)
+
+def get_transcript_filepath(session_timestamp):
+    ''' Returns the path to the transcript file at logs/Session_{session_timestamp}/Transcript.txt
+    
+    session_timestamp: the time stamp of the session
+    '''
+    return workspace_path("logs", f"Session_{session_timestamp}", "Transcript.txt")
 
 def create_new_transcript(session_timestamp):
     ''' Creates a new transcript file at logs/Session_{session_timestamp}/Transcript.txt
     
     session_timestamp: the time stamp of the session
     '''
-    # check if logs folder exists
-    if not os.path.exists(os.getcwd() + "\\logs"):
-        os.mkdir(os.getcwd() + "\\logs")
-    # check if session folder exists
-    if not os.path.exists(os.getcwd() + f"\\logs\\Session_{session_timestamp}"):
-        os.mkdir(os.getcwd() + f"\\logs\\Session_{session_timestamp}")
+    # create the logs folder and session folder if they do not exist
+    log_file = get_transcript_filepath(session_timestamp)
+    os.makedirs(os.path.dirname(log_file), exist_ok=True)
     # Create a new transcript file at logs/Session_{session_timestamp}/Transcript.txt
-    log_file = os.getcwd() + f"\\logs\\Session_{session_timestamp}\\Transcript.txt"
     with open(log_file, "w", encoding = 'utf-8') as f:
         f.write("TRANSCRIPT FILE\n")
 
@@ -49,7 +57,8 @@ def append_transcript(message, session_timestamp):
     session_timestamp: the time stamp of the session
     '''
     message = message.encode('utf-8', 'ignore')
-    with open(os.getcwd() + f"\\logs\\Session_{session_timestamp}\\Transcript.txt", "a", encoding = 'utf-8') as f:
-        f.write("="*80)
-        f.write(f'\n{message}\n')
+    with transcript_write_lock:
+        with open(get_transcript_filepath(session_timestamp), "a", encoding = 'utf-8') as f:
+            f.write("="*80)
+            f.write(f'\n{message}\n')
 #endregion
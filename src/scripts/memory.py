@@ -35,24 +35,209 @@ SOFTWARE.
 #region Imports
 import os
 import re
+import json
 from openai import OpenAI
 import numpy as np
 from numpy.linalg import norm
 import re
-from time import sleep
+import sys
+import threading
+from time import time
+from uuid import uuid4
 import datetime
-import configparser
 import tiktoken
-from src.scripts.file_handler import read_file_content
+from src.scripts.file_handler import read_file_content, load_ini
+from src.scripts.workspace import workspace_path, get_workspace_root
+from src.scripts.logger import create_new_memory_file
+from src.scripts.snapshot import read_snapshot, write_snapshot, snapshot_record
+from src.scripts.scheduler import PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE
+from src.scripts.resilience import call_api, ServiceUnavailable
+from src.scripts.cassette import through_cassette
 #endregion
 
-config_obj = configparser.ConfigParser()
-config_obj.read(os.getcwd() + "\\config.ini")
+config_obj = load_ini(os.getcwd(), "config.ini")
 APIKey = config_obj.get('Communication', 'APIKey')
-client = OpenAI(api_key=APIKey)
+APIBase = config_obj.get('Communication', 'api_base', fallback='https://api.openai.com/v1')
+# Retries are handled by the scheduler and the resilience module so that every request honours the API's Retry-After header and its deadline.
+# The client is shared by every thread, so its connections to the API are reused.
+client = OpenAI(api_key=APIKey, base_url=APIBase, max_retries=0)
 MaxTokenLimit = 4097
 MaxTokenResponseLimit = 400
 
+# Memories are ranked by a weighted sum of their similarity to the prompt, how recently they were mentioned, and their importance
+SimilarityWeight = config_obj.getfloat('Memory', 'similarity_weight', fallback=1.0)
+RecencyWeight = config_obj.getfloat('Memory', 'recency_weight', fallback=0.3)
+ImportanceWeight = config_obj.getfloat('Memory', 'importance_weight', fallback=0.2)
+RecencyHalfLifeHours = config_obj.getfloat('Memory', 'recency_half_life_hours', fallback=72.0)
+# The maximum number of memory files kept per user, across all sessions. 0 means there is no limit.
+MaxMemories = config_obj.getint('Memory', 'max_memories', fallback=2000)
+# When the limit is exceeded, this many extra memories are evicted, so that compaction does not run on every message
+EvictionBatch = config_obj.getint('Memory', 'eviction_batch', fallback=100)
+compaction_lock = threading.Lock()
+# The running number of memories of every workspace, so that saving a memory does not count the memory folders again
+memory_counts = {}
+# The workspaces whose memories are waiting to be compacted
+pending_compactions = set()
+memory_count_lock = threading.Lock()
+# Snapshots that were already read, keyed by the path of the session folder: (modification time of the snapshot, memories, metadata)
+snapshot_cache = {}
+snapshot_lock = threading.Lock()
+
+#region Class Definitions
+class session_memory:
+    ''' The memories of a session, stored by column instead of as one dictionary per memory.
+    The embeddings are kept in a single float32 matrix, in which duplicates share the row of their original,
+    and the time string of a memory is only formatted when it is read. This takes about a tenth of the memory of the dictionaries.
+    Reading a session_memory like a list, e.g. memories[-4:], returns memory_record objects that can be read like the dictionaries of memory files.
+    The memories are kept in chronological order.
+    '''
+    # Fields with their own column. Any other field of a memory (such as 'summary_of') is kept in 'extras'.
+    COLUMNS = ('speaker', 'time', 'uuid', 'message', 'vector', 'duplicate_of', 'timestring')
+
+    def __init__(self, records):
+        '''
+        records: the memories, as dictionaries in the format of the memory files. Duplicates that only store a reference
+                 take the message and vector of their original, and are left out if the original is not among the records.
+        '''
+        records = list(records)
+        vectors = [data['vector'] for data in records if 'duplicate_of' not in data]
+        dimensions = len(vectors[0]) if vectors else 0
+        is_original = np.array(['duplicate_of' not in data for data in records], dtype=bool)
+        extras = {}
+        for i, data in enumerate(records):
+            extra = {key: value for key, value in data.items() if key not in self.COLUMNS and key not in ('score', 'tokens')}
+            if extra:
+                extras[i] = extra
+        self.set_columns(speakers=[data['speaker'] for data in records],
+                         times=np.array([data['time'] for data in records], dtype=np.float64),
+                         uuids=[data['uuid'] for data in records],
+                         duplicates_of=[data.get('duplicate_of') for data in records],
+                         messages=[data.get('message') for data in records],
+                         vectors=np.array(vectors, dtype=np.float32).reshape(len(vectors), dimensions),
+                         rows=np.where(is_original, np.cumsum(is_original) - 1, -1),
+                         importance=np.array([memory_importance(data) if 'duplicate_of' not in data else 0.0 for data in records], dtype=np.float32),
+                         extras=extras)
+
+    @classmethod
+    def from_columns(cls, **columns):
+        ''' Builds a session_memory from columns, such as those of a snapshot, without a dictionary per memory. See set_columns. '''
+        memory = cls.__new__(cls)
+        memory.set_columns(**columns)
+        return memory
+
+    def set_columns(self, speakers, times, uuids, duplicates_of, messages, vectors, rows, importance, extras):
+        ''' Sets the columns of the memories, in any order. The memories are sorted chronologically, only the vectors of the memories
+        that are kept are copied from 'vectors' (which may be memory-mapped), and duplicates take the message, vector, and importance of their original.
+
+        speakers, uuids, duplicates_of, messages: lists with an entry per memory. The message of a duplicate is None.
+        times, importance: NumPy arrays with an entry per memory. The importance of a duplicate is not used.
+        vectors: the matrix of the vectors of the memories that are not duplicates
+        rows: a NumPy array of the row of every memory's vector in 'vectors', or -1 for a duplicate
+        extras: a dictionary of {index: {field: value}} of any other fields of the memories
+        '''
+        index_of = {uuid: i for i, uuid in enumerate(uuids)}
+        original_of = np.array([i if duplicate_of is None else index_of.get(duplicate_of, -1) for i, duplicate_of in enumerate(duplicates_of)], dtype=np.int64)
+        is_original = np.array([duplicate_of is None for duplicate_of in duplicates_of], dtype=bool)
+        # Duplicates are left out if their original is not among the memories
+        valid = original_of >= 0
+        valid[valid] = is_original[original_of[valid]]
+        kept = np.flatnonzero(valid)
+        kept = kept[np.argsort(np.asarray(times, dtype=np.float64)[kept], kind='stable')]
+        originals = np.flatnonzero(is_original)
+        # Only the rows that are used are read from the matrix, with a single copy
+        self.vectors = np.array(vectors[np.asarray(rows, dtype=np.int64)[originals]], dtype=np.float32).reshape(len(originals), vectors.shape[1] if vectors.ndim == 2 else 0)
+        original_rows = np.full(len(uuids), -1, dtype=np.int32)
+        original_rows[originals] = np.arange(len(originals), dtype=np.int32)
+
+        sources = original_of[kept]
+        self.speakers = [sys.intern(speakers[i]) for i in kept]
+        self.times = np.asarray(times, dtype=np.float64)[kept]
+        self.uuids = [uuids[i] for i in kept]
+        self.duplicates_of = [duplicates_of[i] for i in kept]
+        # Duplicates share the message string and the vector row of their original
+        self.messages = [messages[i] for i in sources]
+        self.rows = original_rows[sources]
+        self.importance = np.asarray(importance, dtype=np.float32)[sources]
+        positions = {int(i): position for position, i in enumerate(kept)}
+        self.extras = {positions[i]: extra for i, extra in extras.items() if i in positions}
+
+    def __len__(self):
+        return len(self.uuids)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [memory_record(self, i) for i in range(len(self))[index]]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("session_memory index out of range")
+        return memory_record(self, index)
+
+    def __iter__(self):
+        return (memory_record(self, i) for i in range(len(self)))
+
+    def field(self, index, key, default=None):
+        ''' Returns a field of the memory at the given index, or the default if the memory does not have the field. '''
+        match key:
+            case 'speaker':
+                return self.speakers[index]
+            case 'time':
+                return float(self.times[index])
+            case 'uuid':
+                return self.uuids[index]
+            case 'message':
+                return self.messages[index]
+            case 'vector':
+                return self.vectors[self.rows[index]]
+            case 'timestring':
+                return timestamp_to_datetime(self.times[index])
+            case 'duplicate_of':
+                return self.duplicates_of[index] if self.duplicates_of[index] is not None else default
+        return self.extras.get(index, {}).get(key, default)
+
+    def original_indices(self):
+        ''' Returns the indices of the memories that are not duplicates, as a NumPy array. '''
+        return np.array([i for i, duplicate_of in enumerate(self.duplicates_of) if duplicate_of is None], dtype=np.int64)
+
+    def last_seen(self):
+        ''' Returns, for every memory, the latest time it or a duplicate of it was saved, as a NumPy array. '''
+        latest = np.zeros(len(self.vectors), dtype=np.float64)
+        np.maximum.at(latest, self.rows, self.times)
+        return latest[self.rows]
+
+class memory_record:
+    ''' One memory of a session_memory. It can be read like the dictionary of a memory file, e.g. record['message'],
+    and holds the score a memory was ranked with by fetch_memories.
+    '''
+    __slots__ = ('memory', 'index', 'score')
+
+    def __init__(self, memory, index, score=None):
+        self.memory = memory
+        self.index = index
+        self.score = score
+
+    def get(self, key, default=None):
+        if key == 'score':
+            return self.score if self.score is not None else default
+        return self.memory.field(self.index, key, default)
+
+    def __getitem__(self, key):
+        value = self.get(key, memory_record)
+        if value is memory_record:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        return self.get(key, memory_record) is not memory_record
+
+    def keys(self):
+        return [key for key in session_memory.COLUMNS + tuple(self.memory.extras.get(self.index, {}).keys()) + ('score',) if key in self]
+
+    def to_dict(self):
+        ''' Returns the memory as a dictionary in the format of the memory files. '''
+        return {key: self[key] for key in self.keys()}
+#endregion
+
 #region Definitions
 def timestamp_to_datetime(unix_time):
     ''' Converts a UNIX timestamp to a datetime object.
@@ -70,9 +255,31 @@ def gpt3_embedding(content, model='text-embedding-ada-002'):
     return: the embedding of the content
     '''
     content = content.encode(encoding='ASCII',errors='ignore').decode()
-    response = client.embeddings.create(input=content,model=model).data[0].embedding
+    request = {'input': content, 'model': model}
+    # Requests go through the cassette, which records or replays them when a cassette mode is set in config.ini
+    response = through_cassette("embedding", request, lambda: call_api("embedding", lambda timeout: client.with_options(timeout=timeout).embeddings.create(**request),
+                                token_counter(content, "cl100k_base"), PRIORITY_BACKGROUND).data[0].embedding)
     return response
 
+def gpt3_embeddings(contents, model='text-embedding-ada-002'):
+    ''' Returns the embeddings of several pieces of content using a single request.
+    
+    contents: the list of content to embed
+    model: the model to use for embedding
+    return: the list of embeddings, in the same order as the given content
+    '''
+    if len(contents) == 0:
+        return []
+    contents = [content.encode(encoding='ASCII',errors='ignore').decode() for content in contents]
+    tokens = sum(token_counter(content, "cl100k_base") for content in contents)
+    request = {'input': contents, 'model': model}
+
+    def send_request():
+        response = call_api("embedding", lambda timeout: client.with_options(timeout=timeout).embeddings.create(**request), tokens, PRIORITY_BACKGROUND).data
+        return [item.embedding for item in sorted(response, key=lambda d: d.index)]
+    # A batch is recorded as its own type of request, so that replaying never serves a single vector in place of a list of vectors
+    return through_cassette("embedding_batch", request, send_request)
+
 def similarity(v1, v2):
     ''' Returns the cosine similarity between the two given vectors.
     based upon https://stackoverflow.com/questions/18424228/cosine-similarity-between-2-number-lists
@@ -83,43 +290,312 @@ def similarity(v1, v2):
    '''
     return np.dot(v1, v2)/(norm(v1)*norm(v2))  # return cosine similarity
 
+def memory_importance(log):
+    ''' Returns the importance of a memory, from 0 to 1. Summaries of evicted memories store their importance,
+    otherwise longer messages are considered more important than short ones such as "thanks".
+    
+    log: the memory
+    return: the importance of the memory
+    '''
+    if 'importance' in log:
+        return log['importance']
+    return min(len(log['message'].split()) / 150, 1.0)
+
+def retention_scores(logs, vector=None, now=None):
+    ''' Scores the memories of the given logs by recency and importance, and by similarity to the given vector if one is given.
+    All memories are scored at once with NumPy. A memory counts as recent if it, or a duplicate of it, was saved recently.
+    
+    logs: the logs to score
+    vector: the vector to compare to, or None to score by recency and importance only
+    now: the UNIX timestamp to measure recency from. Defaults to the current time.
+    return: a tuple of (the memory_record of every memory that was scored, a NumPy array of their scores). Duplicates are not scored.
+    '''
+    if now is None:
+        now = time()
+    if not isinstance(logs, session_memory):
+        logs = session_memory(logs)
+    # Duplicates are references to a memory that is already in the logs
+    originals = logs.original_indices()
+    if len(originals) == 0:
+        return [], np.zeros(0)
+
+    age_hours = np.maximum(now - logs.last_seen()[originals], 0) / 3600
+    scores = RecencyWeight * 0.5 ** (age_hours / RecencyHalfLifeHours)
+    scores = scores + ImportanceWeight * logs.importance[originals].astype(np.float64)
+    if vector is not None:
+        matrix = logs.vectors[logs.rows[originals]]
+        query = np.asarray(vector, dtype=np.float32)
+        similarities = (matrix @ query) / np.maximum(norm(matrix, axis=1) * norm(query), 1e-12)
+        scores = scores + SimilarityWeight * similarities.astype(np.float64)
+    return [logs[int(i)] for i in originals], scores
+
 def fetch_memories(vector, logs, count):
-    ''' Returns the top n memories that are most similar to the given vector.
+    ''' Returns the top n memories, ranked by similarity to the given vector, recency, and importance.
     
     vector: the vector to compare to
     logs: the logs to search through
     count: the number of memories to return
-    return: the top n memories that are most similar to the given vector
-    '''
-    scores = list()
-    for log in logs:
-        if vector == log['vector']:
-            score = similarity(log['vector'], vector)
-            log['score'] = score
-            scores.append(log)
-    ordered = sorted(scores, key=lambda d: d['score'], reverse=True)
-    try:
-        ordered = ordered[0:count]
-        return ordered
-    except:
-        return ordered
+    return: the top n memories, best first
+    '''
+    memories, scores = retention_scores(logs, vector)
+    ordered = list()
+    for i in np.argsort(-scores, kind='stable')[:count]:
+        ordered.append(memory_record(memories[i].memory, memories[i].index, float(scores[i])))
+    return ordered
 
 def load_convo(sessionFolder):
     ''' Loads the conversation from the given session folder.
     
     sessionFolder: the session folder to load the conversation from
-    return: the conversation
+    return: the conversation, as a session_memory in chronological order
     '''
-    filepath_to_session_memory = f"src\\internal\\memory\\{sessionFolder}"
+    filepath_to_session_memory = workspace_path("src", "internal", "memory", sessionFolder)
+    # Nothing has been saved yet in a new session
+    if not os.path.exists(filepath_to_session_memory):
+        return session_memory([])
     files = os.listdir(filepath_to_session_memory)
     files = [i for i in files if '.json' in i]  # filter out any non-JSON files
+    # Memories in the session's snapshot are taken from its columns, so only the memory files saved after the snapshot are read
+    columns = load_session_snapshot(filepath_to_session_memory)[0]
+    snapshot_index = columns['index'] if columns is not None else {}
     result = list()
     for file in files:
+        if file in snapshot_index:
+            continue
         # data = read_json_file(f"{filepath_to_session_memory}\\{file}")
-        data = read_file_content(f"{filepath_to_session_memory}\\{file}")
+        data = read_file_content(os.path.join(filepath_to_session_memory, file))
         result.append(data)
-    ordered = sorted(result, key=lambda d: d['time'], reverse=False)  # sort them all chronologically
-    return ordered
+    # Duplicates only store a reference to the original memory, and are given the original's message and vector by session_memory,
+    # which also sorts the memories chronologically
+    if columns is None:
+        return session_memory(result)
+    return combine_with_snapshot(columns, set(files), result)
+
+def combine_with_snapshot(columns, files, records):
+    ''' Builds a session_memory from the columns of a session's snapshot and the memories saved after it, without a dictionary per snapshot memory.
+    
+    columns: the columns of the snapshot, as returned by read_snapshot
+    files: the set of memory files the session has now. Memories of the snapshot whose file was deleted since are left out.
+    records: the memories that are not in the snapshot, as dictionaries in the format of the memory files
+    return: the session_memory
+    '''
+    kept = [i for i, file in enumerate(columns['files']) if file in files]
+    speakers = [columns['speakers'][i] for i in kept] + [data['speaker'] for data in records]
+    times = np.concatenate([columns['times'][kept], np.array([data['time'] for data in records], dtype=np.float64)])
+    uuids = [columns['uuids'][i] for i in kept] + [data['uuid'] for data in records]
+    duplicates_of = [columns['duplicates_of'][i] for i in kept] + [data.get('duplicate_of') for data in records]
+    messages = [columns['messages'][i] for i in kept] + [data.get('message') for data in records]
+    importance = np.concatenate([columns['importance'][kept],
+                                 np.array([memory_importance(data) if 'duplicate_of' not in data else 0.0 for data in records], dtype=np.float32)])
+    extras = {position: columns['extras'][i] for position, i in enumerate(kept) if i in columns['extras']}
+    for i, data in enumerate(records):
+        extra = {key: value for key, value in data.items() if key not in session_memory.COLUMNS and key not in ('score', 'tokens')}
+        if extra:
+            extras[len(kept) + i] = extra
+    rows = columns['rows'][kept]
+    vectors = columns['vectors']
+    new_vectors = [data['vector'] for data in records if 'duplicate_of' not in data]
+    if new_vectors:
+        # The vectors of the snapshot that are kept are read once, and the vectors of the new memories are added after them
+        originals = np.flatnonzero(rows >= 0)
+        new_vectors = np.array(new_vectors, dtype=np.float32).reshape(len(new_vectors), -1)
+        vectors = np.concatenate([np.asarray(vectors[rows[originals]], dtype=np.float32), new_vectors]) if len(originals) > 0 else new_vectors
+        rows = np.full(len(kept), -1, dtype=np.int64)
+        rows[originals] = np.arange(len(originals))
+    is_new_original = np.array(['duplicate_of' not in data for data in records], dtype=bool)
+    new_rows = np.where(is_new_original, np.cumsum(is_new_original) - 1 + (len(vectors) - len(new_vectors)), -1)
+    rows = np.concatenate([rows, new_rows.astype(np.int64)])
+    return session_memory.from_columns(speakers=speakers, times=times, uuids=uuids, duplicates_of=duplicates_of, messages=messages,
+                                       vectors=vectors, rows=rows, importance=importance, extras=extras)
+
+def load_session_snapshot(filepath_to_session_memory):
+    ''' Returns the snapshot of a session, reading it only if it changed since it was last read.
+    
+    filepath_to_session_memory: the path to the session's memory folder
+    return: a tuple of (the snapshot's columns, see read_snapshot, the snapshot's metadata), or (None, None) if the session has no snapshot
+    '''
+    metadata_filepath = os.path.join(filepath_to_session_memory, "snapshot", "metadata.json")
+    if not os.path.exists(metadata_filepath):
+        return None, None
+    modified = os.path.getmtime(metadata_filepath)
+    with snapshot_lock:
+        cached = snapshot_cache.get(filepath_to_session_memory)
+        if cached is None or cached[0] != modified:
+            columns, metadata = read_snapshot(filepath_to_session_memory)
+            cached = (modified, columns, metadata)
+            snapshot_cache[filepath_to_session_memory] = cached
+        return cached[1], cached[2]
+
+def save_session_snapshot(sessionFolder, rolling_summary=""):
+    ''' Saves a snapshot of a session's memories, so that the session can be resumed without reading every memory file.
+    
+    sessionFolder: the session folder to save a snapshot of
+    rolling_summary: notes that summarize the conversation so far
+    '''
+    filepath_to_session_memory = workspace_path("src", "internal", "memory", sessionFolder)
+    if not os.path.exists(filepath_to_session_memory):
+        return
+    files = sorted(i for i in os.listdir(filepath_to_session_memory) if '.json' in i)
+    columns = load_session_snapshot(filepath_to_session_memory)[0]
+    records = list()
+    token_counts = list()
+    importance = list()
+    for file in files:
+        if columns is not None and file in columns['index']:
+            data = snapshot_record(columns, columns['index'][file])
+        else:
+            data = read_file_content(os.path.join(filepath_to_session_memory, file))
+        records.append((file, data))
+        if 'tokens' in data:
+            token_counts.append(data['tokens'])
+        else:
+            token_counts.append(token_counter(data['message'], "cl100k_base") if 'message' in data else 0)
+        importance.append(memory_importance(data) if 'duplicate_of' not in data else 0.0)
+    write_snapshot(filepath_to_session_memory, records, token_counts, importance, rolling_summary)
+
+def get_session_summary(sessionFolder):
+    ''' Returns the rolling summary and total number of tokens stored in a session's snapshot.
+    
+    sessionFolder: the session folder
+    return: a dictionary of {'rolling_summary', 'total_tokens'}, or None if the session has no snapshot
+    '''
+    return load_session_snapshot(workspace_path("src", "internal", "memory", sessionFolder))[1]
+
+def find_last_session():
+    ''' Returns the timestamp of the most recent session in the current workspace that has saved memories.
+    
+    return: the session timestamp, or None if there are no sessions
+    '''
+    filepath_to_memory = workspace_path("src", "internal", "memory")
+    if not os.path.exists(filepath_to_memory):
+        return None
+    timestamps = list()
+    for session_folder in os.listdir(filepath_to_memory):
+        try:
+            timestamps.append(float(session_folder[len("Session_"):]))
+        except ValueError:
+            continue
+    if timestamps == []:
+        return None
+    return max(timestamps)
+
+def load_all_memories():
+    ''' Loads the memories of every session in the current workspace, with the path of the file each memory is stored in.
+    
+    return: a list of (session folder, filepath, memory)
+    '''
+    filepath_to_memory = workspace_path("src", "internal", "memory")
+    if not os.path.exists(filepath_to_memory):
+        return []
+    result = list()
+    for session_folder in os.listdir(filepath_to_memory):
+        session_path = os.path.join(filepath_to_memory, session_folder)
+        if not os.path.isdir(session_path):
+            continue
+        for file in os.listdir(session_path):
+            if file.endswith('.json'):
+                filepath = os.path.join(session_path, file)
+                result.append((session_folder, filepath, read_file_content(filepath)))
+    return result
+
+def count_memories():
+    ''' Returns the number of memory files of every session in the current workspace, without reading them. '''
+    filepath_to_memory = workspace_path("src", "internal", "memory")
+    if not os.path.exists(filepath_to_memory):
+        return 0
+    count = 0
+    for session_folder in os.scandir(filepath_to_memory):
+        if session_folder.is_dir():
+            count += sum(1 for file in os.scandir(session_folder.path) if file.name.endswith('.json'))
+    return count
+
+def memory_limit_exceeded():
+    ''' Counts a memory that was just saved, and returns True if the memories of the current workspace now exceed MaxMemories,
+    so that they should be compacted. The memory folders are only counted the first time, and again after each compaction.
+    '''
+    if MaxMemories <= 0:
+        return False
+    key = get_workspace_root()
+    with memory_count_lock:
+        if key in pending_compactions:
+            return False
+        memory_counts[key] = memory_counts[key] + 1 if key in memory_counts else count_memories()
+        if memory_counts[key] <= MaxMemories:
+            return False
+        # Compaction removes memories and adds summaries, so the memories are counted again after it
+        del memory_counts[key]
+        pending_compactions.add(key)
+        return True
+
+def compact_memories():
+    ''' Keeps the number of memories in the current workspace at or below MaxMemories. See evict_memories.
+    
+    return: the list of session folders whose memories changed
+    '''
+    try:
+        return evict_memories()
+    finally:
+        with memory_count_lock:
+            pending_compactions.discard(get_workspace_root())
+
+def evict_memories():
+    ''' Evicts memories until the current workspace has at most MaxMemories - EvictionBatch memories.
+    The memories with the lowest recency and importance scores are evicted, and the evicted memories of each session
+    are replaced by a single summary memory, so that what they contained is not forgotten entirely.
+    
+    return: the list of session folders whose memories changed
+    '''
+    if MaxMemories <= 0 or count_memories() <= MaxMemories:
+        return []
+    # Only one compaction runs at a time. Any other caller can skip it, as the memories are already being compacted.
+    if not compaction_lock.acquire(blocking=False):
+        return []
+    try:
+        stored = load_all_memories()
+        if len(stored) <= MaxMemories:
+            return []
+        by_uuid = {data['uuid']: (session_folder, filepath, data) for session_folder, filepath, data in stored}
+        memories, scores = retention_scores([data for _, _, data in stored])
+        # A memory is evicted together with its duplicates, so it counts as all of their files
+        file_counts = {}
+        for _, _, data in stored:
+            original_uuid = data.get('duplicate_of', data['uuid'])
+            file_counts[original_uuid] = file_counts.get(original_uuid, 0) + 1
+        excess = len(stored) - max(MaxMemories - EvictionBatch, 0)
+        evicted = list()
+        for i in np.argsort(scores, kind='stable'):
+            if excess <= 0:
+                break
+            evicted.append(memories[i])
+            excess -= file_counts[memories[i]['uuid']]
+
+        # Group the evicted memories by session, as a memory is only fetched within its own session
+        evicted_by_session = {}
+        for data in evicted:
+            evicted_by_session.setdefault(by_uuid[data['uuid']][0], []).append(data)
+
+        changed_sessions = list()
+        for session_folder, session_evicted in evicted_by_session.items():
+            try:
+                notes = summarize_memories(session_evicted)
+            except ServiceUnavailable:
+                # Nothing is deleted unless its summary was saved
+                continue
+            summary_time = max(data['time'] for data in session_evicted)
+            info = {'speaker': 'Summary', 'time': summary_time, 'vector': gpt3_embedding(notes), 'message': notes,
+                    'uuid': str(uuid4()), 'timestring': timestamp_to_datetime(summary_time),
+                    'importance': 1.0, 'summary_of': len(session_evicted)}
+            create_new_memory_file(session_folder[len("Session_"):], "Summary", summary_time, info)
+
+            # Duplicates of an evicted memory are evicted with it
+            evicted_uuids = set(data['uuid'] for data in session_evicted)
+            for folder, filepath, data in stored:
+                if folder == session_folder and (data['uuid'] in evicted_uuids or data.get('duplicate_of') in evicted_uuids):
+                    os.remove(filepath)
+            changed_sessions.append(session_folder)
+        return changed_sessions
+    finally:
+        compaction_lock.release()
 
 def encoding_getter(encoding_type: str):
     '''
@@ -145,11 +621,13 @@ def token_counter(string: str, encoding_type: str) -> int:
     num_tokens = len(tokenizer(string, encoding_type))
     return num_tokens
 
-def summarize_memories(memories):
+def summarize_memories(memories, deadline=None):
     ''' Summarizes the given memories into one payload.
     
     memories: the memories to summarize
+    deadline: the number of seconds the summary may take. Defaults to the completion deadline in config.ini.
     return: the summarized memories
+    raises: ServiceUnavailable if the memories could not be summarized
     '''
     memories = sorted(memories, key=lambda d: d['time'], reverse=False)  # sort them chronologically
     block = ''
@@ -169,7 +647,7 @@ def summarize_memories(memories):
     if tokensForPrompt > MaxTokenLimit:
         #print(f"Warning: The prompt is {tokensForPrompt} tokens long, which is over the limit of {MaxTokenLimit} tokens. The prompt will be truncated.", "Warning")
         prompt = prompt[:MaxTokenLimit]
-    notes = gpt3_completion(prompt)
+    notes = gpt3_completion(prompt, deadline=deadline)
     return notes
 
 def get_last_messages(conversation, limit):
@@ -190,7 +668,7 @@ def get_last_messages(conversation, limit):
     output = output.strip()
     return output
 
-def gpt3_completion(prompt, model='gpt-3.5-turbo-instruct', temp=0.0, top_p=1.0, tokens=400, freq_pen=0.0, pres_pen=0.0, stop=['USER:', 'EmployEase:']):
+def gpt3_completion(prompt, model='gpt-3.5-turbo-instruct', temp=0.0, top_p=1.0, tokens=400, freq_pen=0.0, pres_pen=0.0, stop=['USER:', 'EmployEase:'], deadline=None):
     ''' Returns the response from GPT3 for the given prompt.
     
     prompt: the prompt to send to GPT3
@@ -201,31 +679,72 @@ def gpt3_completion(prompt, model='gpt-3.5-turbo-instruct', temp=0.0, top_p=1.0,
     freq_pen: the frequency penalty to use for the response
     pres_pen: the presence penalty to use for the response
     stop: the stop tokens to use for the response
+    deadline: the number of seconds the request may take, including retries. Defaults to the completion deadline in config.ini.
     return: the response from GPT3 for the given prompt
+    raises: ServiceUnavailable if no response could be retrieved
     '''
-    max_retry = 3
-    retry = 0
     prompt = prompt.encode(encoding='ASCII',errors='ignore').decode()
-    while True:
-        try:
-            response = client.completions.create(
-                model=model,
-                prompt=prompt,
-                temperature=temp,
-                max_tokens=tokens,
-                top_p=top_p,
-                frequency_penalty=freq_pen,
-                presence_penalty=pres_pen,
-                stop=stop)
-            text = response.choices[0].text.strip()
-            
-            text = re.sub('[\r\n]+', '\n', text)
-            text = re.sub('[\t ]+', ' ', text)
-            return text
-        except Exception as oops:
-            retry += 1
-            if retry >= max_retry:
-                return "GPT3 error: %s" % oops
-            # print(f'Error communicating with OpenAI{oops}', "Error")
-            sleep(1)
+    estimated_tokens = token_counter(prompt, "cl100k_base") + tokens
+    request = {
+        'model': model,
+        'prompt': prompt,
+        'temperature': temp,
+        'max_tokens': tokens,
+        'top_p': top_p,
+        'frequency_penalty': freq_pen,
+        'presence_penalty': pres_pen,
+        'stop': stop
+    }
+    try:
+        # Summarization is background work, so interactive chat requests are sent first.
+        # Timeouts and server errors are retried with backoff by call_api.
+        text = through_cassette("completion", request, lambda: call_api("completion", lambda timeout: client.with_options(timeout=timeout).completions.create(**request),
+                                                                         estimated_tokens, PRIORITY_BACKGROUND, deadline).choices[0].text)
+    except ServiceUnavailable:
+        raise
+    except Exception as oops:
+        # Every failure is raised as ServiceUnavailable, so that callers only have to handle one exception
+        raise ServiceUnavailable(f"The completion request failed: {oops}") from oops
+    text = text.strip()
+
+    text = re.sub('[\r\n]+', '\n', text)
+    text = re.sub('[\t ]+', ' ', text)
+    return text
+
+def gpt3_json_completion(prompt, model='gpt-3.5-turbo-1106', temp=0.0, tokens=400):
+    ''' Returns the response from ChatGPT for the given prompt as a JSON object, using JSON mode. Unlike send_prompt, nothing is saved to memory.
+    
+    prompt: the prompt to send to ChatGPT. The prompt must ask for a JSON object.
+    model: the model to use for the response
+    temp: the temperature to use for the response
+    tokens: the number of tokens to use for the response
+    return: the parsed JSON object, or an empty dictionary if the response was not a valid JSON object
+    raises: ServiceUnavailable if no response could be retrieved
+    '''
+    prompt = prompt.encode(encoding='ASCII',errors='ignore').decode()
+    estimated_tokens = token_counter(prompt, "gpt-3.5-turbo") + tokens
+    request = {
+        'model': model,
+        'messages': [{'role': 'system', 'content': 'You extract information from documents and reply only with a JSON object.'},
+                     {'role': 'user', 'content': prompt}],
+        'response_format': {'type': 'json_object'},
+        'temperature': temp,
+        'max_tokens': tokens
+    }
+    try:
+        # JSON requests are recorded as their own type of request, so that replaying never serves a prose reply in their place
+        content = through_cassette("json_chat", request, lambda: call_api("chat", lambda timeout: client.with_options(timeout=timeout).chat.completions.create(**request),
+                                                                          estimated_tokens, PRIORITY_INTERACTIVE).choices[0].message.content)
+    except ServiceUnavailable:
+        raise
+    except Exception as oops:
+        # As in gpt3_completion, every failure to get a response is raised as ServiceUnavailable
+        raise ServiceUnavailable(f"The JSON request failed: {oops}") from oops
+    try:
+        result = json.loads(content)
+    except (TypeError, ValueError):
+        return {}
+    if not isinstance(result, dict):
+        return {}
+    return result
 #endregion
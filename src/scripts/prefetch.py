@@ -0,0 +1,170 @@
+'''
+Prefetch Module for Employ Ease
+
+This module is responsible for speculatively answering the questions of a category while the user is still reading the menu.
+When speculative prefetching is turned on in config.ini, the questions the user has picked most often in past sessions are answered in the background.
+If the user then picks one of those questions, the answer is shown immediately instead of waiting on ChatGPT.
+
+Key Functionalities:
+- Ranking: Questions are ranked by how often they were selected, based on the transcripts in the logs folder.
+- Bounded Budget: At most 'prefetch_budget' answers are prepared per menu, and all prefetch requests are scheduled as background work.
+- Result Cache: Prepared answers are cached by prompt and are only used if the conversation has not changed since they were prepared.
+- Cancellation: Speculative work is cancelled when the user leaves the menu.
+
+Author: Courtney Palmer
+'''
+
+#region Imports
+import os
+import re
+import ast
+import threading
+from src.scripts.conversation import prepare_answer, get_conversation_generation, themed_print
+from src.scripts.scheduler import background_priority
+from src.scripts.file_handler import load_ini
+from src.scripts.workspace import workspace_path
+from src.scripts.profiler import profiled_executor
+#endregion
+
+#region Definitions
+def load_selection_history():
+    ''' Reads every prompt the user has sent from the session transcripts in the logs folder. The transcripts are only read once.
+
+    return: the list of prompts the user has sent
+    '''
+    global selection_history
+    with history_lock:
+        if selection_history is not None:
+            return selection_history
+        selection_history = []
+        logs_folder = workspace_path("logs")
+        if not os.path.exists(logs_folder):
+            return selection_history
+        for session_folder in os.listdir(logs_folder):
+            transcript = os.path.join(logs_folder, session_folder, "Transcript.txt")
+            if not os.path.exists(transcript):
+                continue
+            with open(transcript, 'r', encoding='utf-8') as f:
+                for line in f:
+                    # Messages are written to the transcript as the repr of their UTF-8 bytes, e.g. b'User: ...'
+                    if not line.startswith(("b'User: ", 'b"User: ')):
+                        continue
+                    try:
+                        selection_history.append(ast.literal_eval(line.strip()).decode('utf-8', 'ignore')[len("User: "):])
+                    except (ValueError, SyntaxError):
+                        continue
+        return selection_history
+
+def record_selection(prompt):
+    ''' Adds a prompt the user just selected to the selection history.
+
+    prompt: the prompt the user selected
+    '''
+    history = load_selection_history()
+    with history_lock:
+        history.append(prompt)
+
+def template_pattern(template):
+    ''' Returns a regular expression that matches any rendering of a prompt template, whatever the values of its placeholders were at the time.
+
+    template: the prompt with placeholders such as <job_name>
+    return: the compiled regular expression
+    '''
+    parts = re.split(r'<[a-z_]+>', template.replace('"', ''))
+    return re.compile('(?s)' + '.*?'.join(re.escape(part) for part in parts))
+
+def rank_questions(templates):
+    ''' Ranks the questions of a category by how often they were selected in past sessions. Ties keep the order of the category.
+
+    templates: a dictionary of {key: prompt template}
+    return: the list of keys, most frequently selected first
+    '''
+    history = load_selection_history()
+    counts = {}
+    for key, template in templates.items():
+        pattern = template_pattern(template)
+        counts[key] = sum(1 for prompt in history if pattern.fullmatch(prompt.replace('"', '')))
+    return sorted(templates.keys(), key=lambda key: -counts[key])
+
+def start_prefetch(templates, render, session_timestamp):
+    ''' Starts answering the most frequently selected questions of a category in the background, if speculative prefetching is turned on.
+    Answers that are already being prepared for the current conversation are not requested again.
+
+    templates: a dictionary of {key: prompt template}, used to rank the questions
+    render: a function that returns the prompt that is answered for a template, with its placeholders filled in
+    session_timestamp: the timestamp of the current session
+    '''
+    if not prefetch_enabled:
+        return
+    generation = get_conversation_generation(session_timestamp)
+    ranked_keys = rank_questions(templates)[:prefetch_budget]
+    with prefetch_lock:
+        # Answers prepared for an earlier state of the conversation are stale
+        for prompt in [prompt for prompt, entry in prefetch_entries.items() if entry['generation'] != generation]:
+            prefetch_entries.pop(prompt)['future'].cancel()
+        for key in ranked_keys:
+            prompt = render(templates[key])
+            if prompt in prefetch_entries:
+                continue
+            future = prefetch_executor.submit(prefetch_answer, prompt, session_timestamp, cancel_event)
+            prefetch_entries[prompt] = {'generation': generation, 'future': future}
+
+def prefetch_answer(prompt, session_timestamp, cancelled):
+    ''' Prepares the answer to a prompt as background work, unless prefetching was cancelled before it started.
+
+    prompt: the prompt to answer
+    session_timestamp: the timestamp of the current session
+    cancelled: the event that is set when the user leaves the menu
+    return: the prepared answer, or None if it was cancelled
+    '''
+    if cancelled.is_set():
+        return None
+    with background_priority():
+        return prepare_answer(prompt, session_timestamp)
+
+def take_prefetched_answer(prompt, session_timestamp):
+    ''' Returns the answer that was prepared for the given prompt, waiting for it if it is still being prepared.
+
+    prompt: the prompt the user selected
+    session_timestamp: the timestamp of the current session
+    return: the prepared answer, or None if there is no valid answer for the current conversation
+    '''
+    if not prefetch_enabled:
+        return None
+    record_selection(prompt)
+    with prefetch_lock:
+        entry = prefetch_entries.pop(prompt, None)
+    if entry is None or entry['future'].cancelled():
+        return None
+    try:
+        answer = entry['future'].result()
+    except Exception as e:
+        themed_print(f"Could not use the prefetched answer: {e}", "Warning")
+        return None
+    if answer is None or answer['generation'] != get_conversation_generation(session_timestamp):
+        return None
+    return answer
+
+def cancel_prefetch():
+    ''' Cancels all speculative work. Requests that were already sent are allowed to finish, but their answers are discarded. '''
+    global cancel_event
+    with prefetch_lock:
+        cancel_event.set()
+        cancel_event = threading.Event()
+        for entry in prefetch_entries.values():
+            entry['future'].cancel()
+        prefetch_entries.clear()
+#endregion
+
+#region Global Variables
+config_object = load_ini(os.getcwd(), "config.ini")
+prefetch_enabled = config_object.getint('Settings', 'speculative_prefetch', fallback=0) == 1
+prefetch_budget = config_object.getint('Settings', 'prefetch_budget', fallback=2)
+prefetch_executor = profiled_executor(max_workers=max(prefetch_budget, 1), thread_name_prefix="prefetch")
+prefetch_lock = threading.Lock()
+history_lock = threading.Lock()
+# Answers being prepared, keyed by prompt: {'generation': conversation generation, 'future': Future of prepare_answer}
+prefetch_entries = {}
+cancel_event = threading.Event()
+selection_history = None
+#endregion
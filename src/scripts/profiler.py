@@ -0,0 +1,221 @@
+'''
+Profiler Module for Employ Ease
+
+This module is responsible for the profile mode of Employ Ease, which is turned on by launching it with 'employ_ease --profile'.
+It records where the time and memory of every turn go, so that a slow turn can be investigated, or attached to a bug report.
+
+Key Functionalities:
+- Import Time: The time it takes to import each module of Employ Ease and its dependencies is measured with 'python -X importtime' in a separate process.
+- Per-Turn CPU Profiles: Everything that happens between two user inputs is profiled with cProfile, and saved as a pstats file and a text report.
+  Jobs that run on the thread pools of Employ Ease (profiled_executor), such as priming, compaction, deferred saves, and prefetching, are profiled too,
+  and are added to the report of the turn in which they finish. Other threads (e.g. building the prompt search index) are not profiled.
+- Per-Turn Allocations: The peak memory use and the lines that allocated the most memory during the turn are recorded with tracemalloc.
+
+All reports are saved to logs/Session_{session_timestamp}/profile.
+
+Author: Courtney Palmer
+'''
+
+#region Imports
+import os
+import re
+import sys
+import io
+import cProfile
+import pstats
+import subprocess
+import threading
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from time import time, perf_counter
+from src.scripts.workspace import workspace_path
+#endregion
+
+# The number of functions and allocation sites listed in each report
+REPORT_FUNCTIONS = 40
+REPORT_ALLOCATIONS = 20
+REPORT_IMPORTS = 50
+
+#region Class Definitions
+class profiled_executor(ThreadPoolExecutor):
+    ''' A ThreadPoolExecutor whose jobs are profiled while the profile mode is on. cProfile only follows the thread it was started on,
+    so every job is profiled on its own, on the thread it runs on. Outside of the profile mode, jobs run as they would on a ThreadPoolExecutor.
+    '''
+    def submit(self, fn, /, *args, **kwargs):
+        if active_profiler is None:
+            return super().submit(fn, *args, **kwargs)
+        return super().submit(profile_job, fn, *args, **kwargs)
+
+class session_profiler:
+    ''' Profiles the turns of one session. A turn is everything that happens between two user inputs. '''
+    def __init__(self, directory):
+        '''
+        directory: the folder the reports are saved to
+        '''
+        self.directory = directory
+        self.turn = 0
+        self.label = ""
+        self.profile = None
+        self.snapshot = None
+        self.started = None
+        self.job_profiles = []
+        self.job_lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def start_turn(self, label):
+        ''' Starts profiling a turn.
+
+        label: a short description of the turn, such as the user's input
+        '''
+        self.turn += 1
+        self.label = label
+        self.snapshot = take_allocation_snapshot()
+        tracemalloc.reset_peak()
+        self.started = perf_counter()
+        self.profile = cProfile.Profile()
+        self.profile.enable()
+
+    def finish_turn(self):
+        ''' Stops profiling the current turn, if there is one, and saves its reports. '''
+        if self.profile is None:
+            return
+        self.profile.disable()
+        elapsed = perf_counter() - self.started
+        current, peak = tracemalloc.get_traced_memory()
+        allocations = take_allocation_snapshot().compare_to(self.snapshot, 'lineno')
+
+        with self.job_lock:
+            job_profiles = self.job_profiles
+            self.job_profiles = []
+
+        filepath = os.path.join(self.directory, f"turn_{self.turn:03d}")
+        stream = io.StringIO()
+        stats = pstats.Stats(self.profile, stream=stream)
+        for job_profile in job_profiles:
+            stats.add(job_profile)
+        stats.dump_stats(f"{filepath}.prof")
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(REPORT_FUNCTIONS)
+        with open(f"{filepath}.txt", 'w', encoding='utf-8') as f:
+            f.write(f"Turn {self.turn}: {self.label}\n")
+            f.write(f"Wall time: {elapsed:.3f} s\n")
+            f.write(f"Traced memory: {current / 1024 / 1024:.1f} MiB at the end of the turn, {peak / 1024 / 1024:.1f} MiB at its peak\n\n")
+            f.write(f"Top {REPORT_ALLOCATIONS} allocation sites during the turn (all threads):\n")
+            for statistic in allocations[:REPORT_ALLOCATIONS]:
+                f.write(f"  {statistic}\n")
+            f.write(f"\nCPU profile of the main thread and of the {len(job_profiles)} thread pool jobs that finished during the turn, by cumulative time ")
+            f.write(f"(load {os.path.basename(filepath)}.prof with pstats or snakeviz for the full profile). Threads started outside of thread pools are not included:\n")
+            f.write(stream.getvalue())
+        self.profile = None
+        self.snapshot = None
+
+    def add_job_profile(self, profile):
+        ''' Adds the CPU profile of a thread pool job to the report of the current turn. '''
+        with self.job_lock:
+            self.job_profiles.append(profile)
+#endregion
+
+#region Definitions
+def profiling_requested():
+    ''' Returns True if Employ Ease was launched with 'employ_ease --profile'. '''
+    return "--profile" in sys.argv[1:]
+
+def take_allocation_snapshot():
+    ''' Returns a tracemalloc snapshot without the memory allocated by the profilers themselves. '''
+    return tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, cProfile.__file__)])
+
+def get_profile_directory(session_timestamp):
+    ''' Returns the path to the folder that the profile reports of a session are saved to.
+
+    session_timestamp: the time stamp of the session
+    '''
+    return workspace_path("logs", f"Session_{session_timestamp}", "profile")
+
+def start_profiling(session_timestamp):
+    ''' Turns on the profile mode for a session, and measures the import time of Employ Ease in the background.
+
+    session_timestamp: the time stamp of the session
+    return: the folder the reports are saved to
+    '''
+    global active_profiler
+    directory = get_profile_directory(session_timestamp)
+    active_profiler = session_profiler(directory)
+    # Launching, e.g. priming the documents listed in config.ini, is profiled as the first turn
+    active_profiler.start_turn("launch")
+    threading.Thread(target=profile_imports, args=(directory,), name="profile_imports", daemon=True).start()
+    return directory
+
+def stop_profiling():
+    ''' Saves the reports of the last turn, and turns off the profile mode. '''
+    global active_profiler
+    if active_profiler is not None:
+        active_profiler.finish_turn()
+        active_profiler = None
+
+def profile_job(function, *args, **kwargs):
+    ''' Runs a job of a profiled_executor with its own CPU profile, and adds the profile to the report of the turn in which the job finishes. '''
+    profiler = active_profiler
+    if profiler is None:
+        return function(*args, **kwargs)
+    profile = cProfile.Profile()
+    try:
+        profile.enable()
+    except ValueError:
+        # Another profiler is already active on this thread
+        return function(*args, **kwargs)
+    try:
+        return function(*args, **kwargs)
+    finally:
+        profile.disable()
+        profiler.add_job_profile(profile)
+
+def read_user_input(prompt):
+    ''' Reads the user's input. In the profile mode, this ends the current turn's profile, and starts the profile of the next turn once the user has answered.
+
+    prompt: the prompt to show the user
+    return: the user's input
+    '''
+    if active_profiler is None:
+        return input(prompt)
+    active_profiler.finish_turn()
+    user_input = input(prompt)
+    active_profiler.start_turn(user_input)
+    return user_input
+
+def profile_imports(directory):
+    ''' Measures the import time of every module that Employ Ease imports, in a separate Python process, and saves a report sorted by cumulative time.
+
+    directory: the folder the report is saved to
+    '''
+    started = time()
+    try:
+        result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import src.scripts.Main"],
+                                cwd=os.getcwd(), capture_output=True, text=True, timeout=300)
+    except (OSError, subprocess.TimeoutExpired) as e:
+        with open(os.path.join(directory, "import_time.txt"), 'w', encoding='utf-8') as f:
+            f.write(f"Could not measure the import time: {e}\n")
+        return
+
+    # Every line is "import time: <self us> | <cumulative us> | <module>", with nested modules indented
+    imports = []
+    for line in result.stderr.splitlines():
+        match = re.match(r'import time:\s+(\d+) \|\s+(\d+) \|\s*(\S+)', line)
+        if match:
+            imports.append((int(match.group(2)), int(match.group(1)), match.group(3)))
+    with open(os.path.join(directory, "import_time_raw.txt"), 'w', encoding='utf-8') as f:
+        f.write(result.stderr)
+    with open(os.path.join(directory, "import_time.txt"), 'w', encoding='utf-8') as f:
+        f.write(f"Import time of src.scripts.Main, measured in a separate process in {time() - started:.1f} s\n")
+        f.write(f"Total: {sum(own for _, own, _ in imports) / 1000:.1f} ms across {len(imports)} modules\n\n")
+        f.write(f"Top {REPORT_IMPORTS} modules by cumulative import time (including the modules they import):\n")
+        f.write(f"{'cumulative ms':>14} {'self ms':>10}  module\n")
+        for cumulative, own, module in sorted(imports, reverse=True)[:REPORT_IMPORTS]:
+            f.write(f"{cumulative / 1000:>14.1f} {own / 1000:>10.1f}  {module}\n")
+        if result.returncode != 0:
+            f.write(f"\nThe import failed with exit code {result.returncode}. See import_time_raw.txt for details.\n")
+#endregion
+
+#region Global Variables
+active_profiler = None
+#endregion
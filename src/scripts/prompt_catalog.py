@@ -0,0 +1,202 @@
+'''
+Prompt Catalog Module for Employ Ease
+
+This module is responsible for the catalog of prompts that the user can choose from in the Menu. The prompts come from src/internal/prompts.ini,
+and from any number of other prompt files (such as a shared prompt library) listed in the 'prompt_library' setting of config.ini.
+Every prompt file uses the format of prompts.ini: one section per category, and one prompt per key.
+
+Key Functionalities:
+- Compiled Cache: Each prompt file is parsed once, and its prompts are saved to src/internal/prompt_catalog_cache.json together with the file's
+  modification time and size. A file is only parsed again after it changes, so launching stays fast with thousands of prompts.
+- Multiple Files: The categories of every prompt file are merged. When a later file uses a key that a category already has for a different prompt,
+  the later prompt is added under the next free number of the category instead of replacing the earlier one, and a warning is kept in the catalog.
+- Fuzzy Search: Prompts are indexed by the trigrams (three-letter sequences) of their words, so that a search matches prompts even when
+  words are misspelled or only partly typed. A search scores every prompt at once with NumPy, which takes milliseconds for 10,000 prompts.
+
+Author: Courtney Palmer
+'''
+
+#region Imports
+import os
+import re
+import json
+import threading
+import configparser
+import numpy as np
+from src.scripts.file_handler import load_ini
+#endregion
+
+PROMPT_CATALOG_CACHE_PATH = os.path.join("src", "internal", "prompt_catalog_cache.json")
+# Prompts that share less than this fraction of the search's trigrams are not shown
+MIN_SEARCH_SCORE = 0.3
+
+#region Class Definitions
+class prompt_catalog:
+    ''' The prompts of every prompt file, by category, with a trigram index for fuzzy search. '''
+    def __init__(self, categories, warnings=None):
+        '''
+        categories: a dictionary of {category: {key: prompt}}, in the order the categories are shown in the Menu
+        warnings: the messages about prompts that were moved to another key while the prompt files were merged
+        '''
+        self.categories = categories
+        self.warnings = warnings if warnings is not None else []
+        self.entries = [(category, key, prompt) for category, prompts in categories.items() for key, prompt in prompts.items()]
+        self.postings = None
+        self.trigram_counts = None
+        self.index_lock = threading.Lock()
+
+    def build_search_index(self):
+        ''' Builds the trigram index of the prompts, if it was not built yet. Searching builds it on first use, or it can be built in the background ahead of time. '''
+        with self.index_lock:
+            if self.postings is not None:
+                return
+            postings = {}
+            trigram_counts = np.zeros(len(self.entries), dtype=np.int32)
+            for entry_id, (category, _, prompt) in enumerate(self.entries):
+                trigrams = get_trigrams(f"{category} {prompt}")
+                trigram_counts[entry_id] = len(trigrams)
+                for trigram in trigrams:
+                    postings.setdefault(trigram, []).append(entry_id)
+            self.postings = {trigram: np.array(entry_ids, dtype=np.int32) for trigram, entry_ids in postings.items()}
+            self.trigram_counts = trigram_counts
+
+    def search(self, query, count=10):
+        ''' Finds the prompts that best match a search, even if words are misspelled or incomplete.
+
+        query: the text to search for
+        count: the maximum number of prompts to return
+        return: a list of (category, key, prompt), best match first
+        '''
+        self.build_search_index()
+        query_trigrams = get_trigrams(query)
+        matches = [self.postings[trigram] for trigram in query_trigrams if trigram in self.postings]
+        if matches == []:
+            return []
+        # The number of trigrams of the search that each prompt shares, counted for every prompt at once
+        shared = np.bincount(np.concatenate(matches), minlength=len(self.entries)).astype(np.float64)
+        coverage = shared / len(query_trigrams)
+        # Among prompts that match the search equally well, the prompts with the fewest other words come first
+        similarity = shared / (len(query_trigrams) + self.trigram_counts - shared)
+        scores = np.where(coverage >= MIN_SEARCH_SCORE, coverage + 0.01 * similarity, 0)
+        candidates = np.flatnonzero(scores)
+        if len(candidates) > count:
+            candidates = candidates[np.argpartition(-scores[candidates], count - 1)[:count]]
+        ranked = candidates[np.argsort(-scores[candidates], kind='stable')]
+        return [self.entries[entry_id] for entry_id in ranked]
+#endregion
+
+#region Definitions
+def get_trigrams(text):
+    ''' Returns the set of trigrams of the words of a text. Each word is padded with spaces, so that the start and end of a word form trigrams of their own.
+
+    text: the text to split into trigrams
+    return: the set of trigrams
+    '''
+    trigrams = set()
+    for word in re.findall(r'[a-z0-9]+', text.lower()):
+        padded = f"  {word} "
+        trigrams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return trigrams
+
+def get_prompt_filepaths():
+    ''' Returns the paths of every prompt file: src/internal/prompts.ini, followed by the files and folders of .ini files listed in the 'prompt_library' setting of config.ini.
+
+    return: the list of paths
+    '''
+    # load_ini creates prompts.ini with the default prompts if it does not exist
+    load_ini(os.path.join(os.getcwd(), "src", "internal"), "prompts.ini")
+    filepaths = [os.path.join(os.getcwd(), "src", "internal", "prompts.ini")]
+    library = load_ini(os.getcwd(), "config.ini").get('Settings', 'prompt_library', fallback='')
+    for path in [path.strip() for path in library.split(';') if path.strip() != ""]:
+        if os.path.isdir(path):
+            for folder, _, files in sorted(os.walk(path)):
+                filepaths.extend(os.path.join(folder, file) for file in sorted(files) if file.endswith('.ini'))
+        elif os.path.exists(path):
+            filepaths.append(path)
+    return filepaths
+
+def parse_prompt_file(filepath):
+    ''' Reads the categories and prompts of a prompt file.
+
+    filepath: the path to the prompt file
+    return: a dictionary of {category: {key: prompt}}
+    '''
+    parser = configparser.ConfigParser(interpolation=None)
+    parser.read(filepath, encoding='utf-8')
+    return {section: dict(parser.items(section)) for section in parser.sections()}
+
+def next_free_key(prompts):
+    ''' Returns the smallest number, above every numbered key of a category, that is not used as a key yet. '''
+    numbers = [int(key) for key in prompts if key.isdigit()]
+    return str(max(numbers, default=0) + 1)
+
+def merge_prompts(categories, file_categories, filepath, warnings):
+    ''' Adds the categories and prompts of a prompt file to the merged categories. A prompt whose key is already used in its category
+    for a different prompt is added under the next free number, so that no prompt is lost.
+
+    categories: the merged dictionary of {category: {key: prompt}}, which is updated
+    file_categories: the dictionary of {category: {key: prompt}} of the prompt file
+    filepath: the path to the prompt file, used in the warnings
+    warnings: the list that a warning is appended to for every prompt that was moved to another key
+    '''
+    for category, prompts in file_categories.items():
+        merged = categories.setdefault(category, {})
+        for key, prompt in prompts.items():
+            if key not in merged:
+                merged[key] = prompt
+            elif merged[key] != prompt:
+                new_key = next_free_key(merged)
+                merged[new_key] = prompt
+                warnings.append(f"Prompt '{key}' of [{category}] in {os.path.basename(filepath)} is already used by another prompt file, so it was added as '{new_key}'.")
+
+def load_prompt_catalog():
+    ''' Returns the catalog of every prompt file. Only prompt files that changed since they were last parsed are parsed again,
+    and the same catalog is returned for as long as no prompt file changes.
+
+    return: the prompt_catalog
+    '''
+    global cached_catalog
+    filepaths = get_prompt_filepaths()
+    stats = {filepath: os.stat(filepath) for filepath in filepaths}
+    version = tuple((filepath, stat.st_mtime, stat.st_size) for filepath, stat in stats.items())
+    with catalog_lock:
+        if cached_catalog is not None and cached_catalog[0] == version:
+            return cached_catalog[1]
+
+        cache_filepath = os.path.join(os.getcwd(), PROMPT_CATALOG_CACHE_PATH)
+        compiled = {}
+        if os.path.exists(cache_filepath):
+            try:
+                with open(cache_filepath, 'r', encoding='utf-8') as f:
+                    compiled = json.load(f)
+            except (OSError, ValueError):
+                compiled = {}
+        changed = False
+        categories = {}
+        warnings = []
+        for filepath, stat in stats.items():
+            entry = compiled.get(filepath)
+            if entry is None or entry['modified'] != stat.st_mtime or entry['size'] != stat.st_size:
+                entry = {'modified': stat.st_mtime, 'size': stat.st_size, 'categories': parse_prompt_file(filepath)}
+                compiled[filepath] = entry
+                changed = True
+            merge_prompts(categories, entry['categories'], filepath, warnings)
+        # Prompt files that are no longer used are dropped from the cache
+        for filepath in [filepath for filepath in compiled if filepath not in stats]:
+            del compiled[filepath]
+            changed = True
+        if changed:
+            with open(cache_filepath + ".tmp", 'w', encoding='utf-8') as f:
+                json.dump(compiled, f)
+            os.replace(cache_filepath + ".tmp", cache_filepath)
+
+        catalog = prompt_catalog(categories, warnings)
+        cached_catalog = (version, catalog)
+        return catalog
+#endregion
+
+#region Global Variables
+catalog_lock = threading.Lock()
+# The last catalog that was loaded, with the (path, modification time, size) of every prompt file it was loaded from
+cached_catalog = None
+#endregion
@@ -0,0 +1,275 @@
+'''
+Resilience Module for Employ Ease
+
+This module is responsible for making every request to the OpenAI API finish in a predictable amount of time, even when the API is slow or unhealthy.
+Chat, completion, and embedding requests are all sent through call_api, which adds the following on top of the rate limiting of the scheduler:
+
+Key Functionalities:
+- Deadlines: Every call has a deadline (set per type of request in config.ini). Each attempt's HTTP timeout is the time left until the deadline.
+- Retries: Timeouts, connection errors, and server errors are retried with exponential backoff and full jitter.
+- Hedged Requests: If a request takes longer than the 95th percentile of recent requests of its type, a duplicate request is sent,
+  and whichever response arrives first is used. This cuts off the slow tail without doubling the number of requests.
+- Circuit Breaker: After several consecutive failures, calls fail immediately for a while instead of waiting on an API that is down.
+- Turn Budgets: A conversation turn can be given a latency budget, and asks it whether there is time left for an optional request,
+  based on the recent latencies of that type of request.
+
+Author: Courtney Palmer
+'''
+
+#region Imports
+import os
+import random
+import threading
+from collections import deque
+from concurrent.futures import wait, FIRST_COMPLETED
+from time import time, sleep
+import numpy as np
+import openai
+import requests
+from src.scripts.file_handler import load_ini
+from src.scripts.scheduler import scheduler, effective_priority, RateLimitExceeded, QueueTimeout, PRIORITY_BACKGROUND
+from src.scripts.profiler import profiled_executor
+#endregion
+
+REQUEST_KINDS = ["chat", "completion", "embedding"]
+# The number of recent latencies kept per type of request, and the number needed before requests are hedged
+LATENCY_WINDOW = 200
+HEDGE_MIN_SAMPLES = 20
+# The latencies assumed for each type of request until some have been measured
+DEFAULT_LATENCIES = {"chat": 8.0, "completion": 4.0, "embedding": 1.0}
+
+#region Class Definitions
+class ServiceUnavailable(Exception):
+    ''' Raised when a call to the API could not be completed. '''
+
+class CircuitOpen(ServiceUnavailable):
+    ''' Raised without sending a request while the circuit breaker is open. '''
+
+class DeadlineExceeded(ServiceUnavailable):
+    ''' Raised when the deadline of a call passed before a response arrived. '''
+
+class UpstreamError(Exception):
+    ''' Raised when the API responds with a server error (HTTP 5xx) to a request that was not sent through the openai client. '''
+    def __init__(self, message, status_code):
+        super().__init__(message)
+        self.status_code = status_code
+
+class latency_tracker:
+    ''' Keeps the latencies of the most recent successful requests of one type. '''
+    def __init__(self):
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.lock = threading.Lock()
+
+    def record(self, seconds):
+        with self.lock:
+            self.latencies.append(seconds)
+
+    def percentile(self, percent, minimum_samples=HEDGE_MIN_SAMPLES):
+        ''' Returns the given percentile of the recent latencies, or None if there are fewer than 'minimum_samples' of them. '''
+        with self.lock:
+            if len(self.latencies) < max(minimum_samples, 1):
+                return None
+            return float(np.percentile(self.latencies, percent))
+
+class circuit_breaker:
+    ''' Stops sending requests of one type after 'failure_threshold' consecutive failures.
+    After 'reset_timeout' seconds, a single trial request is let through. If it succeeds, requests flow again.
+    '''
+    def __init__(self, name, failure_threshold, reset_timeout):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_progress = False
+        self.lock = threading.Lock()
+
+    def allow(self):
+        ''' Raises CircuitOpen if no request may be sent right now. '''
+        with self.lock:
+            if self.opened_at is None:
+                return
+            if time() - self.opened_at < self.reset_timeout or self.trial_in_progress:
+                raise CircuitOpen(f"The OpenAI API is unavailable ({self.failures} {self.name} requests failed in a row). Please try again shortly.")
+            self.trial_in_progress = True
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_in_progress = False
+
+    def record_skipped(self):
+        ''' Records that a request that was allowed was never sent, e.g. because its deadline passed while it waited for the rate limits. '''
+        with self.lock:
+            self.trial_in_progress = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            self.trial_in_progress = False
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time()
+
+class turn_budget:
+    ''' The latency budget of one conversation turn. Optional stages of the turn are skipped when the time left would not cover them,
+    and the stages that were skipped are kept in 'degradations'.
+    '''
+    def __init__(self, seconds):
+        '''
+        seconds: the number of seconds the turn may take, or 0 for no limit
+        '''
+        self.seconds = seconds
+        self.deadline = time() + seconds if seconds > 0 else None
+        self.degradations = []
+
+    def remaining(self):
+        ''' Returns the number of seconds left in the budget, or None if the turn has no limit. '''
+        if self.deadline is None:
+            return None
+        return self.deadline - time()
+
+    def allows(self, *kinds):
+        ''' Returns True if the time left covers the expected latency of one request of each of the given types, one after the other. '''
+        if self.deadline is None:
+            return True
+        return self.remaining() >= sum(expected_latency(kind) for kind in kinds)
+
+    def degrade(self, degradation):
+        ''' Records that an optional stage of the turn was skipped. '''
+        self.degradations.append(degradation)
+
+    def deadline_for(self, kind, *later_kinds):
+        ''' Returns the number of seconds a request of the given type may take within the turn:
+        the deadline set for its type in config.ini, or the time left in the budget if that is shorter.
+
+        kind: the type of the request
+        later_kinds: the types of the requests that must still fit in the budget after this one, whose expected latency is kept free
+        '''
+        if self.deadline is None:
+            return Deadlines[kind]
+        reserved = sum(expected_latency(later_kind) for later_kind in later_kinds)
+        return max(min(Deadlines[kind], self.remaining() - reserved), 0)
+#endregion
+
+#region Definitions
+def is_transient_error(exception):
+    ''' Returns True if the request may succeed when it is sent again, e.g. after a timeout, a dropped connection, or a server error. '''
+    return isinstance(exception, (requests.Timeout, requests.ConnectionError, UpstreamError,
+                                  openai.APITimeoutError, openai.APIConnectionError, openai.InternalServerError))
+
+def backoff_delay(attempt):
+    ''' Returns the time to wait before the given retry, using exponential backoff with full jitter. '''
+    return random.uniform(0, min(BackoffMax, BackoffBase * 2 ** attempt))
+
+def send_attempt(request, tokens, priority, deadline):
+    ''' Sends a request once through the scheduler, with a timeout of the time left until the deadline.
+
+    return: a tuple of (the response, the latency of the request in seconds)
+    '''
+    def timed_request():
+        remaining = deadline - time()
+        if remaining <= 0:
+            raise QueueTimeout("The deadline passed while the request was waiting for the rate limits.")
+        started = time()
+        response = request(remaining)
+        return response, time() - started
+    return scheduler.call(timed_request, tokens, priority, deadline)
+
+def send_hedged(kind, request, tokens, priority, deadline):
+    ''' Sends a request, and sends a duplicate of it if no response arrived within the hedge delay. The first successful response is used.
+
+    return: a tuple of (the response, the latency of the request in seconds)
+    '''
+    hedge_delay = latency_trackers[kind].percentile(HedgePercentile)
+    if not HedgingEnabled or hedge_delay is None:
+        return send_attempt(request, tokens, priority, deadline)
+
+    pending = {hedge_executor.submit(send_attempt, request, tokens, priority, deadline)}
+    done, pending = wait(pending, timeout=max(hedge_delay, HedgeMinDelay))
+    if not done and deadline - time() > 0:
+        pending.add(hedge_executor.submit(send_attempt, request, tokens, priority, deadline))
+    error = None
+    while True:
+        for future in done:
+            if future.exception() is None:
+                # The slower request cannot be interrupted, so its response is discarded when it arrives
+                return future.result()
+            error = future.exception()
+        if not pending:
+            raise error
+        done, pending = wait(pending, timeout=max(deadline - time(), 0), return_when=FIRST_COMPLETED)
+        if not done:
+            raise DeadlineExceeded("No response arrived before the deadline.")
+
+def expected_latency(kind):
+    ''' Returns the latency a request of the given type is expected to take: the 90th percentile of recent requests, or a default until there are any. '''
+    latency = latency_trackers[kind].percentile(90, minimum_samples=1)
+    return latency if latency is not None else DEFAULT_LATENCIES[kind]
+
+def call_api(kind, request, tokens, priority=PRIORITY_BACKGROUND, deadline=None):
+    ''' Sends a request to the API with a deadline, retries, hedging, and a circuit breaker.
+
+    kind: the type of request ("chat", "completion", or "embedding")
+    request: a function that takes the HTTP timeout in seconds, sends the request, and returns the response
+    tokens: the estimated number of tokens the request will use (prompt and response)
+    priority: the priority of the request for the scheduler
+    deadline: the number of seconds the call may take, including retries. Defaults to the deadline set for its type in config.ini.
+    return: the response
+    '''
+    breaker = circuit_breakers[kind]
+    deadline = time() + (Deadlines[kind] if deadline is None else deadline)
+    # Hedged requests run on other threads, so the priority of the current thread is resolved here
+    priority = effective_priority(priority)
+    attempt = 0
+    while True:
+        breaker.allow()
+        try:
+            response, latency = send_hedged(kind, request, tokens, priority, deadline)
+        except (RateLimitExceeded, openai.RateLimitError):
+            # Rate limits were already retried by the scheduler, and do not mean the API is unhealthy
+            breaker.record_success()
+            raise
+        except QueueTimeout as e:
+            # The request was never sent, so it says nothing about the health of the API
+            breaker.record_skipped()
+            raise DeadlineExceeded(str(e)) from e
+        except DeadlineExceeded:
+            breaker.record_failure()
+            raise
+        except Exception as e:
+            if not is_transient_error(e):
+                breaker.record_success()
+                raise
+            breaker.record_failure()
+            attempt += 1
+            delay = backoff_delay(attempt)
+            if attempt >= MaxAttempts or time() + delay >= deadline:
+                raise ServiceUnavailable(f"The {kind} request failed after {attempt} attempts: {e}") from e
+            sleep(delay)
+            continue
+        breaker.record_success()
+        latency_trackers[kind].record(latency)
+        return response
+#endregion
+
+#region Global Variables
+config_object = load_ini(os.getcwd(), "config.ini")
+Deadlines = {
+    "chat": config_object.getfloat('Resilience', 'chat_deadline', fallback=60.0),
+    "completion": config_object.getfloat('Resilience', 'completion_deadline', fallback=30.0),
+    "embedding": config_object.getfloat('Resilience', 'embedding_deadline', fallback=15.0)
+}
+MaxAttempts = config_object.getint('Resilience', 'max_attempts', fallback=3)
+BackoffBase = config_object.getfloat('Resilience', 'backoff_base', fallback=0.5)
+BackoffMax = config_object.getfloat('Resilience', 'backoff_max', fallback=8.0)
+HedgingEnabled = config_object.getint('Resilience', 'hedged_requests', fallback=1) == 1
+HedgePercentile = config_object.getfloat('Resilience', 'hedge_percentile', fallback=95.0)
+HedgeMinDelay = config_object.getfloat('Resilience', 'hedge_min_delay', fallback=0.5)
+TurnBudget = config_object.getfloat('Resilience', 'turn_budget', fallback=20.0)
+latency_trackers = {kind: latency_tracker() for kind in REQUEST_KINDS}
+circuit_breakers = {kind: circuit_breaker(kind,
+                                          config_object.getint('Resilience', 'failure_threshold', fallback=5),
+                                          config_object.getfloat('Resilience', 'reset_timeout', fallback=30.0)) for kind in REQUEST_KINDS}
+hedge_executor = profiled_executor(max_workers=config_object.getint('Server', 'max_api_connections', fallback=32), thread_name_prefix="hedge")
+#endregion
@@ -0,0 +1,180 @@
+'''
+Scheduler Module for Employ Ease
+
+This module is responsible for pacing every request that Employ Ease sends to the OpenAI API, so that batch usage stays within the account's rate limits instead of failing.
+
+Key Functionalities:
+- Rate Limiting: Token buckets limit the number of requests and the number of tokens sent per minute. Both limits are set in config.ini.
+- Prioritization: Interactive chat is always served before background work such as summarization, embedding, and priming.
+- Retry-After: When the API reports that a rate limit was exceeded, all requests are paused for as long as the API asks, and the request is retried.
+
+Author: Courtney Palmer
+'''
+
+#region Imports
+import os
+import heapq
+import itertools
+import threading
+from contextlib import contextmanager
+from time import time
+import openai
+from src.scripts.file_handler import load_ini
+#endregion
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 1
+DEFAULT_RETRY_AFTER = 1.0
+
+#region Class Definitions
+class RateLimitExceeded(Exception):
+    ''' Raised when the API responds with HTTP 429 to a request that was not sent through the openai client. '''
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class QueueTimeout(Exception):
+    ''' Raised when the deadline of a request passes while it is waiting for the rate limits, before it was sent. '''
+
+class token_bucket:
+    ''' A token bucket that refills continuously up to a capacity of 'capacity_per_minute' every minute. '''
+    def __init__(self, capacity_per_minute):
+        self.capacity = float(capacity_per_minute)
+        self.available = self.capacity
+        self.refill_rate = self.capacity / 60.0
+        self.last_refill = time()
+
+    def refill(self, now):
+        self.available = min(self.capacity, self.available + (now - self.last_refill) * self.refill_rate)
+        self.last_refill = now
+
+    def time_until_available(self, amount, now):
+        ''' Returns the number of seconds until the given amount can be taken from the bucket. '''
+        self.refill(now)
+        amount = min(amount, self.capacity)
+        if self.available >= amount:
+            return 0.0
+        return (amount - self.available) / self.refill_rate
+
+    def consume(self, amount):
+        self.available -= min(amount, self.capacity)
+
+class api_scheduler:
+    ''' Hands out permission to send API requests in priority order while enforcing the request and token rate limits. '''
+    def __init__(self, requests_per_minute, tokens_per_minute, max_retries):
+        self.request_limit = token_bucket(requests_per_minute)
+        self.token_limit = token_bucket(tokens_per_minute)
+        self.max_retries = max_retries
+        self.paused_until = 0.0
+        self.condition = threading.Condition()
+        self.queue = []
+        self.counter = itertools.count()
+
+    def acquire(self, tokens, priority, deadline=None):
+        ''' Blocks until a request costing the given number of tokens may be sent. Requests are served by priority, then first come first served.
+
+        tokens: the estimated number of tokens the request will use (prompt and response)
+        priority: PRIORITY_INTERACTIVE or PRIORITY_BACKGROUND
+        deadline: the time (as a UNIX timestamp) after which the request is given up, or None to wait as long as it takes
+        '''
+        with self.condition:
+            ticket = (priority, next(self.counter))
+            heapq.heappush(self.queue, ticket)
+            try:
+                while True:
+                    now = time()
+                    if deadline is not None and now >= deadline:
+                        raise QueueTimeout("The deadline passed while the request was waiting for the rate limits.")
+                    if self.queue[0] != ticket:
+                        self.condition.wait(None if deadline is None else deadline - now)
+                        continue
+                    wait = max(self.paused_until - now,
+                               self.request_limit.time_until_available(1, now),
+                               self.token_limit.time_until_available(tokens, now))
+                    if wait <= 0:
+                        self.request_limit.consume(1)
+                        self.token_limit.consume(tokens)
+                        return
+                    # Wake up early if a higher priority request arrives or the limits change
+                    self.condition.wait(wait if deadline is None else min(wait, deadline - now))
+            finally:
+                self.queue.remove(ticket)
+                heapq.heapify(self.queue)
+                self.condition.notify_all()
+
+    def pause(self, seconds):
+        ''' Holds back every request for the given number of seconds, e.g. when the API responds with a Retry-After header. '''
+        with self.condition:
+            self.paused_until = max(self.paused_until, time() + seconds)
+            self.condition.notify_all()
+
+    def call(self, request, tokens, priority=PRIORITY_BACKGROUND, deadline=None):
+        ''' Sends a request once the rate limits allow it, and retries it if the API reports that a rate limit was exceeded.
+
+        request: a function without arguments that sends the request and returns the response
+        tokens: the estimated number of tokens the request will use (prompt and response)
+        priority: the priority of the request. Requests made within background_priority() are always treated as background work.
+        deadline: the time (as a UNIX timestamp) after which the request is given up with QueueTimeout if it was not sent yet
+        return: the return value of request
+        '''
+        priority = effective_priority(priority)
+        retry = 0
+        while True:
+            self.acquire(tokens, priority, deadline)
+            try:
+                return request()
+            except (RateLimitExceeded, openai.RateLimitError) as e:
+                retry += 1
+                if retry > self.max_retries:
+                    raise
+                self.pause(get_retry_after(e) or DEFAULT_RETRY_AFTER * 2 ** (retry - 1))
+#endregion
+
+#region Definitions
+def get_retry_after(exception):
+    ''' Returns the number of seconds the API asked us to wait before retrying, or None if it did not say.
+
+    exception: the rate limit exception raised while sending the request
+    return: the number of seconds to wait, or None
+    '''
+    if isinstance(exception, RateLimitExceeded):
+        return exception.retry_after
+    response = getattr(exception, 'response', None)
+    if response is None:
+        return None
+    return parse_retry_after(response.headers.get('retry-after'))
+
+def parse_retry_after(value):
+    ''' Parses the value of a Retry-After header given in seconds.
+
+    value: the header value, or None
+    return: the number of seconds, or None if the value is missing or not a number
+    '''
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+def effective_priority(priority):
+    ''' Returns the priority a request made by the current thread is scheduled with. Requests made within background_priority() are always background work. '''
+    return max(priority, getattr(thread_priority, 'priority', PRIORITY_INTERACTIVE))
+
+@contextmanager
+def background_priority():
+    ''' Treats every request made by the current thread within this context as background work. '''
+    previous = getattr(thread_priority, 'priority', PRIORITY_INTERACTIVE)
+    thread_priority.priority = PRIORITY_BACKGROUND
+    try:
+        yield
+    finally:
+        thread_priority.priority = previous
+#endregion
+
+#region Global Variables
+config_object = load_ini(os.getcwd(), "config.ini")
+thread_priority = threading.local()
+scheduler = api_scheduler(
+    requests_per_minute=config_object.getint('RateLimits', 'requests_per_minute', fallback=500),
+    tokens_per_minute=config_object.getint('RateLimits', 'tokens_per_minute', fallback=60000),
+    max_retries=config_object.getint('RateLimits', 'max_retries', fallback=5))
+#endregion
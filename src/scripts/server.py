@@ -0,0 +1,216 @@
+'''
+Server Module for Employ Ease
+
+This module runs Employ Ease as an asyncio HTTP server, so that one process can serve a whole team instead of a single console user.
+Every user gets an isolated workspace (their own Single Source of Truth, memories, document index, and transcripts) under the server's data directory,
+while the HTTP connections to the OpenAI API and the API rate limits are shared by everyone.
+
+Endpoints (all request and response bodies are JSON):
+- GET  /health                      Returns {"status": "ok"}
+- GET  /categories                  Returns the categories and prompts from prompts.ini
+- GET  /users/{user}/application    Returns the user's Single Source of Truth
+- POST /users/{user}/application    {"info_type": "resume" | "job" | "company", "text": "..."} Updates the user's application info
+- POST /users/{user}/prompt         {"prompt": "..."} Returns {"response": "..."}
+- POST /users/{user}/question       {"category": "Interview", "question": "1"} Answers a prompt from prompts.ini
+
+Usage:
+Set the [Server] section in config.ini, then run 'employ_ease_server'.
+
+Author: Courtney Palmer
+'''
+
+#region Imports
+import os
+import re
+import json
+import asyncio
+import functools
+from time import time
+from concurrent.futures import ThreadPoolExecutor
+from src.scripts.conversation import send_prompt, prime_information
+from src.scripts.single_source_of_truth import single_source_of_truth
+from src.scripts.file_handler import load_ini
+from src.scripts.workspace import use_workspace
+from src.scripts.http_protocol import handle_http_connection
+from src.scripts.resilience import ServiceUnavailable
+from src.scripts.prompt_catalog import load_prompt_catalog
+#endregion
+
+USER_ID_PATTERN = re.compile(r'^[A-Za-z0-9_\-]{1,64}$')
+
+#region Class Definitions
+class HTTPError(Exception):
+    ''' Raised by a request handler to respond with an HTTP error status. '''
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+class user_session:
+    ''' The state of one user: their workspace and the conversation session within it. '''
+    def __init__(self, user_id, root):
+        self.user_id = user_id
+        self.root = root
+        self.session_timestamp = time()
+        # A user's turns are handled one at a time, in the order they arrive
+        self.lock = asyncio.Lock()
+
+class employ_ease_server:
+    ''' Hosts the conversation engine for many concurrent users. '''
+    def __init__(self, data_directory, max_concurrent_turns, prompt_dict):
+        self.data_directory = data_directory
+        self.prompt_dict = prompt_dict
+        self.sessions = {}
+        self.turn_limit = asyncio.Semaphore(max_concurrent_turns)
+        # The conversation engine is synchronous, so turns run in worker threads
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrent_turns, thread_name_prefix="turn")
+
+    def get_session(self, user_id):
+        ''' Returns the session of the given user, creating it the first time the user is seen.
+
+        user_id: the user's identifier from the URL
+        return: the user_session
+        '''
+        if not USER_ID_PATTERN.match(user_id):
+            raise HTTPError(400, "User ids may only contain letters, digits, '_' and '-'.")
+        if user_id not in self.sessions:
+            self.sessions[user_id] = user_session(user_id, os.path.join(self.data_directory, "users", user_id))
+        return self.sessions[user_id]
+
+    async def run_in_workspace(self, session, function, *args, **kwargs):
+        ''' Runs a synchronous function in a worker thread, within the user's workspace.
+
+        session: the user_session to run the function for
+        function: the function to run
+        return: the return value of the function
+        '''
+        async with session.lock:
+            async with self.turn_limit:
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(self.executor, functools.partial(call_in_workspace, session.root, function, *args, **kwargs))
+
+    async def dispatch(self, method, path, body):
+        ''' Routes a request to its handler.
+
+        method: the HTTP method
+        path: the request path
+        body: the parsed JSON body, or an empty dictionary
+        return: the JSON payload of the response
+        '''
+        parts = [part for part in path.split('?')[0].split('/') if part != ""]
+        if parts == ["health"]:
+            return {"status": "ok"}
+        if parts == ["categories"]:
+            return self.prompt_dict
+        if len(parts) != 3 or parts[0] != "users":
+            raise HTTPError(404, f"No such endpoint: {path}")
+
+        session = self.get_session(parts[1])
+        match (method, parts[2]):
+            case ("GET", "application"):
+                return await self.run_in_workspace(session, read_application_info)
+            case ("POST", "application"):
+                info_type = require_field(body, "info_type")
+                if info_type not in ("resume", "job", "company"):
+                    raise HTTPError(400, "'info_type' must be 'resume', 'job', or 'company'.")
+                await self.run_in_workspace(session, prime_information, session.session_timestamp, info_type, verbose=False, text=require_field(body, "text"))
+                return await self.run_in_workspace(session, read_application_info)
+            case ("POST", "prompt"):
+                response = await self.run_in_workspace(session, send_prompt, require_field(body, "prompt"), session.session_timestamp, verbose=False)
+                return {"response": response}
+            case ("POST", "question"):
+                category = self.prompt_dict.get(require_field(body, "category"))
+                if category is None or require_field(body, "question") not in category:
+                    raise HTTPError(404, "No such category or question.")
+                response = await self.run_in_workspace(session, answer_question, category[body["question"]], session.session_timestamp)
+                return {"response": response}
+            case (_, "application" | "prompt" | "question"):
+                raise HTTPError(405, f"{method} is not allowed on {path}")
+        raise HTTPError(404, f"No such endpoint: {path}")
+
+    async def handle_request(self, method, path, body):
+        ''' Handles one request and converts errors into HTTP error responses.
+
+        return: a tuple of (HTTP status, JSON payload)
+        '''
+        try:
+            payload = json.loads(body) if body else {}
+            if not isinstance(payload, dict):
+                raise HTTPError(400, "The request body must be a JSON object.")
+            return 200, await self.dispatch(method, path, payload)
+        except json.JSONDecodeError:
+            return 400, {"error": "The request body must be a JSON object."}
+        except HTTPError as e:
+            return e.status, {"error": str(e)}
+        except ServiceUnavailable as e:
+            return 503, {"error": str(e)}
+        except Exception as e:
+            return 500, {"error": str(e)}
+#endregion
+
+#region Definitions
+def call_in_workspace(root, function, *args, **kwargs):
+    ''' Calls a function with all of its data stored in the given workspace. '''
+    with use_workspace(root):
+        return function(*args, **kwargs)
+
+def require_field(body, field):
+    ''' Returns a string field of the request body, or responds with 400 Bad Request if it is missing. '''
+    value = body.get(field)
+    if not isinstance(value, str) or value == "":
+        raise HTTPError(400, f"The request body must contain '{field}'.")
+    return value
+
+def read_application_info():
+    ''' Returns the Single Source of Truth of the current workspace. '''
+    ssot = single_source_of_truth()
+    return {
+        "job_name": ssot.job_name,
+        "job_description": ssot.job_description,
+        "company_name": ssot.company_name,
+        "company_description": ssot.company_description,
+        "company_website": ssot.company_website,
+        "resume": ssot.resume
+    }
+
+def answer_question(template, session_timestamp):
+    ''' Fills in the placeholders of a prompt from prompts.ini with the current workspace's SSOT, and sends it. '''
+    ssot = single_source_of_truth()
+    if ssot.missing_keyword_analysis(template):
+        raise HTTPError(409, "This question uses the keyword analysis. Post a job description and a resume first.")
+    return send_prompt(ssot.fill_placeholders(template), session_timestamp, verbose=False)
+
+async def start_server(host, port, data_directory, max_concurrent_turns, prompt_dict):
+    ''' Starts the Employ Ease server.
+
+    host: the interface to listen on
+    port: the port to listen on. Use 0 to pick any free port.
+    data_directory: the folder that holds every user's workspace
+    max_concurrent_turns: the maximum number of turns processed at the same time, across all users
+    prompt_dict: the categories and prompts from prompts.ini
+    return: the asyncio server
+    '''
+    app = employ_ease_server(data_directory, max_concurrent_turns, prompt_dict)
+    return await asyncio.start_server(lambda reader, writer: handle_http_connection(reader, writer, app.handle_request), host, port)
+
+async def run_server(host, port, data_directory, max_concurrent_turns, prompt_dict):
+    server = await start_server(host, port, data_directory, max_concurrent_turns, prompt_dict)
+    print(f"Employ Ease server listening on http://{host}:{port}")
+    async with server:
+        await server.serve_forever()
+
+def load_prompt_dict():
+    ''' Reads prompts.ini and the prompt library into a dictionary of {category: {key: prompt}}. '''
+    return load_prompt_catalog().categories
+
+def main():
+    ''' The entry point for running Employ Ease in server mode '''
+    config_object = load_ini(os.getcwd(), "config.ini")
+    host = config_object.get('Server', 'host', fallback='127.0.0.1')
+    port = config_object.getint('Server', 'port', fallback=8080)
+    data_directory = os.path.join(os.getcwd(), config_object.get('Server', 'data_directory', fallback='server_data'))
+    max_concurrent_turns = config_object.getint('Server', 'max_concurrent_turns', fallback=16)
+    asyncio.run(run_server(host, port, data_directory, max_concurrent_turns, load_prompt_dict()))
+
+if __name__ == "__main__":
+    main()
+#endregion
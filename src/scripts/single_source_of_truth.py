@@ -22,11 +22,59 @@ Author: Courtney Palmer
 
 #region Imports
 import os
+import re
+import threading
 import configparser
-from src.scripts.file_handler import load_ini
+from src.scripts.file_handler import load_ini, create_empty_ini_file
+from src.scripts.workspace import workspace_path
+from src.scripts.keyword_analysis import analyze_keywords, format_keyword_analysis
+from src.scripts.compression import compress_for_query
 #endregion
 
-SSOT_FILE_PATH = "src\\internal\\single_source_of_truth.ini"
+SSOT_FILE_PATH = os.path.join("src", "internal", "single_source_of_truth.ini")
+config_object = load_ini(os.getcwd(), "config.ini")
+compress_documents = config_object.getint('Settings', 'compress_documents', fallback=1) == 1
+document_token_budget = config_object.getint('Settings', 'document_token_budget', fallback=500)
+# The SSOT may be updated by background priming while the menu reads it
+ssot_lock = threading.RLock()
+# The last SSOT read from each SSOT file, with the file's modification time and size, so that the file is only read again after it changes
+ssot_cache = {}
+# The placeholders that are named, instead of filled in, when a prompt is shown in a menu
+PLACEHOLDER_DESCRIPTIONS = {
+    '<job_description>': "(job description)",
+    '<company_description>': "(company description)",
+    '<resume>': "(resume)",
+    '<keyword_analysis>': "(keyword analysis)"
+}
+# Takes the place of the keyword analysis in a prompt when there is nothing to analyze, so that the prompt does not end on an empty colon
+NO_KEYWORD_ANALYSIS = "(no keyword analysis, as a job description and a resume have not been loaded)"
+
+#region Definitions
+def get_ssot_filepath():
+    ''' Returns the path to single_source_of_truth.ini in the current workspace, creating an empty SSOT if the workspace does not have one yet.
+    
+    return: the path to the SSOT file
+    '''
+    filepath = workspace_path(SSOT_FILE_PATH)
+    if not os.path.exists(filepath):
+        create_empty_ini_file(os.path.dirname(filepath), os.path.basename(filepath))
+    return filepath
+
+def get_current_truth():
+    ''' Returns the SSOT of the current workspace. The SSOT file is only read again after it changes, so this can be called on every turn.
+    
+    return: the single_source_of_truth
+    '''
+    filepath = get_ssot_filepath()
+    with ssot_lock:
+        stat = os.stat(filepath)
+        version = (stat.st_mtime_ns, stat.st_size)
+        cached = ssot_cache.get(filepath)
+        if cached is None or cached[0] != version:
+            cached = (version, single_source_of_truth())
+            ssot_cache[filepath] = cached
+        return cached[1]
+#endregion
 
 #region Class Definition
 class single_source_of_truth:
@@ -38,7 +86,9 @@ class single_source_of_truth:
     resume = ""
 
     def __init__(self):
-        self.config_obj.read(os.getcwd() + f"\\{SSOT_FILE_PATH}", encoding='utf-8')
+        # Every instance has its own parser, so that the SSOT of one workspace never leaks into another
+        self.config_obj = configparser.ConfigParser()
+        self.config_obj.read(get_ssot_filepath(), encoding='utf-8')
         self.job_name = self.config_obj.get('application', 'job_name').strip()
         self.job_description = self.config_obj.get('application', 'job_description').strip()
         self.company_name = self.config_obj.get('application', 'company_name').strip()
@@ -47,7 +97,8 @@ class single_source_of_truth:
         self.company_website = self.config_obj.get('application', 'company_website').strip()
         
     def update_truth(self):
-        self.config_obj.read(os.getcwd() + f"\\{SSOT_FILE_PATH}", encoding='utf-8')
+        with ssot_lock:
+            self.config_obj.read(get_ssot_filepath(), encoding='utf-8')
         self.job_name = self.config_obj.get('application', 'job_name').strip()
         self.job_description = self.config_obj.get('application', 'job_description').strip()
         self.company_name = self.config_obj.get('application', 'company_name').strip()
@@ -67,6 +118,70 @@ class single_source_of_truth:
         return self.resume
     def company_website(self):
         return self.company_website
+
+    def fill_placeholders(self, prompt):
+        ''' Replaces the placeholders in a prompt, such as <job_name>, with their values from the SSOT.
+        
+        prompt: the prompt that may contain placeholders
+        return: the prompt with its placeholders replaced
+        '''
+        # Look for '<' '>' in the prompt. If they exist, replace them with their corresponding values.
+        if '<' in prompt and '>' in prompt:
+            prompt = prompt.replace('<job_name>', self.job_name)
+            prompt = prompt.replace('<company_name>', self.company_name)
+            prompt = prompt.replace('<company_website>', self.company_website)
+            # The long documents are compressed to the sentences that matter most for the rest of the prompt.
+            # A document is only compressed if the prompt has its placeholder.
+            query = re.sub(r'<[a-z_]+>', ' ', prompt)
+            for placeholder, document in (('<job_description>', self.job_description), ('<company_description>', self.company_description), ('<resume>', self.resume)):
+                if placeholder in prompt:
+                    prompt = prompt.replace(placeholder, self.compressed_document(document, query))
+            if '<keyword_analysis>' in prompt:
+                prompt = prompt.replace('<keyword_analysis>', self.keyword_analysis() or NO_KEYWORD_ANALYSIS)
+        return prompt
+
+    def missing_keyword_analysis(self, prompt):
+        ''' Returns True if a prompt uses the keyword analysis, but the job description or resume it is made from has not been loaded.
+        Such prompts are not worth sending to ChatGPT.
+        
+        prompt: the prompt that may contain placeholders
+        '''
+        return '<keyword_analysis>' in prompt and (self.job_description == "" or self.resume == "")
+
+    def describe_placeholders(self, prompt):
+        ''' Replaces the placeholders of a prompt for display in a menu. Short fields, such as <job_name>, are filled in,
+        while the documents and the keyword analysis are named instead of being shown in full.
+        
+        prompt: the prompt that may contain placeholders
+        return: the prompt as it is shown in a menu
+        '''
+        prompt = prompt.replace('<job_name>', self.job_name)
+        prompt = prompt.replace('<company_name>', self.company_name)
+        prompt = prompt.replace('<company_website>', self.company_website)
+        for placeholder, description in PLACEHOLDER_DESCRIPTIONS.items():
+            prompt = prompt.replace(placeholder, description)
+        return prompt
+
+    def compressed_document(self, document, query):
+        ''' Shortens a long document of the SSOT for a prompt, if 'compress_documents' is turned on in config.ini.
+        Compressed documents are cached by their text, so each version of the SSOT is only compressed once per question.
+        
+        document: the text of the document
+        query: the prompt the document is substituted into
+        return: the compressed document
+        '''
+        if not compress_documents or document == "":
+            return document
+        return compress_for_query(document, query, document_token_budget)
+
+    def keyword_analysis(self):
+        ''' Compares the keywords of the job description with the resume locally, without calling ChatGPT.
+        
+        return: a short paragraph of the matched and missing keywords, or an empty string if the job description or resume is missing
+        '''
+        if self.job_description == "" or self.resume == "":
+            return ""
+        return format_keyword_analysis(analyze_keywords(self.job_description, self.resume))
     
     @staticmethod
     def update_ssot_ini_info(**kwargs):
@@ -81,15 +196,16 @@ class single_source_of_truth:
                 updates[section] = {}
             updates[section][option] = value
             
-        ssot_parser = configparser.ConfigParser()
-        ssot_parser.read(os.path.join(os.getcwd(), SSOT_FILE_PATH), encoding='utf-8')
-
-        for section, options in updates.items():
-            for option, value in options.items():
-                ssot_parser.set(section, option, f"\"{value}\"")
-        try:
-            with open(os.path.join(os.getcwd(), SSOT_FILE_PATH), 'w', encoding= 'utf-8') as configfile:
-                ssot_parser.write(configfile)
-        except IOError as e:
-            print(f"Error writing to file: {e}")
+        with ssot_lock:
+            ssot_parser = configparser.ConfigParser()
+            ssot_parser.read(get_ssot_filepath(), encoding='utf-8')
+
+            for section, options in updates.items():
+                for option, value in options.items():
+                    ssot_parser.set(section, option, f"\"{value}\"")
+            try:
+                with open(get_ssot_filepath(), 'w', encoding= 'utf-8') as configfile:
+                    ssot_parser.write(configfile)
+            except IOError as e:
+                print(f"Error writing to file: {e}")
 #endregion
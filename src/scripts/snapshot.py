@@ -0,0 +1,173 @@
+'''
+Snapshot Module for Employ Ease
+
+This module saves the state of a session's memory as a snapshot, so that the session can be resumed on the next launch
+without reading and parsing every one of its memory files again.
+
+A snapshot is stored in a 'snapshot' folder inside the session's memory folder, and consists of:
+- vectors_<time>.npy: the embeddings of all memories as one matrix, which is memory-mapped when the snapshot is loaded.
+  Every snapshot writes a new matrix file, since a file that is memory-mapped cannot be replaced on Windows.
+- messages.txt: the text of all memories, one after the other
+- tokens.npy: the number of tokens of every memory
+- metadata.json: the fields of every memory (speaker, time, uuid, ...) by column, with the offset of its text in messages.txt and its row in the matrix,
+  along with the name of the matrix file and the rolling summary of the conversation
+
+The snapshot is read back by column, so that a session_memory can be built from it with a few NumPy operations instead of one dictionary per memory.
+
+Memory files that were saved after the snapshot are still read individually, and memories that were deleted since are left out,
+so a snapshot never has to be complete to be useful.
+
+Author: Courtney Palmer
+'''
+
+#region Imports
+import os
+import json
+from time import time
+import numpy as np
+#endregion
+
+SNAPSHOT_FOLDER = "snapshot"
+SNAPSHOT_VERSION = 2
+# The fields of a memory that are stored in a column of their own. Any other field is stored in 'extras'.
+SNAPSHOT_COLUMNS = ('speaker', 'time', 'uuid', 'duplicate_of', 'timestring', 'vector', 'message', 'score', 'tokens')
+
+#region Definitions
+def get_snapshot_filepaths(session_path):
+    ''' Returns the paths of the files of a session's snapshot.
+
+    session_path: the path to the session's memory folder
+    return: a dictionary of {'folder', 'messages', 'tokens', 'metadata'} paths. The name of the vector matrix file is stored in the metadata.
+    '''
+    folder = os.path.join(session_path, SNAPSHOT_FOLDER)
+    return {
+        'folder': folder,
+        'messages': os.path.join(folder, "messages.txt"),
+        'tokens': os.path.join(folder, "tokens.npy"),
+        'metadata': os.path.join(folder, "metadata.json")
+    }
+
+def write_snapshot(session_path, records, token_counts, importance, rolling_summary=""):
+    ''' Writes a snapshot of a session's memories. The metadata is written last, so a snapshot is only used once all of its files are complete.
+
+    session_path: the path to the session's memory folder
+    records: a list of (memory filename, memory) for every memory file of the session, as saved (duplicates are references)
+    token_counts: the number of tokens of every memory's message, in the same order as records
+    importance: the importance of every memory, in the same order as records
+    rolling_summary: notes that summarize the conversation so far
+    '''
+    filepaths = get_snapshot_filepaths(session_path)
+    os.makedirs(filepaths['folder'], exist_ok=True)
+
+    vectors = [data['vector'] for _, data in records if 'vector' in data]
+    dimensions = len(vectors[0]) if vectors else 0
+    columns = {'file': [], 'speaker': [], 'time': [], 'uuid': [], 'duplicate_of': [], 'row': [], 'offset': [], 'length': [],
+               'importance': [float(value) for value in importance], 'extras': {}}
+    messages = []
+    offset = 0
+    row = 0
+    for i, (file, data) in enumerate(records):
+        columns['file'].append(file)
+        columns['speaker'].append(data['speaker'])
+        columns['time'].append(data['time'])
+        columns['uuid'].append(data['uuid'])
+        columns['duplicate_of'].append(data.get('duplicate_of'))
+        columns['row'].append(row if 'vector' in data else -1)
+        row += 1 if 'vector' in data else 0
+        # Offsets are counted in characters, as messages.txt is decoded as a whole when it is read
+        columns['offset'].append(offset if 'message' in data else -1)
+        columns['length'].append(len(data['message']) if 'message' in data else 0)
+        if 'message' in data:
+            messages.append(data['message'])
+            offset += len(data['message'])
+        extra = {key: value for key, value in data.items() if key not in SNAPSHOT_COLUMNS}
+        if extra:
+            columns['extras'][str(i)] = extra
+
+    # Every file is written under a new name first, so that a snapshot that is being loaded is never half written
+    vectors_file = f"vectors_{int(time() * 1000)}.npy"
+    np.save(os.path.join(filepaths['folder'], vectors_file), np.array(vectors, dtype=np.float32).reshape(len(vectors), dimensions))
+    with open(filepaths['messages'] + ".tmp", 'wb') as f:
+        f.write(''.join(messages).encode('utf-8'))
+    os.replace(filepaths['messages'] + ".tmp", filepaths['messages'])
+    np.save(filepaths['tokens'] + ".tmp.npy", np.array(token_counts, dtype=np.int32))
+    os.replace(filepaths['tokens'] + ".tmp.npy", filepaths['tokens'])
+    metadata = {
+        'version': SNAPSHOT_VERSION,
+        'vectors_file': vectors_file,
+        'columns': columns,
+        'rolling_summary': rolling_summary,
+        'total_tokens': int(sum(token_counts))
+    }
+    with open(filepaths['metadata'] + ".tmp", 'w', encoding='utf-8') as f:
+        json.dump(metadata, f)
+    os.replace(filepaths['metadata'] + ".tmp", filepaths['metadata'])
+
+    # Older matrix files may still be memory-mapped by this process, in which case they are removed by a later snapshot
+    for file in os.listdir(filepaths['folder']):
+        if file.startswith("vectors_") and file != vectors_file:
+            try:
+                os.remove(os.path.join(filepaths['folder'], file))
+            except OSError:
+                pass
+
+def read_snapshot(session_path):
+    ''' Reads a session's snapshot by column. The vector matrix is memory-mapped, so only the vectors that are used are read from disk.
+
+    session_path: the path to the session's memory folder
+    return: a tuple of (the snapshot's columns, a dictionary with the snapshot's 'rolling_summary' and 'total_tokens'),
+            or (None, None) if the session has no valid snapshot. The columns are a dictionary of:
+            'files', 'speakers', 'uuids', 'duplicates_of', and 'messages': lists with an entry per memory (the message of a duplicate is None),
+            'times', 'rows', 'importance', and 'tokens': NumPy arrays with an entry per memory ('rows' is the row of the memory's vector, or -1),
+            'vectors': the memory-mapped matrix, 'extras': a dictionary of {index: other fields}, and 'index': a dictionary of {memory filename: index}
+    '''
+    filepaths = get_snapshot_filepaths(session_path)
+    if not os.path.exists(filepaths['metadata']):
+        return None, None
+    try:
+        with open(filepaths['metadata'], 'r', encoding='utf-8') as f:
+            metadata = json.load(f)
+        if metadata.get('version') != SNAPSHOT_VERSION:
+            return None, None
+        vectors = np.load(os.path.join(filepaths['folder'], metadata['vectors_file']), mmap_mode='r')
+        tokens = np.load(filepaths['tokens'])
+        with open(filepaths['messages'], 'rb') as f:
+            text = f.read().decode('utf-8')
+        stored = metadata['columns']
+        columns = {
+            'files': stored['file'],
+            'speakers': stored['speaker'],
+            'uuids': stored['uuid'],
+            'duplicates_of': stored['duplicate_of'],
+            'messages': [text[offset:offset + length] if offset >= 0 else None for offset, length in zip(stored['offset'], stored['length'])],
+            'times': np.array(stored['time'], dtype=np.float64),
+            'rows': np.array(stored['row'], dtype=np.int64),
+            'importance': np.array(stored['importance'], dtype=np.float32),
+            'tokens': tokens,
+            'vectors': vectors,
+            'extras': {int(i): extra for i, extra in stored['extras'].items()},
+            'index': {file: i for i, file in enumerate(stored['file'])}
+        }
+    except (OSError, ValueError, KeyError, UnicodeDecodeError):
+        return None, None
+    return columns, {'rolling_summary': metadata.get('rolling_summary', ""), 'total_tokens': metadata.get('total_tokens', 0)}
+
+def snapshot_record(columns, index):
+    ''' Returns one memory of a snapshot as a dictionary in the format of the memory files, with its 'tokens'.
+
+    columns: the columns returned by read_snapshot
+    index: the index of the memory in the columns
+    return: the memory
+    '''
+    data = {'speaker': columns['speakers'][index], 'time': float(columns['times'][index]), 'uuid': columns['uuids'][index]}
+    if columns['duplicates_of'][index] is not None:
+        data['duplicate_of'] = columns['duplicates_of'][index]
+    if columns['messages'][index] is not None:
+        data['message'] = columns['messages'][index]
+    if columns['rows'][index] >= 0:
+        data['vector'] = columns['vectors'][columns['rows'][index]]
+    data.update(columns['extras'].get(index, {}))
+    if index < len(columns['tokens']):
+        data['tokens'] = int(columns['tokens'][index])
+    return data
+#endregion
@@ -0,0 +1,54 @@
+'''
+Workspace Module for Employ Ease
+
+This module decides where a user's data is stored. A workspace is the root folder that holds a user's
+Single Source of Truth, memories, document index, and transcripts.
+
+In the console application the workspace is the current working directory, as it has always been.
+In server mode every user gets their own workspace, so that one process can serve many users without sharing any state.
+The workspace is tracked with a context variable, so it follows each request into the worker thread that handles it.
+
+Author: Courtney Palmer
+'''
+
+#region Imports
+import os
+from contextlib import contextmanager
+from contextvars import ContextVar
+#endregion
+
+#region Definitions
+def get_workspace_root():
+    ''' Returns the root folder of the current workspace. Defaults to the current working directory.
+
+    return: the path to the root folder
+    '''
+    root = current_workspace.get()
+    if root is None:
+        return os.getcwd()
+    return root
+
+def workspace_path(*parts):
+    ''' Returns a path within the current workspace.
+
+    parts: the parts of the path relative to the workspace root, e.g. ("logs", "Session_1")
+    return: the full path
+    '''
+    return os.path.join(get_workspace_root(), *parts)
+
+@contextmanager
+def use_workspace(root):
+    ''' Stores all data within this context (and the threads started from it with asyncio.to_thread) in the given workspace.
+
+    root: the root folder of the workspace
+    '''
+    token = current_workspace.set(root)
+    try:
+        yield
+    finally:
+        current_workspace.reset(token)
+#endregion
+
+#region Global Variables
+current_workspace = ContextVar("current_workspace", default=None)
+#endregion
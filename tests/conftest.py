@@ -0,0 +1,47 @@
+'''
+Shared setup of the Employ Ease tests.
+
+Every module of Employ Ease reads config.ini from the working directory when it is imported, so the tests run in a
+temporary workspace with a config.ini of their own. No request is sent to OpenAI: tests replace the functions that would send one.
+'''
+
+#region Imports
+import os
+import sys
+import tempfile
+import tiktoken
+#endregion
+
+REPOSITORY_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TEST_CONFIG = """[Communication]
+APIKey = sk-test
+
+[Settings]
+load_on_launch = 0
+
+[Memory]
+max_memories = 20
+eviction_batch = 5
+
+[Theme]
+"""
+
+#region Definitions
+class whitespace_encoding:
+    ''' Counts words as tokens, so that the tests do not download the tiktoken encodings. '''
+    def encode(self, text):
+        return text.split()
+
+    def decode(self, tokens):
+        return ' '.join(tokens)
+#endregion
+
+#region Global Variables
+sys.path.insert(0, REPOSITORY_ROOT)
+test_workspace = tempfile.mkdtemp(prefix="employ_ease_tests_")
+with open(os.path.join(test_workspace, "config.ini"), 'w', encoding='utf-8') as f:
+    f.write(TEST_CONFIG)
+os.chdir(test_workspace)
+tiktoken.get_encoding = lambda name: whitespace_encoding()
+tiktoken.encoding_for_model = lambda name: whitespace_encoding()
+#endregion
@@ -0,0 +1,75 @@
+'''
+Tests of conversation turns within a latency budget (user-041).
+'''
+
+#region Imports
+import pytest
+import requests
+from time import sleep
+from src.scripts import conversation
+from src.scripts.memory import load_convo
+from src.scripts.resilience import ServiceUnavailable
+from src.scripts.workspace import use_workspace
+#endregion
+
+SESSION_TIMESTAMP = "1700000000.0"
+
+#region Class Definitions
+class chat_response:
+    ''' A response of the chat endpoint with the given answer. '''
+    def __init__(self, answer):
+        self.answer = answer
+
+    def json(self):
+        return {'choices': [{'message': {'content': self.answer}}]}
+#endregion
+
+#region Definitions
+@pytest.fixture
+def session(tmp_path, monkeypatch):
+    ''' Runs a test in an empty workspace, with embeddings and summaries answered locally. '''
+    monkeypatch.setattr(conversation, "gpt3_embedding", lambda content: [1.0, 0.0, 0.0])
+    monkeypatch.setattr(conversation, "summarize_memories", lambda memories, deadline=None: "- notes")
+    with use_workspace(str(tmp_path)):
+        yield
+        conversation.wait_for_deferred_save(SESSION_TIMESTAMP)
+
+def saved_speakers():
+    return [record['speaker'] for record in load_convo(f"Session_{SESSION_TIMESTAMP}")]
+
+def test_slow_answer_is_not_cut_off_by_the_turn_budget(session, monkeypatch):
+    # The answer takes longer than the whole budget, but well within the chat deadline
+    def slow_chat(api_url, headers, data, timeout):
+        if timeout < 0.7:
+            sleep(timeout)
+            raise requests.Timeout(f"Read timed out (read timeout={timeout:.2f})")
+        sleep(0.7)
+        return chat_response("An answer")
+    monkeypatch.setattr(conversation, "post_chat_request", slow_chat)
+
+    answer = conversation.send_prompt("How should I prepare?", SESSION_TIMESTAMP, verbose=False, budget=0.5)
+
+    assert answer == "An answer"
+    conversation.wait_for_deferred_save(SESSION_TIMESTAMP)
+    assert saved_speakers() == ["User", "EmployEase"]
+    # Only optional stages are dropped to stay within the budget
+    assert "deferred_reply_embedding" in conversation.get_last_degradations(SESSION_TIMESTAMP)
+
+def test_failed_turn_does_not_save_the_prompt(session, monkeypatch):
+    def unavailable(message, deadline=None):
+        raise ServiceUnavailable("The chat request failed after 3 attempts")
+    monkeypatch.setattr(conversation, "send_message", unavailable)
+
+    with pytest.raises(ServiceUnavailable):
+        conversation.send_prompt("How should I prepare?", SESSION_TIMESTAMP, verbose=False, budget=0.5)
+    assert saved_speakers() == []
+
+def test_turn_without_a_budget_keeps_every_stage(session, monkeypatch):
+    monkeypatch.setattr(conversation, "post_chat_request", lambda api_url, headers, data, timeout: chat_response("An answer"))
+
+    conversation.send_prompt("First question", SESSION_TIMESTAMP, verbose=False, budget=0)
+    conversation.send_prompt("Second question", SESSION_TIMESTAMP, verbose=False, budget=0)
+
+    assert saved_speakers() == ["User", "EmployEase", "User", "EmployEase"]
+    assert conversation.get_last_degradations(SESSION_TIMESTAMP) == []
+#endregion
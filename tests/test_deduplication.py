@@ -0,0 +1,41 @@
+'''
+Tests of duplicate detection with MinHash and LSH (user-032).
+'''
+
+#region Imports
+import zlib
+import numpy as np
+from src.scripts import deduplication
+from src.scripts.deduplication import duplicate_index, minhash_signature, get_shingles
+#endregion
+
+#region Definitions
+def exact_signature(text):
+    ''' Computes the MinHash signature with Python integers, which never overflow. '''
+    hashes = [zlib.crc32(shingle.encode('utf-8')) % deduplication.MINHASH_PRIME for shingle in get_shingles(text)]
+    return [min((int(a) * x + int(b)) % deduplication.MINHASH_PRIME for x in hashes)
+            for a, b in zip(deduplication.MINHASH_COEFFICIENTS, deduplication.MINHASH_OFFSETS)]
+
+def test_signature_does_not_overflow():
+    text = "Tailor my resume to the job description for a senior data analyst at Initech"
+    assert minhash_signature(text).tolist() == exact_signature(text)
+
+def test_signature_estimates_the_jaccard_similarity():
+    words = [f"word{i}" for i in range(200)]
+    first = ' '.join(words[:150])
+    second = ' '.join(words[50:])
+    shingles_first, shingles_second = get_shingles(first), get_shingles(second)
+    jaccard = len(shingles_first & shingles_second) / len(shingles_first | shingles_second)
+    estimate = float(np.mean(minhash_signature(first) == minhash_signature(second)))
+    assert abs(estimate - jaccard) < 0.2
+
+def test_index_finds_exact_and_near_duplicates():
+    index = duplicate_index()
+    message = ' '.join(f"word{i}" for i in range(100))
+    index.add("original", "User", message, [1.0, 2.0, 3.0])
+    assert index.find("User", f"  {message.upper()} ") == "original"
+    assert index.find("User", message + " please") == "original"
+    assert index.find("EmployEase", message) is None
+    assert index.find("User", "Which skills should I highlight on my resume for this role") is None
+    assert index.get_vector("original").tolist() == [1.0, 2.0, 3.0]
+#endregion
@@ -0,0 +1,74 @@
+'''
+Tests of the extraction of the SSOT fields (user-029).
+'''
+
+#region Imports
+import pytest
+from src.scripts import extraction, memory
+from src.scripts.resilience import ServiceUnavailable
+#endregion
+
+#region Definitions
+@pytest.mark.parametrize("text", [
+    "Company-wide benefits include a 401k match.",
+    "Employer-paid health insurance.",
+    "Organization-level planning is part of the job."
+])
+def test_hyphenated_words_are_not_labels(text):
+    assert extraction.find_labelled_value(text, r'company(?:\s*name)?|employer|organization') == ""
+
+@pytest.mark.parametrize("text, value", [
+    ("Company: Initech", "Initech"),
+    ("Company Name - Initech", "Initech"),
+    ("Employer – Initech LLC", "Initech LLC")
+])
+def test_labels_are_separated_by_a_colon_or_a_spaced_hyphen(text, value):
+    assert extraction.find_labelled_value(text, r'company(?:\s*name)?|employer|organization') == value
+
+def test_role_based_line_is_not_a_job_name():
+    assert extraction.extract_job_name_locally("We use role-based access for everything.\nMore text.") == ""
+
+def test_job_title_label_wins_over_an_earlier_position_label():
+    text = "Position: Full-time, Remote\nLocation: Anywhere\nJob Title: Data Analyst\n"
+    assert extraction.extract_job_name_locally(text) == "Data Analyst"
+
+def test_position_label_is_used_without_a_job_title_label():
+    assert extraction.extract_job_name_locally("Position: Data Analyst\nLocation: Remote") == "Data Analyst"
+
+def test_website_must_match_the_host():
+    text = "Follow us at https://www.linkedin.com/company/initech or visit https://jobs.example.com/initech."
+    assert extraction.extract_company_website_locally(text, "Initech") == ""
+
+def test_job_board_hosts_are_rejected():
+    text = "Apply at https://initech.wd5.myworkdayjobs.com/careers"
+    assert extraction.extract_company_website_locally(text, "Initech") == ""
+
+def test_company_host_is_found_after_other_urls():
+    text = "See https://linkedin.com/company/initech and www.initech.com/about."
+    assert extraction.extract_company_website_locally(text, "Initech") == "www.initech.com/about"
+
+def test_fields_are_requested_together_in_one_call(monkeypatch):
+    prompts = []
+    def answer(prompt):
+        prompts.append(prompt)
+        return {"job_name": "Data Analyst", "company_name": "Initech", "company_website": "https://initech.com"}
+    monkeypatch.setattr(extraction, "gpt3_json_completion", answer)
+    fields = extraction.extract_application_fields({"job": "We are hiring.", "company": "We make software."})
+    assert len(prompts) == 1
+    assert fields == {"job_name": "Data Analyst", "company_name": "Initech", "company_website": "https://initech.com"}
+
+def test_an_outage_is_not_reported_as_missing_fields(monkeypatch):
+    def unavailable(prompt):
+        raise ServiceUnavailable("The chat request failed after 3 attempts")
+    monkeypatch.setattr(extraction, "gpt3_json_completion", unavailable)
+    with pytest.raises(ServiceUnavailable):
+        extraction.extract_application_fields({"job": "We are hiring."})
+    assert extraction.extract_application_fields({"job": "We are hiring."}, local_only=True) == {"job_name": ""}
+
+def test_json_completion_raises_when_the_api_is_unavailable(monkeypatch):
+    def unavailable(kind, request, tokens, priority=None, deadline=None):
+        raise ServiceUnavailable("The chat request failed after 3 attempts")
+    monkeypatch.setattr(memory, "call_api", unavailable)
+    with pytest.raises(ServiceUnavailable):
+        memory.gpt3_json_completion("Reply with a JSON object.")
+#endregion
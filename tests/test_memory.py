@@ -0,0 +1,69 @@
+'''
+Tests of memory compaction (user-033).
+'''
+
+#region Imports
+import os
+from time import time
+from uuid import uuid4
+from src.scripts import memory
+from src.scripts.logger import create_new_memory_file
+from src.scripts.workspace import use_workspace, workspace_path
+#endregion
+
+SESSION_TIMESTAMP = "1700000000.0"
+
+#region Definitions
+def save_memory(speaker, msg_time, message=None, duplicate_of=None):
+    ''' Saves a memory file in the format of conversation.save_message, and returns its uuid. '''
+    info = {'speaker': speaker, 'time': msg_time, 'uuid': str(uuid4()), 'timestring': memory.timestamp_to_datetime(msg_time)}
+    if duplicate_of is None:
+        info.update({'message': message, 'vector': [1.0, 0.0, 0.0]})
+    else:
+        info['duplicate_of'] = duplicate_of
+    create_new_memory_file(SESSION_TIMESTAMP, speaker, msg_time, info)
+    return info['uuid']
+
+def load_session():
+    folder = workspace_path("src", "internal", "memory", f"Session_{SESSION_TIMESTAMP}")
+    return [memory.read_file_content(os.path.join(folder, file)) for file in os.listdir(folder) if file.endswith('.json')]
+
+def test_compaction_counts_duplicates_toward_the_eviction_target(tmp_path, monkeypatch):
+    monkeypatch.setattr(memory, "MaxMemories", 20)
+    monkeypatch.setattr(memory, "EvictionBatch", 5)
+    monkeypatch.setattr(memory, "summarize_memories", lambda memories, deadline=None: "- notes")
+    monkeypatch.setattr(memory, "gpt3_embedding", lambda content: [0.0, 1.0, 0.0])
+    with use_workspace(str(tmp_path)):
+        # 31 turns, a turn an hour, in which every second reply repeats the reply before it
+        start = time() - 31 * 3600
+        last_prompt = None
+        reply = None
+        for turn in range(31):
+            last_prompt = save_memory("User", start + turn * 3600, f"Question number {turn} about the job")
+            if turn % 2 == 1:
+                save_memory("EmployEase", start + turn * 3600 + 1, duplicate_of=reply)
+            else:
+                reply = save_memory("EmployEase", start + turn * 3600 + 1, f"Answer number {turn} about the job")
+        assert memory.count_memories() == 62
+
+        changed = memory.compact_memories()
+
+        records = load_session()
+        remaining = [data for data in records if data['speaker'] != 'Summary']
+        assert changed == [f"Session_{SESSION_TIMESTAMP}"]
+        # An original and its duplicate are evicted together, so the count may end up one below the target
+        assert 14 <= len(remaining) <= memory.MaxMemories - memory.EvictionBatch
+        assert last_prompt in [data['uuid'] for data in remaining]
+        # No duplicate is left without its original
+        uuids = set(data['uuid'] for data in remaining)
+        assert all(data['duplicate_of'] in uuids for data in remaining if 'duplicate_of' in data)
+        assert len([data for data in records if data['speaker'] == 'Summary']) == 1
+
+def test_memories_below_the_limit_are_not_compacted(tmp_path, monkeypatch):
+    monkeypatch.setattr(memory, "MaxMemories", 20)
+    with use_workspace(str(tmp_path)):
+        for turn in range(10):
+            save_memory("User", 1700000000.0 + turn, f"Question number {turn}")
+        assert memory.compact_memories() == []
+        assert memory.count_memories() == 10
+#endregion
@@ -0,0 +1,41 @@
+'''
+Tests of the profile mode (user-043).
+'''
+
+#region Imports
+import os
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from src.scripts import profiler
+#endregion
+
+#region Definitions
+def background_job():
+    return sum(i * i for i in range(10000))
+
+def test_jobs_of_profiled_executors_are_in_the_turn_report(tmp_path, monkeypatch):
+    session = profiler.session_profiler(str(tmp_path))
+    monkeypatch.setattr(profiler, "active_profiler", session)
+    executor = profiler.profiled_executor(max_workers=1)
+    try:
+        session.start_turn("1")
+        assert executor.submit(background_job).result() == background_job()
+        session.finish_turn()
+    finally:
+        executor.shutdown()
+        tracemalloc.stop()
+    with open(os.path.join(str(tmp_path), "turn_001.txt"), 'r', encoding='utf-8') as f:
+        report = f.read()
+    assert "background_job" in report
+    assert "1 thread pool jobs" in report
+
+def test_profiling_leaves_other_executors_alone(tmp_path, monkeypatch):
+    monkeypatch.setattr(profiler, "active_profiler", profiler.session_profiler(str(tmp_path)))
+    try:
+        assert ThreadPoolExecutor.submit is not profiler.profiled_executor.submit
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            executor.submit(background_job).result()
+        assert profiler.active_profiler.job_profiles == []
+    finally:
+        tracemalloc.stop()
+#endregion
@@ -0,0 +1,40 @@
+'''
+Tests of deadlines in the scheduler and the turn budget (user-041).
+'''
+
+#region Imports
+import pytest
+from time import time
+from src.scripts import resilience
+from src.scripts.resilience import turn_budget, call_api, DeadlineExceeded
+from src.scripts.scheduler import api_scheduler, QueueTimeout, PRIORITY_INTERACTIVE
+#endregion
+
+#region Definitions
+def test_queued_request_is_given_up_at_its_deadline():
+    # One request per minute, which the first request uses up
+    limited = api_scheduler(requests_per_minute=1, tokens_per_minute=100000, max_retries=0)
+    limited.acquire(10, PRIORITY_INTERACTIVE)
+    started = time()
+    with pytest.raises(QueueTimeout):
+        limited.acquire(10, PRIORITY_INTERACTIVE, deadline=time() + 0.2)
+    assert time() - started < 1.0
+
+def test_call_api_raises_deadline_exceeded_without_tripping_the_breaker(monkeypatch):
+    limited = api_scheduler(requests_per_minute=1, tokens_per_minute=100000, max_retries=0)
+    limited.acquire(10, PRIORITY_INTERACTIVE)
+    monkeypatch.setattr(resilience, "scheduler", limited)
+    with pytest.raises(DeadlineExceeded):
+        call_api("completion", lambda timeout: "response", 10, PRIORITY_INTERACTIVE, deadline=0.2)
+    assert resilience.circuit_breakers["completion"].failures == 0
+
+def test_deadline_keeps_time_for_later_requests(monkeypatch):
+    monkeypatch.setattr(resilience, "expected_latency", lambda kind: {"chat": 3.0, "completion": 1.0}[kind])
+    budget = turn_budget(10)
+    assert budget.deadline_for("completion", "chat") == pytest.approx(7.0, abs=0.1)
+    assert budget.allows("completion", "chat")
+    assert not turn_budget(3.5).allows("completion", "chat")
+
+def test_unlimited_budget_uses_the_configured_deadline():
+    assert turn_budget(0).deadline_for("chat") == resilience.Deadlines["chat"]
+#endregion
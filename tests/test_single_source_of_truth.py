@@ -0,0 +1,36 @@
+'''
+Tests of filling prompt placeholders from the SSOT (user-035).
+'''
+
+#region Imports
+import pytest
+from src.scripts.single_source_of_truth import single_source_of_truth, NO_KEYWORD_ANALYSIS
+from src.scripts.server import answer_question, HTTPError
+from src.scripts.workspace import use_workspace
+#endregion
+
+KEYWORD_PROMPT = "Group the main keywords of the job description by theme, using this keyword analysis: <keyword_analysis>"
+
+#region Definitions
+def test_empty_keyword_analysis_is_named_in_the_prompt(tmp_path):
+    with use_workspace(str(tmp_path)):
+        ssot = single_source_of_truth()
+        assert ssot.missing_keyword_analysis(KEYWORD_PROMPT)
+        assert ssot.fill_placeholders(KEYWORD_PROMPT).endswith(f"keyword analysis: {NO_KEYWORD_ANALYSIS}")
+
+def test_keyword_analysis_is_filled_in_once_both_documents_are_loaded(tmp_path):
+    with use_workspace(str(tmp_path)):
+        single_source_of_truth.update_ssot_ini_info(application_job_description="We need Python, SQL, and Tableau experience.",
+                                                    candidate_resume="Analyst with Python and Excel experience.")
+        ssot = single_source_of_truth()
+        assert not ssot.missing_keyword_analysis(KEYWORD_PROMPT)
+        prompt = ssot.fill_placeholders(KEYWORD_PROMPT)
+        assert NO_KEYWORD_ANALYSIS not in prompt
+        assert "Keywords from the job description that are in the resume" in prompt
+
+def test_server_does_not_send_a_keyword_prompt_without_documents(tmp_path):
+    with use_workspace(str(tmp_path)):
+        with pytest.raises(HTTPError) as error:
+            answer_question(KEYWORD_PROMPT, "1700000000.0")
+    assert error.value.status == 409
+#endregion
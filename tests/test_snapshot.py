@@ -0,0 +1,77 @@
+'''
+Tests of resuming a session from its snapshot (user-036).
+'''
+
+#region Imports
+import os
+import numpy as np
+from uuid import uuid4
+from src.scripts import memory
+from src.scripts.logger import create_new_memory_file
+from src.scripts.workspace import use_workspace, workspace_path
+#endregion
+
+SESSION_TIMESTAMP = "1700000000.0"
+SESSION_FOLDER = f"Session_{SESSION_TIMESTAMP}"
+
+#region Definitions
+def save_memory(speaker, msg_time, message=None, duplicate_of=None, **extra):
+    ''' Saves a memory file in the format of conversation.save_message, and returns its uuid. '''
+    info = {'speaker': speaker, 'time': msg_time, 'uuid': str(uuid4()), 'timestring': memory.timestamp_to_datetime(msg_time)}
+    if duplicate_of is None:
+        info.update({'message': message, 'vector': [float(msg_time % 7), 1.0, float(len(message))]})
+    else:
+        info['duplicate_of'] = duplicate_of
+    info.update(extra)
+    create_new_memory_file(SESSION_TIMESTAMP, speaker, msg_time, info)
+    return info['uuid']
+
+def session_folder():
+    return workspace_path("src", "internal", "memory", SESSION_FOLDER)
+
+def load_from_files():
+    ''' Loads the session from its memory files alone, as it is loaded without a snapshot. '''
+    folder = session_folder()
+    return memory.session_memory([memory.read_file_content(os.path.join(folder, file)) for file in os.listdir(folder) if file.endswith('.json')])
+
+def describe(memories):
+    return [(record['speaker'], record['time'], record['uuid'], record['message'], record.get('duplicate_of'), record.get('summary_of'),
+             list(record['vector'])) for record in memories]
+
+def test_resumed_session_matches_its_memory_files(tmp_path):
+    with use_workspace(str(tmp_path)):
+        prompt = save_memory("User", 1700000001.0, "What should my résumé say about Python?")
+        answer = save_memory("EmployEase", 1700000002.0, "Lead with the projects you built in Python.")
+        save_memory("User", 1700000003.0, duplicate_of=prompt)
+        save_memory("EmployEase", 1700000004.0, duplicate_of=answer)
+        save_memory("Summary", 1700000005.0, "- The user is updating their résumé", summary_of=[prompt])
+        deleted = save_memory("User", 1700000006.0, "Is this memory deleted later?")
+        memory.save_session_snapshot(SESSION_FOLDER, "- notes")
+
+        # Memories saved after the snapshot, including a duplicate of a memory in the snapshot, and a memory deleted since
+        save_memory("User", 1700000007.0, duplicate_of=answer)
+        save_memory("EmployEase", 1700000008.0, "A new answer after the snapshot.")
+        for file in os.listdir(session_folder()):
+            if file.endswith('.json') and memory.read_file_content(os.path.join(session_folder(), file))['uuid'] == deleted:
+                os.remove(os.path.join(session_folder(), file))
+
+        resumed = memory.load_convo(SESSION_FOLDER)
+        expected = load_from_files()
+
+        assert len(resumed) == 7
+        assert describe(resumed) == describe(expected)
+        assert isinstance(resumed.vectors, np.ndarray) and not isinstance(resumed.vectors, np.memmap)
+        assert resumed.rows[2] == resumed.rows[0] and resumed.rows[3] == resumed.rows[5] == resumed.rows[1]
+        np.testing.assert_allclose(resumed.importance, expected.importance)
+        assert memory.load_session_snapshot(session_folder())[1]['rolling_summary'] == "- notes"
+
+def test_resumed_session_without_new_memories_reads_only_the_snapshot(tmp_path):
+    with use_workspace(str(tmp_path)):
+        prompt = save_memory("User", 1700000001.0, "Question")
+        save_memory("User", 1700000002.0, duplicate_of=prompt)
+        memory.save_session_snapshot(SESSION_FOLDER)
+
+        resumed = memory.load_convo(SESSION_FOLDER)
+
+        assert describe(resumed) == describe(load_from_files())
+#endregion